@@ -5,16 +5,14 @@
 يوفر endpoints للواجهة الأمامية لتشغيل سكربتات جلب البيانات
 """
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-import subprocess
 import threading
-import uuid
-import queue
 import time
 import os
+import hashlib
 from datetime import datetime, timedelta
 import yfinance as yf
 import pandas as pd
@@ -22,14 +20,33 @@ import math
 import numpy as np
 import jwt
 from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from job_registry import JobRegistry, FINISHED_STATUSES
+from job_scheduler import JobScheduler, PRIORITIES
+from refresh_scheduler import RefreshScheduler
+from scan_cache import ScanCache
+from event_hub import EventHub, HubFull, StreamBudget, format_sse
+from summary_poller import SnapshotPoller
+from chart_series import FIELDS as CHART_FIELDS, check_resolution, shape_series
+from scan_rules import (FIBO_GANN_DAYS, FIBO_MIN_BARS, LEVEL_TYPES, PEAK_SEARCH_BARS, WEEKLY_SCAN_DAYS,
+                        weekly_bars, weekly_scan_candles)
+from scan_kernels import candle_levels, first_peaks, level_values
+from indicators import DEFAULT_INDICATORS, load_indicators, symbol_indicators, update_indicators
+from screener import ScreenerError, compile_expression, evaluate_expression, expression_text
+from backtest import DEFAULT_HORIZONS, MAX_HORIZON, RULES as BACKTEST_RULES, run_backtest
+from market_snapshot import FIELDS as SNAPSHOT_FIELDS, SORT_KEYS as SNAPSHOT_SORT_KEYS, compute_snapshot, daily_frame_to_snapshot, empty_snapshot, symbol_names, query_snapshot, records_to_snapshot, snapshot_records
+from daily_snapshots import columns_to_frame, load_daily_snapshot
+from wire_format import columnar_response, compress_response, date_strings, payload_response, records_to_columns, requested_format
+from market_store import KEY_STRIDE, MarketStore, build_market_data, has_csv_data, load_market_from_csv
+import ingest_engine
 
 # تحميل المتغيرات البيئية
 load_dotenv()
 
 # Supabase client (optional - falls back to CSV if not configured)
 try:
-    from supabase_client import get_supabase_client, get_stock_data, get_all_symbols
+    from supabase_client import get_supabase_client, get_stock_data, get_all_symbols, get_market_data_since, get_stock_data_batch, get_market_snapshot
     USE_SUPABASE = bool(os.getenv('SUPABASE_KEY'))
     if USE_SUPABASE:
         print("✓ Supabase enabled - using database for faster performance")
@@ -68,16 +85,116 @@ else:
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 print(f"Base Directory: {BASE_DIR}")
 
-# تخزين حالة المهام
-jobs = {}
-job_outputs = {}
+# تخزين حالة المهام (محدود الحجم، مع حفظ اختياري على القرص)
+# JOBS_STATE_FILE فارغ يعطل الحفظ
+job_registry = JobRegistry(
+    max_jobs=int(os.getenv('JOBS_MAX_FINISHED', '50')),
+    max_age_seconds=int(os.getenv('JOBS_MAX_AGE_HOURS', '24')) * 3600,
+    max_output_lines=int(os.getenv('JOBS_MAX_OUTPUT_LINES', '500')),
+    persist_path=(os.path.join(BASE_DIR, os.getenv('JOBS_STATE_FILE', '.jobs_state.json'))
+                  if os.getenv('JOBS_STATE_FILE', '.jobs_state.json') else None)
+)
 
-# Cache للمؤشرات (تحديث كل 10 دقائق لتجنب rate limiting)
-market_cache = {
-    'data': None,
-    'timestamp': None,
-    'ttl': 600  # 10 دقائق
-}
+# عدد آخر أحداث الرموز المعروضة في حالة المهمة
+RECENT_SYMBOL_EVENTS = 20
+
+# توزيع أحداث المهام على متابعي /api/status/<job_id>/stream
+# كل بث SSE يشغل thread في gunicorn طوال مدته (حتى SSE_MAX_STREAM_SECONDS):
+# ميزانية واحدة لبث المهام وملخص السوق معاً، أقل بكثير من --threads (32 في Procfile)
+# حتى يبقى للطلبات العادية threads كافية
+stream_budget = StreamBudget(int(os.getenv('SSE_MAX_STREAMS', '12')))
+event_hub = EventHub(max_subscribers=int(os.getenv('SSE_MAX_SUBSCRIBERS', '4')), budget=stream_budget)
+SSE_KEEPALIVE_SECONDS = 15
+SSE_MAX_STREAM_SECONDS = 600  # المتصفح يعيد الاتصال تلقائياً بعدها
+SSE_RETRY_AFTER_SECONDS = 30  # عند رفض البث لاكتمال الميزانية (العميل يرجع للتحقق الدوري)
+
+# منفذ مشترك لمهام الجلب داخل عملية الخادم (بدلاً من تشغيل مفسر بايثون جديد لكل مهمة)
+ingest_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('INGEST_MAX_JOBS', '2')),
+    thread_name_prefix='ingest'
+)
+
+# عدد الأيام المحملة في الذاكرة عند التحميل من Supabase (عند عدم وجود ملفات CSV محلية)
+STORE_SUPABASE_DAYS = int(os.getenv('STORE_SUPABASE_DAYS', '400'))
+
+
+def load_market_data(market):
+    """تحميل بيانات السوق للذاكرة: ملفات CSV المحلية أولاً، ثم Supabase"""
+    if has_csv_data(market) or not USE_SUPABASE:
+        return load_market_from_csv(market)
+    
+    since = (datetime.now() - timedelta(days=STORE_SUPABASE_DAYS)).strftime('%Y-%m-%d')
+    df = pd.DataFrame(get_market_data_since(market, since))
+    if not df.empty:
+        df['date'] = pd.to_datetime(df['date'])
+    return build_market_data(market, df, 'supabase', time.time())
+
+
+# بيانات الأسواق في الذاكرة (تحمل عند أول طلب وتحدث بعد كل عملية جلب)
+market_store = MarketStore(load_market_data)
+
+# نتائج الفحوصات لكل سوق (صالحة حتى يتغير إصدار بيانات السوق)
+scan_cache = ScanCache()
+
+# مدة صلاحية ردود البيانات في المتصفح/CDN قبل إعادة التحقق بـ ETag (بالثواني)
+HTTP_CACHE_MAX_AGE = int(os.getenv('HTTP_CACHE_MAX_AGE', '300'))
+SYMBOLS_NAMES_FILE = os.path.join(BASE_DIR, 'symbols_sa.txt')
+
+
+def make_etag(*parts):
+    """ETag من الأجزاء التي تحدد محتوى الرد (مع معاملات الطلب)"""
+    digest = hashlib.sha1()
+    for part in parts + (request.query_string,):
+        digest.update(part if isinstance(part, bytes) else str(part).encode('utf-8'))
+        digest.update(b'|')
+    return digest.hexdigest()[:24]
+
+
+def names_version():
+    """آخر تعديل لملف الأسماء العربية (يغير الأسماء في الردود)"""
+    try:
+        return os.path.getmtime(SYMBOLS_NAMES_FILE)
+    except OSError:
+        return 0
+
+
+def symbol_version(data, symbol):
+    """
+    إصدار بيانات رمز واحد: عدد الصفوف وآخر تاريخ وبصمة الأسعار والأحجام
+    (لا يتغير إذا لم يتغير الرمز حتى لو حُدّث باقي السوق)
+    """
+    bounds = data.bounds(symbol)
+    if bounds is None:
+        return ('missing', data.version)
+    start, end = bounds
+    if start == end:
+        return ('empty', data.version)
+    digest = hashlib.sha1(data.close[start:end].tobytes())
+    digest.update(data.volume[start:end].tobytes())
+    return (end - start, str(data.date[end - 1]), digest.hexdigest()[:16])
+
+
+def conditional_response(etag, build):
+    """
+    رد شرطي: 304 بدون بناء الرد إذا أرسل العميل نفس ETag في If-None-Match
+    
+    Args:
+        etag: ETag الرد الحالي
+        build: دالة بدون وسائط تبني الرد (تستدعى فقط عند الحاجة)
+    """
+    # ETag ضعيف: نفس البيانات قد ترسل مضغوطة أو غير مضغوطة
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.make_response(build())
+        if response.status_code != 200:
+            return response
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = f'public, max-age={HTTP_CACHE_MAX_AGE}'
+    return response
+
+# ضغط ردود JSON الكبيرة حسب Accept-Encoding (gzip، أو brotli إذا كان مثبتاً)
+app.after_request(compress_response)
 
 # ========================================
 # دوال المصادقة والأمان
@@ -103,27 +220,55 @@ def verify_token(token):
     except jwt.InvalidTokenError:
         return None  # التوكن غير صالح
 
+def check_request_token(allow_query=False):
+    """
+    التحقق من توكن الطلب
+    
+    Args:
+        allow_query: قبول التوكن من ?token= (لـ EventSource الذي لا يدعم headers)
+    
+    Returns:
+        None إذا كان التوكن صالحاً، أو رد الخطأ
+    """
+    token = None
+    
+    # البحث عن التوكن في الـ headers
+    if 'Authorization' in request.headers:
+        auth_header = request.headers['Authorization']
+        try:
+            token = auth_header.split(' ')[1]  # Bearer <token>
+        except IndexError:
+            return jsonify({'error': 'Token format invalid'}), 401
+    elif allow_query:
+        token = request.args.get('token')
+    
+    if not token:
+        return jsonify({'error': 'Token is missing'}), 401
+    
+    payload = verify_token(token)
+    if not payload:
+        return jsonify({'error': 'Token is invalid or expired'}), 401
+    
+    return None
+
 def token_required(f):
     """Decorator للتحقق من التوكن"""
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = None
-        
-        # البحث عن التوكن في الـ headers
-        if 'Authorization' in request.headers:
-            auth_header = request.headers['Authorization']
-            try:
-                token = auth_header.split(' ')[1]  # Bearer <token>
-            except IndexError:
-                return jsonify({'error': 'Token format invalid'}), 401
-        
-        if not token:
-            return jsonify({'error': 'Token is missing'}), 401
-        
-        payload = verify_token(token)
-        if not payload:
-            return jsonify({'error': 'Token is invalid or expired'}), 401
-        
+        error = check_request_token()
+        if error:
+            return error
+        return f(*args, **kwargs)
+    
+    return decorated
+
+def stream_token_required(f):
+    """Decorator للتحقق من التوكن في مسارات SSE (header أو ?token=)"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        error = check_request_token(allow_query=True)
+        if error:
+            return error
         return f(*args, **kwargs)
     
     return decorated
@@ -176,287 +321,369 @@ def verify():
 
 
 class JobRunner:
-    """فئة لتشغيل المهام في الخلفية"""
+    """تشغيل مهمة جلب داخل عملية الخادم على المنفذ المشترك"""
     
-    def __init__(self, job_id, command):
+    def __init__(self, job_id, market, symbols=None, workers=2, mode='fetch'):
         self.job_id = job_id
-        self.command = command
-        self.output_queue = queue.Queue()
-        self.process = None
+        self.market = market
+        self.symbols = symbols
+        self.workers = workers
+        self.mode = mode
         self.status = 'pending'
-        self.progress = 0
-        self.total = 0
-        self.stats = {}
         
     def run(self):
         """تشغيل المهمة"""
         try:
             self.status = 'running'
-            jobs[self.job_id] = {
-                'status': self.status,
-                'progress': 0,
-                'total': 0,
-                'started_at': datetime.now().isoformat(),
-                'stats': {}
-            }
-            
-            # إعداد بيئة التشغيل لضمان دعم UTF-8
-            env = os.environ.copy()
-            env['PYTHONIOENCODING'] = 'utf-8'
-
-            # تشغيل السكربت
-            self.process = subprocess.Popen(
-                self.command,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                encoding='utf-8',
-                bufsize=1,
-                universal_newlines=True,
-                env=env
+            self.update(
+                status=self.status,
+                totals={'rows': 0, 'bytes': 0, 'write_ms': 0.0},
+                recent_symbols=[]
             )
             
-            # قراءة المخرجات
-            for line in iter(self.process.stdout.readline, ''):
-                if line:
-                    self.parse_output(line)
-                    job_outputs.setdefault(self.job_id, []).append(line.strip())
-                    
-                    # تحديث حالة المهمة
-                    jobs[self.job_id].update({
-                        'status': self.status,
-                        'progress': self.progress,
-                        'total': self.total,
-                        'stats': self.stats
-                    })
+            # السجلات النصية تذهب لسجل المهمة الدائري وملف السجل ومتابعي البث
+            log = ingest_engine.setup_logging(
+                ingest_engine.log_file_path(self.market, self.mode),
+                sink=self.log_line
+            )
             
-            self.process.wait()
+            stats = ingest_engine.run_ingest(
+                self.market,
+                mode=self.mode,
+                symbols=self.symbols,
+                workers=self.workers,
+                log=log,
+                reporter=self
+            )
             
-            # تحديد الحالة النهائية
-            if self.process.returncode == 0:
-                self.status = 'completed'
-            else:
-                self.status = 'failed'
+            # تحديث بيانات السوق في الذاكرة فوراً
+            data = market_store.refresh(self.market)
             
-            jobs[self.job_id].update({
-                'status': self.status,
-                'completed_at': datetime.now().isoformat(),
-                'return_code': self.process.returncode
-            })
+            self.status = 'completed'
+            self.update(
+                status=self.status,
+                stats=stats,
+                data_version=data.version,
+                completed_at=datetime.now().isoformat()
+            )
             
         except Exception as e:
             self.status = 'error'
-            jobs[self.job_id].update({
-                'status': self.status,
-                'error': str(e),
-                'completed_at': datetime.now().isoformat()
-            })
+            self.update(
+                status=self.status,
+                error=str(e),
+                completed_at=datetime.now().isoformat()
+            )
     
-    def parse_output(self, line):
-        """تحليل مخرجات السكربت لاستخراج التقدم"""
-        # البحث عن سطر التقدم
-        if 'التقدم:' in line:
-            try:
-                # التقدم: 5/243 (2.1%)
-                parts = line.split('التقدم:')[1].split('(')[0].strip()
-                completed, total = parts.split('/')
-                self.progress = int(completed.strip())
-                self.total = int(total.strip())
-            except:
-                pass
+    @property
+    def topic(self):
+        return f'job:{self.job_id}'
+    
+    def update(self, **fields):
+        """تحديث حالة المهمة ونشر التغيير لمتابعي البث"""
+        job_registry.update(self.job_id, **fields)
+        event_hub.publish(self.topic, 'status', fields)
+    
+    def log_line(self, line):
+        job_registry.append_output(self.job_id, line)
+        event_hub.publish(self.topic, 'log', {'line': line})
+    
+    def emit(self, event, **fields):
+        """استقبال أحداث التقدم من محرك الجلب مباشرة (بدون تحليل نصوص)"""
+        delta = {}
+        job_registry.apply(self.job_id, lambda job: delta.update(self.apply_event(job, event, fields)))
+        if delta:
+            event_hub.publish(self.topic, 'progress', delta)
+    
+    def apply_event(self, job, kind, event):
+        """
+        تطبيق حدث تقدم منظم على حالة المهمة
         
-        # البحث عن إحصائيات
-        if 'جديد:' in line:
-            try:
-                # جديد: 5, محدث: 10, محدث مسبقاً: 2, فشل: 0
-                parts = line.split('-')[-1].strip()
-                items = parts.split(',')
-                for item in items:
-                    key, value = item.split(':')
-                    key = key.strip()
-                    value = int(value.strip())
-                    
-                    if 'جديد' in key:
-                        self.stats['new'] = value
-                    elif 'محدث' in key and 'مسبقاً' not in key:
-                        self.stats['updated'] = value
-                    elif 'محدث مسبقاً' in key:
-                        self.stats['up_to_date'] = value
-                    elif 'فشل' in key:
-                        self.stats['failed'] = value
-            except:
-                pass
+        Returns:
+            dict: الحقول التي تغيرت (تنشر كحدث progress)
+        """
+        if kind == 'start':
+            job['total'] = event.get('total', 0)
+            return {'total': job['total']}
+        elif kind == 'symbol':
+            job['progress'] = event.get('progress', job['progress'])
+            job['total'] = event.get('total', job['total'])
+            job['stats'] = event.get('stats', job['stats'])
+            job['current_symbol'] = event.get('symbol')
+            
+            totals = job['totals']
+            totals['rows'] += event.get('rows', 0)
+            totals['bytes'] += event.get('bytes', 0)
+            totals['write_ms'] = round(totals['write_ms'] + event.get('write_ms', 0), 1)
+            
+            detail = {key: event.get(key) for key in ('symbol', 'outcome', 'rows', 'bytes', 'fetch_ms', 'write_ms')}
+            job['recent_symbols'] = (job['recent_symbols'] + [detail])[-RECENT_SYMBOL_EVENTS:]
+            return {
+                'progress': job['progress'],
+                'total': job['total'],
+                'stats': job['stats'],
+                'current_symbol': job['current_symbol'],
+                'totals': dict(totals),
+                'symbol': detail
+            }
+        elif kind == 'done':
+            job['stats'] = event.get('stats', job['stats'])
+            job['elapsed_ms'] = event.get('elapsed_ms')
+            return {'stats': job['stats'], 'elapsed_ms': job['elapsed_ms']}
+        return {}
 
 
-@app.route('/api/fetch/saudi', methods=['POST'])
-@token_required
-def fetch_saudi():
-    """بدء جلب بيانات الأسهم السعودية"""
-    job_id = str(uuid.uuid4())
-    
+# طابور المهام: مهمة واحدة جارية لكل سوق، وإزالة الطلبات المكررة
+job_scheduler = JobScheduler(
+    job_registry,
+    ingest_executor,
+    lambda job_id, market, options: JobRunner(job_id, market, **options),
+    max_per_market=int(os.getenv('INGEST_MAX_JOBS_PER_MARKET', '1'))
+)
+
+
+def refresh_market(market):
+    """إعادة تحميل بيانات السوق في الذاكرة ثم حساب الفحوصات مسبقاً"""
+    market_store.refresh(market)
+    return precompute_scans(market)
+
+
+def after_fetch_job(job_id, market, options):
+    """بعد انتهاء مهمة جلب: حساب الفحوصات مسبقاً وتسجيل توقيتات التحديث المجدول"""
+    job = job_registry.get(job_id) or {}
+    fields = {'status': job.get('status'), 'ingest_ms': job.get('elapsed_ms'), 'stats': job.get('stats')}
+    if job.get('status') == 'completed':
+        started = time.perf_counter()
+        fields['scan_ms'] = precompute_scans(market)
+        fields['precompute_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    fields['completed_at'] = datetime.now().isoformat()
+    refresh_scheduler.record(job_id, market, **fields)
+
+
+job_scheduler.on_done(after_fetch_job)
+
+# التحديث التلقائي بعد إغلاق كل سوق (عامل gunicorn واحد فقط عبر قفل ملف)
+refresh_scheduler = RefreshScheduler(
+    ['saudi', 'us'],
+    lambda market: job_scheduler.submit(market, {'mode': 'fetch'}, priority='low')[0],
+    delay_minutes=int(os.getenv('REFRESH_DELAY_MINUTES', '30')),
+    lock_path=os.path.join(BASE_DIR, '.refresh_scheduler.lock'),
+    state_path=os.path.join(BASE_DIR, '.refresh_schedule.json'),
+    # initialize_data تجلب البيانات الأولى مباشرة - لا نكتب على نفس الملفات في نفس الوقت
+    is_busy=lambda: os.path.exists(os.path.join(BASE_DIR, '.data_fetch_in_progress'))
+)
+
+
+def start_refresh_scheduler():
+    """تشغيل التحديث المجدول إذا كان مفعلاً (REFRESH_SCHEDULER_ENABLED)"""
+    if os.getenv('REFRESH_SCHEDULER_ENABLED', 'True') == 'True':
+        refresh_scheduler.start()
+
+
+@app.route('/api/schedule', methods=['GET'])
+def get_schedule():
+    """مواعيد التحديث القادمة وآخر تشغيل وتوقيتات الفحوصات المحسوبة مسبقاً"""
+    return jsonify({
+        'enabled': os.getenv('REFRESH_SCHEDULER_ENABLED', 'True') == 'True',
+        **refresh_scheduler.status(),
+        'scans': scan_cache.info()
+    })
+
+
+# أقصى عدد threads لمهمة جلب واحدة (تتشارك مجمع الجلب مع باقي المهام)
+FETCH_MAX_WORKERS = 8
+
+FETCH_STATUS_MESSAGES = {
+    'queued': 'تمت إضافة المهمة إلى الطابور',
+    'attached': 'توجد مهمة مطابقة قيد التنفيذ أو الانتظار',
+}
+
+
+def start_fetch_job(market, message):
+    """إرسال طلب جلب إلى طابور المهام"""
     # الحصول على اختيارات من الطلب
-    data = request.get_json() or {}
+    data = request.get_json(silent=True) or {}
     test_mode = data.get('test', False)
     workers = data.get('workers', 2)  # تقليل العدد الافتراضي
+    if isinstance(workers, bool) or not isinstance(workers, int) or not 1 <= workers <= FETCH_MAX_WORKERS:
+        return jsonify({'error': f'workers must be an integer between 1 and {FETCH_MAX_WORKERS}'}), 400
+    priority = data.get('priority', 'high')  # الطلبات اليدوية تسبق التحديث المجدول
+    if priority not in PRIORITIES:
+        return jsonify({'error': f"priority must be one of: {', '.join(PRIORITIES)}"}), 400
     
-    # بناء الأمر
-    # استخدام sys.executable لضمان استخدام نفس مفسر بايثون
-    import sys
-    command = [sys.executable, '-u', 'fetch_saudi_data.py', '--workers', str(workers)]
-    
+    options = {'workers': workers}
     if test_mode:
-        command.extend(['--test', '--symbols', '1120.SR,2222.SR,7010.SR'])
-    
-    # إنشاء وتشغيل المهمة
-    # تهيئة المهمة في القاموس فوراً لتجنب Race Condition
-    jobs[job_id] = {
-        'status': 'starting',
-        'progress': 0,
-        'total': 0,
-        'started_at': datetime.now().isoformat(),
-        'stats': {}
-    }
+        options['symbols'] = ingest_engine.MARKETS[market]['test_symbols']
     
-    runner = JobRunner(job_id, command)
-    thread = threading.Thread(target=runner.run)
-    thread.daemon = True
-    thread.start()
+    # المهمة تسجل في job_registry قبل الرد لتجنب Race Condition
+    job_id, disposition = job_scheduler.submit(market, options, priority=priority)
     
     return jsonify({
         'job_id': job_id,
-        'status': 'started',
-        'message': 'بدأت عملية جلب البيانات السعودية'
+        'status': disposition,
+        'message': FETCH_STATUS_MESSAGES.get(disposition, message)
     })
 
 
+@app.route('/api/fetch/saudi', methods=['POST'])
+@token_required
+def fetch_saudi():
+    """بدء جلب بيانات الأسهم السعودية"""
+    return start_fetch_job('saudi', 'بدأت عملية جلب البيانات السعودية')
+
+
 @app.route('/api/fetch/us', methods=['POST'])
 @token_required
 def fetch_us():
     """بدء جلب بيانات الأسهم الأمريكية"""
-    job_id = str(uuid.uuid4())
-    
-    # الحصول على اختيارات من الطلب
-    data = request.get_json() or {}
-    test_mode = data.get('test', False)
-    workers = data.get('workers', 2)  # تقليل العدد الافتراضي
+    return start_fetch_job('us', 'بدأت عملية جلب البيانات الأمريكية')
+
+
+# رموز ملخص السوق
+MARKET_SUMMARY_TICKERS = {
+    'TASI': '^TASI.SR',
+    'DJI': '^DJI',
+    'NASDAQ': '^IXIC',
+    'SP500': '^GSPC',
+    'OIL': 'CL=F',
+    'GOLD': 'GC=F',
+    'SILVER': 'SI=F',
+    'BTC': 'BTC-USD'
+}
+
+
+def fetch_market_summary():
+    """جلب ملخص السوق للمؤشرات الرئيسية من yfinance (يستدعى من summary_poller فقط)"""
+    tickers = MARKET_SUMMARY_TICKERS
+    results = {}
     
-    # بناء الأمر
-    import sys
-    command = [sys.executable, '-u', 'fetch_us_data.py', '--workers', str(workers)]
+    print(f"Fetching market summary for: {list(tickers.keys())}")
+    # جلب البيانات دفعة واحدة لتحسين الأداء
+    data = yf.download(list(tickers.values()), period="5d", progress=False, auto_adjust=True)
     
-    if test_mode:
-        command.extend(['--test', '--symbols', 'AAPL,MSFT,GOOGL'])
-    
-    # إنشاء وتشغيل المهمة
-    # تهيئة المهمة في القاموس فوراً لتجنب Race Condition
-    jobs[job_id] = {
-        'status': 'starting',
-        'progress': 0,
-        'total': 0,
-        'started_at': datetime.now().isoformat(),
-        'stats': {}
-    }
+    # التحقق من أن البيانات ليست فارغة
+    if data.empty:
+        raise ValueError('No data returned from yfinance')
     
-    runner = JobRunner(job_id, command)
-    thread = threading.Thread(target=runner.run)
-    thread.daemon = True
-    thread.start()
+    for name, symbol in tickers.items():
+        try:
+            # استخراج البيانات للسهم المحدد
+            # ملاحظة: yfinance يعيد MultiIndex إذا كان هناك أكثر من رمز
+            if len(tickers) > 1:
+                try:
+                    stock_data = data['Close'][symbol]
+                except KeyError:
+                    print(f"Symbol {symbol} not found in data columns: {data.columns}")
+                    results[name] = {'error': 'Symbol not found'}
+                    continue
+            else:
+                stock_data = data['Close']
+            
+            # التأكد من وجود بيانات
+            valid_data = stock_data.dropna()
+            if len(valid_data) >= 2:
+                current_price = valid_data.iloc[-1]
+                prev_price = valid_data.iloc[-2]
+                
+                change = current_price - prev_price
+                change_percent = (change / prev_price) * 100
+                
+                results[name] = {
+                    'price': round(float(current_price), 2),
+                    'change': round(float(change), 2),
+                    'change_percent': round(float(change_percent), 2),
+                    'status': 'up' if change >= 0 else 'down'
+                }
+            else:
+                print(f"{name}: Insufficient data (len={len(valid_data)})")
+                results[name] = {'error': 'Insufficient data'}
+                
+        except Exception as e:
+            print(f"Error processing {name}: {e}")
+            results[name] = {'error': str(e)}
     
-    return jsonify({
-        'job_id': job_id,
-        'status': 'started',
-        'message': 'بدأت عملية جلب البيانات الأمريكية'
-    })
+    return results
+
+
+# جلب دوري واحد لملخص السوق يوزع على جميع المتابعين
+# (حد المتابعين ضمن stream_budget المشتركة مع بث المهام، والباقي يستخدم الطلب العادي)
+summary_hub = EventHub(max_subscribers=int(os.getenv('SUMMARY_STREAM_MAX_SUBSCRIBERS', '8')), max_queue=4,
+                       budget=stream_budget)
+summary_poller = SnapshotPoller(
+    fetch_market_summary,
+    summary_hub,
+    'market-summary',
+    interval=int(os.getenv('MARKET_SUMMARY_INTERVAL', '120')),
+    idle_after=int(os.getenv('MARKET_SUMMARY_IDLE_SECONDS', '600')),
+    stale_after=int(os.getenv('MARKET_SUMMARY_STALE_SECONDS', '900')),
+    persist_path=os.path.join(BASE_DIR, '.market_summary.json')
+)
 
 
 @app.route('/api/market-summary', methods=['GET'])
 def market_summary():
-    """جلب ملخص السوق للمؤشرات الرئيسية"""
-    # الرموز المطلوبة
-    tickers = {
-        'TASI': '^TASI.SR',
-        'DJI': '^DJI',
-        'NASDAQ': '^IXIC',
-        'SP500': '^GSPC',
-        'OIL': 'CL=F',
-        'GOLD': 'GC=F',
-        'SILVER': 'SI=F',
-        'BTC': 'BTC-USD'
-    }
-    
-    results = {}
+    """
+    ملخص السوق للمؤشرات الرئيسية (آخر لقطة من الذاكرة - لا ينتظر yfinance)
     
-    try:
-        print(f"Fetching market summary for: {list(tickers.keys())}")
-        # جلب البيانات دفعة واحدة لتحسين الأداء
-        data = yf.download(list(tickers.values()), period="5d", progress=False, auto_adjust=True)
-        
-        # التحقق من أن البيانات ليست فارغة
-        if data.empty:
-            print("Error: yfinance returned empty data")
-            return jsonify({'error': 'No data returned from yfinance'}), 500
+    _meta: وقت وعمر اللقطة، و stale إذا تجاوز عمرها MARKET_SUMMARY_STALE_SECONDS
+    """
+    snapshot, meta = summary_poller.latest()
+    if snapshot is None:
+        error = meta['last_error'] or 'Market summary is loading'
+        return jsonify({'error': error, '_meta': meta}), 503, {'Retry-After': '5'}
+    return jsonify({**snapshot, '_meta': meta}), 200, {'Age': str(int(meta['age_seconds']))}
 
-        print("Data fetched successfully")
-        
-        for name, symbol in tickers.items():
-            try:
-                # استخراج البيانات للسهم المحدد
-                # ملاحظة: yfinance يعيد MultiIndex إذا كان هناك أكثر من رمز
-                if len(tickers) > 1:
-                    try:
-                        stock_data = data['Close'][symbol]
-                    except KeyError:
-                        print(f"Symbol {symbol} not found in data columns: {data.columns}")
-                        results[name] = {'error': 'Symbol not found'}
-                        continue
-                else:
-                    stock_data = data['Close']
-                
-                # التأكد من وجود بيانات
-                valid_data = stock_data.dropna()
-                if len(valid_data) >= 2:
-                    current_price = valid_data.iloc[-1]
-                    prev_price = valid_data.iloc[-2]
-                    
-                    change = current_price - prev_price
-                    change_percent = (change / prev_price) * 100
-                    
-                    results[name] = {
-                        'price': round(float(current_price), 2),
-                        'change': round(float(change), 2),
-                        'change_percent': round(float(change_percent), 2),
-                        'status': 'up' if change >= 0 else 'down'
-                    }
-                    print(f"{name}: {current_price}")
-                else:
-                    print(f"{name}: Insufficient data (len={len(valid_data)})")
-                    results[name] = {'error': 'Insufficient data'}
-                    
-            except Exception as e:
-                print(f"Error processing {name}: {e}")
-                results[name] = {'error': str(e)}
-                
-        return jsonify(results)
-        
-    except Exception as e:
-        print(f"Global error in market summary: {e}")
-        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/market-summary/stream', methods=['GET'])
+def market_summary_stream():
+    """بث لقطات ملخص السوق (Server-Sent Events) عند كل تحديث"""
+    summary_poller.latest()  # يوقظ الجلب إذا كان متوقفاً
+    try:
+        subscription = summary_hub.subscribe('market-summary')
+    except HubFull:
+        return jsonify({'error': 'Too many viewers, use /api/market-summary'}), 503, \
+            {'Retry-After': str(SSE_RETRY_AFTER_SECONDS)}
+    
+    def generate():
+        with subscription:
+            yield 'retry: 5000\n\n'
+            snapshot, meta = summary_poller.latest()
+            if snapshot is not None:
+                yield format_sse('snapshot', {**snapshot, '_meta': meta})
+            deadline = time.time() + SSE_MAX_STREAM_SECONDS
+            
+            while time.time() < deadline:
+                event = subscription.get(SSE_KEEPALIVE_SECONDS)
+                if subscription.lagged:
+                    subscription.reset()
+                    snapshot, meta = summary_poller.latest()
+                    yield format_sse('snapshot', {**snapshot, '_meta': meta})
+                    continue
+                if event is None:
+                    yield ': keepalive\n\n'
+                    continue
+                event_id, kind, data = event
+                yield format_sse(kind, data, event_id)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 
 @app.route('/api/status/<job_id>', methods=['GET'])
 @token_required
 def get_status(job_id):
     """الحصول على حالة مهمة"""
-    if job_id not in jobs:
+    job_info = job_registry.get(job_id)
+    if job_info is None:
         return jsonify({
             'error': 'المهمة غير موجودة'
         }), 404
     
-    job_info = jobs[job_id]
-    
     # إضافة آخر سطور من المخرجات
-    outputs = job_outputs.get(job_id, [])
-    recent_output = outputs[-10:] if len(outputs) > 10 else outputs
+    recent_output = job_registry.recent_output(job_id, 10)
     
     return jsonify({
         'job_id': job_id,
@@ -465,23 +692,109 @@ def get_status(job_id):
     })
 
 
+@app.route('/api/status/<job_id>/stream', methods=['GET'])
+@stream_token_required
+def stream_status(job_id):
+    """
+    بث حالة المهمة (Server-Sent Events): لقطة كاملة عند الاتصال ثم التغييرات فقط
+    
+    الأحداث: snapshot, status, progress, log - ينتهي البث عند انتهاء المهمة
+    """
+    job_info = job_registry.get(job_id)
+    if job_info is None:
+        return jsonify({'error': 'المهمة غير موجودة'}), 404
+    
+    # الاشتراك قبل أخذ اللقطة حتى لا يفوتنا حدث بينهما
+    try:
+        subscription = event_hub.subscribe(f'job:{job_id}')
+    except HubFull:
+        return jsonify({'error': 'Too many viewers for this job, use /api/status polling'}), 503, \
+            {'Retry-After': str(SSE_RETRY_AFTER_SECONDS)}
+    
+    # مهمة في عامل gunicorn آخر: لا تصلنا أحداثها، نرسل لقطة دورية بدلاً منها
+    local = job_info.get('pid') == os.getpid()
+    
+    def snapshot():
+        job = job_registry.get(job_id) or {}
+        return {'job_id': job_id, **job, 'recent_output': job_registry.recent_output(job_id, 10)}
+    
+    def generate():
+        with subscription:
+            state = snapshot()
+            yield format_sse('snapshot', state)
+            deadline = time.time() + SSE_MAX_STREAM_SECONDS
+            
+            while state.get('status') not in FINISHED_STATUSES and time.time() < deadline:
+                event = subscription.get(SSE_KEEPALIVE_SECONDS if local else 2)
+                
+                if subscription.lagged:
+                    # المتابع بطيء وفاتته أحداث: لقطة كاملة بدلاً منها
+                    subscription.reset()
+                    state = snapshot()
+                    yield format_sse('snapshot', state)
+                    continue
+                
+                if event is None:
+                    if local:
+                        yield ': keepalive\n\n'
+                    else:
+                        state = snapshot()
+                        yield format_sse('snapshot', state)
+                    continue
+                
+                event_id, kind, data = event
+                if kind == 'status':
+                    state.update(data)
+                yield format_sse(kind, data, event_id)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 @app.route('/api/jobs', methods=['GET'])
 @token_required
 def list_jobs():
-    """قائمة بجميع المهام"""
+    """قائمة المهام (الأحدث أولاً) مع ترقيم الصفحات: ?limit=&offset=&status="""
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+        offset = max(int(request.args.get('offset', 0)), 0)
+    except ValueError:
+        return jsonify({'error': 'limit and offset must be integers'}), 400
+    status = request.args.get('status') or None
+    
+    items, total = job_registry.list(limit=limit, offset=offset, status=status)
     return jsonify({
-        'jobs': jobs
+        'jobs': {job_id: job for job_id, job in items},
+        'total': total,
+        'limit': limit,
+        'offset': offset
     })
 
 
+@app.route('/api/jobs/queue', methods=['GET'])
+@token_required
+def jobs_queue():
+    """المهام الجارية والمنتظرة في طابور الجلب"""
+    return jsonify(job_scheduler.snapshot())
+
+
 @app.route('/api/symbols/<market>', methods=['GET'])
 def get_symbols(market):
+    """جلب قائمة الرموز المتاحة (مع ETag: 304 إذا لم تتغير القائمة)"""
+    if market not in ['saudi', 'us']:
+        return jsonify({'error': 'Invalid market'}), 400
+    
+    data = market_store.get(market)
+    etag = make_etag('symbols', market, '\n'.join(data.symbols), names_version())
+    return conditional_response(etag, lambda: build_symbols_response(market))
+
+
+def build_symbols_response(market):
     """جلب قائمة الرموز المتاحة (Supabase first, CSV fallback)"""
     try:
-        # Validate market
-        if market not in ['saudi', 'us']:
-            return jsonify({'error': 'Invalid market'}), 400
-        
         # تحميل الأسماء العربية إذا كان السوق السعودي
         symbols_map = {}
         if market == 'saudi':
@@ -554,13 +867,44 @@ def get_symbols(market):
 
 @app.route('/api/history/<market>/<symbol>', methods=['GET'])
 def get_history(market, symbol):
-    """جلب البيانات التاريخية لسهم معين (آخر 6.5 أشهر) - Supabase first"""
+    """
+    جلب البيانات التاريخية لسهم معين (مع ETag خاص بالرمز: 304 إذا لم تتغير بياناته)
+    
+    ?start=YYYY-MM-DD&end=YYYY-MM-DD  أي فترة (الافتراضي: آخر 6 أشهر)
+    ?resolution=daily|weekly|monthly|quarterly|Nd  تجميع الشموع على الخادم (Nd = كل N يوم تداول)
+    ?points=N                         تقليل عدد النقاط مع الحفاظ على شكل المنحنى (LTTB)
+    ?indicators=sma_50,rsi_14         مؤشرات فنية مع كل شمعة (قيمة آخر يوم في الشمعة المجمعة)
+    """
+    if market not in ['saudi', 'us']:
+        return jsonify({'error': 'Invalid market'}), 400
+    
+    fmt, error = requested_format()
+    if error:
+        return error
+    try:
+        start = parse_date_arg('start')
+        end = parse_date_arg('end')
+        resolution, points = parse_series_shape()
+        names = parse_indicators_arg()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    data = market_store.get(market)
+    etag = make_etag('history', market, symbol, *symbol_version(data, symbol))
+    return conditional_response(etag, lambda: build_history_response(
+        market, symbol, fmt, start=start, end=end, resolution=resolution, points=points, indicators=names))
+
+
+def build_history_response(market, symbol, fmt='json', start=None, end=None, resolution='daily', points=None,
+                           indicators=None):
+    """جلب البيانات التاريخية لسهم معين (الافتراضي آخر 6 أشهر) - Supabase first"""
     try:
-        if market not in ['saudi', 'us']:
-            return jsonify({'error': 'Invalid market'}), 400
-        
         # Use unified data source (Supabase first, CSV fallback)
-        df = get_stock_data_from_source(symbol, market)
+        df = get_stock_data_from_source(
+            symbol, market,
+            start_date=str(start) if start is not None else None,
+            end_date=str(end) if end is not None else None
+        )
         
         if df is None or len(df) == 0:
             return jsonify({'error': 'No data found'}), 404
@@ -569,443 +913,554 @@ def get_history(market, symbol):
         if 'Date' not in df.columns:
             df = df.reset_index()  # In case Date is index
         
-        df['Date'] = pd.to_datetime(df['Date'])
-        
-        # تحديد الفترة الزمنية (6 أشهر بالضبط)
-        end_date = df['Date'].max()
-        start_date = end_date - pd.DateOffset(months=6)
+        dates = pd.to_datetime(df['Date']).to_numpy().astype('datetime64[D]')
         
-        # تصفية البيانات
-        mask = (df['Date'] >= start_date) & (df['Date'] <= end_date)
-        filtered_df = df.loc[mask].copy()
+        # تحديد الفترة الزمنية (الافتراضي 6 أشهر بالضبط قبل آخر تاريخ)
+        if end is None:
+            end = dates.max()
+        if start is None:
+            start = np.datetime64((pd.Timestamp(end) - pd.DateOffset(months=HISTORY_DEFAULT_MONTHS)).date(), 'D')
+        mask = (dates >= start) & (dates <= end)
         
-        if len(filtered_df) == 0:
+        if not mask.any():
             return jsonify({'error': 'No data in date range'}), 404
         
-        # تحويل البيانات إلى JSON
-        filtered_df['Date'] = filtered_df['Date'].dt.strftime('%Y-%m-%d')
+        series = {
+            'date': dates[mask],
+            'open': df['Open'].to_numpy(dtype=np.float64)[mask],
+            'high': df['High'].to_numpy(dtype=np.float64)[mask],
+            'low': df['Low'].to_numpy(dtype=np.float64)[mask],
+            'close': df['Close'].to_numpy(dtype=np.float64)[mask],
+            'volume': df['Volume'].to_numpy(dtype=np.float64)[mask]
+        }
+        if indicators:
+            series.update(history_indicators(market, symbol, series['date'], indicators))
+        series = shape_series(series, resolution, points, history_trading_dates(market, series['date']))
+        series['volume'] = series['volume'].astype(np.int64)
         
-        result = filtered_df[['Date', 'Open', 'High', 'Low', 'Close', 'Volume']].to_dict(orient='records')
+        # الصيغة العمودية: عمود لكل حقل مباشرة من المصفوفات
+        if fmt != 'json':
+            return columnar_response(series_columns(series), fmt)
         
-        return jsonify(result)
+        return jsonify(series_records(series))
         
     except Exception as e:
         print(f"Error fetching history for {symbol}: {e}")
         return jsonify({'error': str(e)}), 500
 
 
+def history_trading_dates(market, dates):
+    """تواريخ التداول لترقيم شموع N يوم: تواريخ السوق في الذاكرة مع تواريخ السلسلة (لفترة أقدم من الذاكرة)"""
+    return np.union1d(market_store.get(market).trading_dates, dates)
+
+
+def series_records(series):
+    """مصفوفات الشموع -> قائمة كائنات بصيغة /api/history (Date, Open, ...) مع المؤشرات إن وجدت"""
+    records = [
+        {'Date': d, 'Open': o, 'High': h, 'Low': l, 'Close': c, 'Volume': v}
+        for d, o, h, l, c, v in zip(
+            date_strings(series['date']), series['open'].tolist(), series['high'].tolist(),
+            series['low'].tolist(), series['close'].tolist(), series['volume'].tolist()
+        )
+    ]
+    for field, values in series.items():
+        if field not in CHART_FIELDS:
+            for record, value in zip(records, indicator_values(values)):
+                record[field] = value
+    return records
+
+
+def series_columns(series):
+    """مصفوفات الشموع -> أعمدة (التاريخ كنصوص، المؤشرات بـ null قبل اكتمال فترتها)"""
+    return {field: date_strings(values) if field == 'date'
+            else values.tolist() if field in CHART_FIELDS else indicator_values(values)
+            for field, values in series.items()}
+
+
+def indicator_values(values):
+    """قيم مؤشر -> قائمة (NaN = None ليكون JSON صالحاً)"""
+    return [None if math.isnan(value) else round(value, 4) for value in values.tolist()]
+
+
+# المؤشرات الفنية لكل سوق (محسوبة لنفس إصدار بيانات market_store)
+indicator_sets = {}
+indicator_locks = {market: threading.Lock() for market in ('saudi', 'us')}
+
+
+def market_indicators(market):
+    """
+    المؤشرات الفنية لبيانات السوق الحالية في الذاكرة
+    
+    تبدأ من آخر حساب في الذاكرة أو من الملف الذي تحفظه عملية الجلب،
+    ولا تحسب إلا الصفوف الناقصة (عادة لا شيء بعد الجلب).
+    
+    Returns:
+        (MarketData, IndicatorSet) - نفس ترتيب الصفوف
+    """
+    data = market_store.get(market)
+    current = indicator_sets.get(market)
+    if current is not None and current[0] is data:
+        return current
+    with indicator_locks[market]:
+        current = indicator_sets.get(market)
+        if current is not None and current[0] is data:
+            return current
+        started = time.perf_counter()
+        previous = current[1] if current is not None else load_indicators(market)
+        result, stats = update_indicators(previous, data)
+        print(f"Indicators: {market} {stats['rows']} rows ({stats['recomputed']} symbols in full) "
+              f"in {time.perf_counter() - started:.2f}s")
+        indicator_sets[market] = (data, result)
+        return data, result
+
+
+def history_indicators(market, symbol, dates, names):
+    """قيم المؤشرات المطلوبة للرمز في تواريخ الشموع اليومية"""
+    data, indicator_set = market_indicators(market)
+    values = symbol_indicators(indicator_set, data, symbol, dates)
+    return {name: values[name] for name in names}
+
+
+def parse_indicators_arg():
+    """أسماء المؤشرات من ?indicators= (قائمة مفصولة بفواصل) أو قائمة فارغة"""
+    names = list(dict.fromkeys(n.strip() for n in request.args.get('indicators', '').split(',') if n.strip()))
+    unknown = [name for name in names if name not in DEFAULT_INDICATORS]
+    if unknown:
+        raise ValueError(f"indicators must be from: {', '.join(DEFAULT_INDICATORS)}")
+    return names
 
-def calculate_levels(df):
-    """حساب مستويات جان وفيبوناتشي للسهم - محسّن"""
+
+# أقصى عدد رموز في طلب التاريخ المجمع
+HISTORY_BATCH_MAX_SYMBOLS = int(os.getenv('HISTORY_BATCH_MAX_SYMBOLS', '100'))
+# الفترة الافتراضية للتاريخ (بالأشهر قبل آخر تاريخ للرمز)
+HISTORY_DEFAULT_MONTHS = 6
+# أقصى عدد نقاط يمكن طلبه عبر ?points=
+HISTORY_MAX_POINTS = 5000
+
+
+def parse_date_arg(name):
+    """تاريخ من معاملات الطلب (YYYY-MM-DD) كـ numpy datetime64 أو None"""
+    value = request.args.get(name)
+    if not value:
+        return None
     try:
-        # البيانات جاهزة مع Date column
-        if 'Date' not in df.columns or df.empty or len(df) < 10:
-            return None
-        
-        # العثور على أقل قاع
-        min_low = float(df['Low'].min())
-        min_low_idx = df['Low'].idxmin()
-        
-        # العثور على أول قمة بعد القاع (محسّن)
-        df_subset = df.loc[min_low_idx:].copy()
-        
-        if len(df_subset) < 3:
-            return None
-        
-        # استخدام numpy للسرعة
-        highs = df_subset['High'].values
-        peak_high = None
+        return np.datetime64(pd.Timestamp(value).date(), 'D')
+    except ValueError:
+        raise ValueError(f"{name} must be a date (YYYY-MM-DD)")
+
+
+def parse_series_shape():
+    """
+    دقة الشموع وعدد النقاط من معاملات الطلب
+    
+    Returns:
+        (resolution, points) - points = None بدون تقليل
+    """
+    resolution = request.args.get('resolution', 'daily')
+    check_resolution(resolution)
+    points = request.args.get('points')
+    if not points:
+        return resolution, None
+    try:
+        points = int(points)
+    except ValueError:
+        raise ValueError('points must be an integer')
+    if not 3 <= points <= HISTORY_MAX_POINTS:
+        raise ValueError(f'points must be between 3 and {HISTORY_MAX_POINTS}')
+    return resolution, points
+
+
+def history_slice(data, symbol, start=None, end=None):
+    """
+    حدود صفوف الرمز في مصفوفات السوق ضمن فترة (searchsorted على تواريخ الرمز المرتبة)
+    
+    Args:
+        data: MarketData
+        symbol: الرمز
+        start: بداية الفترة (None = آخر 6 أشهر من آخر تاريخ للرمز)
+        end: نهاية الفترة (None = آخر تاريخ)
+    
+    Returns:
+        (first, last) أو None إذا لم يوجد الرمز أو لا توجد بيانات في الفترة
+    """
+    bounds = data.bounds(symbol)
+    if bounds is None or bounds[0] == bounds[1]:
+        return None
+    first, last = bounds
+    dates = data.date[first:last]
+    if end is not None:
+        last = first + int(np.searchsorted(dates, end, side='right'))
+    if last == first:
+        return None
+    if start is None:
+        last_date = pd.Timestamp(data.date[last - 1])
+        start = np.datetime64((last_date - pd.DateOffset(months=HISTORY_DEFAULT_MONTHS)).date(), 'D')
+    first += int(np.searchsorted(dates, start, side='left'))
+    if first >= last:
+        return None
+    return first, last
+
+
+@app.route('/api/history/<market>', methods=['GET'])
+def get_history_batch(market):
+    """
+    بيانات تاريخية لعدة رموز في طلب واحد (مرور واحد على بيانات السوق في الذاكرة)
+    
+    ?symbols=1120.SR,2222.SR&start=YYYY-MM-DD&end=YYYY-MM-DD&format=json|columnar|msgpack|arrow
+    بدون start: آخر 6 أشهر لكل رمز (مثل /api/history/<market>/<symbol>)
+    ?resolution= و ?points= و ?indicators= كما في /api/history/<market>/<symbol> (لكل رمز)
+    """
+    if market not in ['saudi', 'us']:
+        return jsonify({'error': 'Invalid market'}), 400
+    fmt, error = requested_format()
+    if error:
+        return error
+    
+    symbols = list(dict.fromkeys(s.strip() for s in request.args.get('symbols', '').split(',') if s.strip()))
+    if not symbols:
+        return jsonify({'error': 'symbols is required (comma separated)'}), 400
+    if len(symbols) > HISTORY_BATCH_MAX_SYMBOLS:
+        return jsonify({'error': f'At most {HISTORY_BATCH_MAX_SYMBOLS} symbols per request'}), 400
+    try:
+        start = parse_date_arg('start')
+        end = parse_date_arg('end')
+        resolution, points = parse_series_shape()
+        names = parse_indicators_arg()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    data = market_store.get(market)
+    versions = [part for symbol in symbols for part in symbol_version(data, symbol)]
+    etag = make_etag('history-batch', market, *versions)
+    return conditional_response(etag, lambda: build_history_batch_response(
+        market, symbols, start, end, fmt, resolution=resolution, points=points, indicators=names))
+
+
+def build_history_batch_response(market, symbols, start, end, fmt='json', resolution='daily', points=None,
+                                 indicators=None):
+    """بناء رد التاريخ المجمع"""
+    try:
+        data = market_store.get(market)
         
-        # البحث عن أول قمة محلية (محسّن)
-        for i in range(1, min(len(highs) - 1, 50)):  # limit search to first 50 bars
-            if highs[i] > highs[i-1] and highs[i] > highs[i+1]:
-                peak_high = float(highs[i])
-                break
+        # الذاكرة المحملة من Supabase تغطي آخر STORE_SUPABASE_DAYS فقط:
+        # فترة أقدم تجلب لجميع الرموز باستعلام واحد
+        if USE_SUPABASE and data.source == 'supabase' and start is not None \
+                and len(data.date) and start < data.date.min():
+            rows = pd.DataFrame(get_stock_data_batch(
+                symbols, market,
+                start_date=str(start),
+                end_date=str(end) if end is not None else None
+            ))
+            if not rows.empty:
+                rows['date'] = pd.to_datetime(rows['date'])
+            data = build_market_data(market, rows, 'supabase', time.time())
         
-        if peak_high is None or peak_high <= min_low:
-            return None
-            
-        # حساب المستويات
-        levels = []
+        result = {}
+        missing = []
+        for symbol in symbols:
+            bounds = history_slice(data, symbol, start, end)
+            if bounds is None:
+                missing.append(symbol)
+                continue
+            first, last = bounds
+            series = {
+                'date': data.date[first:last],
+                'open': data.open[first:last],
+                'high': data.high[first:last],
+                'low': data.low[first:last],
+                'close': data.close[first:last],
+                'volume': data.volume[first:last]
+            }
+            if indicators:
+                series.update(history_indicators(market, symbol, series['date'], indicators))
+            series = shape_series(series, resolution, points, history_trading_dates(market, series['date']))
+            series['volume'] = series['volume'].astype(np.int64)
+            result[symbol] = series
         
-        # Gann (Dynamic)
-        sqrt_low = math.sqrt(min_low)
-        sqrt_peak = math.sqrt(peak_high)
-        delta = sqrt_peak - sqrt_low
+        if fmt == 'arrow':
+            # جدول واحد طويل مع عمود symbol
+            columns = {'symbol': [symbol for symbol, cols in result.items() for _ in range(len(cols['date']))]}
+            for field in CHART_FIELDS + tuple(indicators or ()):
+                parts = [cols[field] for cols in result.values()]
+                values = np.concatenate(parts) if parts else np.array([])
+                columns[field] = date_strings(values) if field == 'date' else values
+            return columnar_response(columns, fmt, meta={'market': market, 'missing': missing})
         
-        levels.append({'type': 'Gann 180', 'value': (sqrt_low + 2*delta)**2})
-        levels.append({'type': 'Gann 270', 'value': (sqrt_low + 3*delta)**2})
-        levels.append({'type': 'Gann 360', 'value': (sqrt_low + 4*delta)**2})
+        if fmt == 'json':
+            # نفس صيغة /api/history/<market>/<symbol> لكل رمز
+            series = {symbol: series_records(cols) for symbol, cols in result.items()}
+        else:
+            series = {symbol: series_columns(cols) for symbol, cols in result.items()}
         
-        # Fibo
-        fib_range = peak_high - min_low
-        levels.append({'type': 'Fibo 100', 'value': peak_high})
-        levels.append({'type': 'Fibo 161.8', 'value': min_low + fib_range * 1.618})
-        levels.append({'type': 'Fibo 261.8', 'value': min_low + fib_range * 2.618})
-        levels.append({'type': 'Fibo 423.6', 'value': min_low + fib_range * 4.236})
+        return payload_response({'market': market, 'data': series, 'missing': missing}, fmt)
         
-        return levels
     except Exception as e:
-        print(f"Error calculating levels: {e}")
-        return None
+        print(f"Error fetching batch history: {e}")
+        return jsonify({'error': str(e)}), 500
 
-@app.route('/api/scan/fibo_gann', methods=['GET'])
-def scan_fibo_gann():
-    """فحص جميع الأسهم لاستخراج الفرص (اختراق أو ارتداد) - محسّن للسرعة"""
-    market = request.args.get('market', 'saudi')
-    
-    # تحميل خريطة الأسماء
+
+def load_symbols_map(market):
+    """خريطة الرمز -> الاسم العربي (السوق السعودي فقط، مع وبدون .SR)"""
     symbols_map = {}
-    if market == 'saudi':
-        try:
-            symbols_path = os.path.join(BASE_DIR, 'symbols_sa.txt')
-            if os.path.exists(symbols_path):
-                df_sym = pd.read_csv(symbols_path)
-                for _, row in df_sym.iterrows():
-                    full_symbol = str(row['Symbol']).strip()
-                    name = str(row['NameAr']).strip()
-                    symbols_map[full_symbol] = name
-                    if full_symbol.endswith('.SR'):
-                        symbols_map[full_symbol.replace('.SR', '')] = name
-        except: pass
-    
-    # استعلام واحد لجميع بيانات السوق (آخر 6 أشهر)
-    if USE_SUPABASE:
-        try:
-            from supabase_client import get_supabase_client
-            from datetime import datetime, timedelta
-            
-            client = get_supabase_client()
-            if client:
-                print(f"Fetching all {market} market data in one query...")
-                
-                # جلب آخر 3 أشهر للأمريكي، 6 للسعودي (للسرعة)
-                days_back = 90 if market == 'us' else 180
-                months_ago = (datetime.now() - timedelta(days=days_back)).strftime('%Y-%m-%d')
-                
-                # Supabase limit is 1000 by default, we need to handle pagination
-                all_data = []
-                limit = 1000
-                offset = 0
-                
-                while True:
-                    result = client.table('stock_data')\
-                        .select('symbol, date, open, high, low, close, volume')\
-                        .eq('market', market)\
-                        .gte('date', months_ago)\
-                        .order('symbol')\
-                        .order('date')\
-                        .range(offset, offset + limit - 1)\
-                        .execute()
-                    
-                    if not result.data:
-                        break
-                    
-                    all_data.extend(result.data)
-                    
-                    if len(result.data) < limit:
-                        break
-                    
-                    offset += limit
-                
-                if not all_data:
-                    return jsonify({'results': [], 'scanned': 0, 'total': 0})
-                
-                print(f"Fetched {len(all_data)} records, processing...")
-                
-                # تحويل إلى DataFrame للمعالجة السريعة
-                df_all = pd.DataFrame(all_data)
-                df_all['date'] = pd.to_datetime(df_all['date'])
-                df_all = df_all.sort_values(['symbol', 'date'])
-                
-                results = []
-                symbols = df_all['symbol'].unique()
-                processed = 0
-                
-                for symbol in symbols:
-                    try:
-                        # استخراج بيانات السهم من DataFrame الكبير (سريع جداً!)
-                        symbol_data = df_all[df_all['symbol'] == symbol].copy()
-                        
-                        if len(symbol_data) < 10:
-                            continue
-                        
-                        # تحويل للصيغة المطلوبة
-                        symbol_data = symbol_data.rename(columns={
-                            'date': 'Date',
-                            'open': 'Open',
-                            'high': 'High',
-                            'low': 'Low',
-                            'close': 'Close',
-                            'volume': 'Volume'
-                        })
-                        
-                        levels = calculate_levels(symbol_data)
-                        
-                        if not levels:
-                            continue
-                        
-                        # فحص آخر شمعة
-                        last_candle = symbol_data.iloc[-1]
-                        open_p = last_candle['Open']
-                        close_p = last_candle['Close']
-                        high_p = last_candle['High']
-                        low_p = last_candle['Low']
-                        
-                        match = False
-                        match_reason = ""
-                        match_level = 0
-                        
-                        for level in levels:
-                            val = level['value']
-                            
-                            # الشرط الأساسي: الشمعة تلامس المستوى
-                            if low_p <= val <= high_p:
-                                # 1. اختراق
-                                if open_p < val < close_p:
-                                    match = True
-                                    match_reason = f"اختراق {level['type']}"
-                                    match_level = val
-                                    break
-                                # 2. ارتداد
-                                elif low_p <= val and close_p > val:
-                                    match = True
-                                    match_reason = f"ارتداد من {level['type']}"
-                                    match_level = val
-                                    break
-                        
-                        if match:
-                            name = symbols_map.get(symbol, symbol)
-                            if market == 'saudi':
-                                clean_sym = symbol.replace('.SR', '')
-                                name = symbols_map.get(clean_sym, name)
-                            
-                            results.append({
-                                'symbol': symbol,
-                                'name': name,
-                                'close': close_p,
-                                'reason': match_reason,
-                                'level': match_level
-                            })
-                        
-                        processed += 1
-                    
-                    except Exception as e:
-                        print(f"Error scanning {symbol}: {e}")
-                        processed += 1
-                        continue
-                
-                print(f"Scan complete: {processed} stocks scanned, {len(results)} opportunities found")
-                return jsonify({
-                    'results': results,
-                    'scanned': processed,
-                    'total': len(symbols)
-                })
-        
-        except Exception as e:
-            print(f"Supabase scan error: {e}")
-            # سنفعّل fallback للـ CSV
+    if market != 'saudi':
+        return symbols_map
+    try:
+        symbols_path = os.path.join(BASE_DIR, 'symbols_sa.txt')
+        if os.path.exists(symbols_path):
+            df_sym = pd.read_csv(symbols_path)
+            for _, row in df_sym.iterrows():
+                full_symbol = str(row['Symbol']).strip()
+                name = str(row['NameAr']).strip()
+                symbols_map[full_symbol] = name
+                if full_symbol.endswith('.SR'):
+                    symbols_map[full_symbol.replace('.SR', '')] = name
+    except Exception as e:
+        print(f"Warning: Could not load Saudi symbols: {e}")
+    return symbols_map
+
+
+def window_rows(data, days, as_of=None):
+    """
+    حدود صفوف كل رمز في آخر عدد من الأيام (بحث ثنائي واحد لجميع الرموز)
     
-    # Fallback to CSV (local only)
-    print("Using CSV fallback...")
-    directory = os.path.join(BASE_DIR, 'data_sa' if market == 'saudi' else 'data_us')
-    if not os.path.exists(directory):
-        return jsonify({'results': [], 'scanned': 0, 'total': 0})
+    Args:
+        data: MarketData
+        days: طول النافذة بالأيام
+        as_of: np.datetime64 - قطع البيانات عند هذا التاريخ (None = حتى آخر صف واليوم الحالي)
     
-    results = []
-    symbols = [f[:-4] for f in os.listdir(directory) if f.endswith('.csv')]
-    processed = 0
+    Returns:
+        (starts, ends) - صفوف الرمز i هي [starts[i], ends[i])
+    """
+    if as_of is None:
+        cutoff = np.datetime64((datetime.now() - timedelta(days=days)).date(), 'D')
+        ends = data.offsets[1:]
+    else:
+        cutoff = as_of - np.timedelta64(days, 'D')
+        # آخر صف لكل رمز في التاريخ أو قبله
+        ends = data.as_of_rows(as_of) + 1
+    symbol_ids = np.arange(len(data.symbols), dtype=np.int64)
+    starts = np.searchsorted(data.row_keys, symbol_ids * KEY_STRIDE + cutoff.astype(np.int64))
+    return np.minimum(starts, ends), ends
+
+
+def compute_fibo_gann_scan(market, as_of=None):
+    """
+    فحص جميع الأسهم لاستخراج الفرص (اختراق أو ارتداد) من بيانات السوق في الذاكرة
     
-    for symbol in symbols:
-        try:
-            df = get_stock_data_from_source(symbol, market)
-            if df is None or len(df) == 0:
-                continue
-            
-            levels = calculate_levels(df)
-            if not levels:
-                continue
-            
-            last_candle = df.iloc[-1]
-            open_p = last_candle['Open']
-            close_p = last_candle['Close']
-            high_p = last_candle['High']
-            low_p = last_candle['Low']
-            
-            match = False
-            match_reason = ""
-            match_level = 0
-            
-            for level in levels:
-                val = level['value']
-                if low_p <= val <= high_p:
-                    if open_p < val < close_p:
-                        match = True
-                        match_reason = f"اختراق {level['type']}"
-                        match_level = val
-                        break
-                    elif low_p <= val and close_p > val:
-                        match = True
-                        match_reason = f"ارتداد من {level['type']}"
-                        match_level = val
-                        break
-            
-            if match:
-                name = symbols_map.get(symbol, symbol)
-                if market == 'saudi':
-                    clean_sym = symbol.replace('.SR', '')
-                    name = symbols_map.get(clean_sym, name)
-                
-                results.append({
-                    'symbol': symbol,
-                    'name': name,
-                    'close': close_p,
-                    'reason': match_reason,
-                    'level': match_level
-                })
-            
-            processed += 1
-        except Exception as e:
-            print(f"Error scanning {symbol}: {e}")
-            processed += 1
-            continue
+    as_of: تقييم الفحص على البيانات حتى هذا التاريخ (np.datetime64) بدلاً من آخر شمعة
+    """
+    symbols_map = load_symbols_map(market)
+    data = market_store.get(market)
     
-    return jsonify({
+    # أقل قاع وأول قمة بعده لجميع الرموز (scan_kernels: Numba إذا كانت مثبتة)
+    starts, ends = window_rows(data, FIBO_GANN_DAYS[market], as_of)
+    candidates = np.flatnonzero(ends - starts >= FIBO_MIN_BARS)
+    min_idx, peak_idx = first_peaks(data.low, data.high, starts[candidates], ends[candidates], PEAK_SEARCH_BARS)
+    found = peak_idx >= 0
+    found[found] = data.high[peak_idx[found]] > data.low[min_idx[found]]
+    candidates, min_idx, peak_idx = candidates[found], min_idx[found], peak_idx[found]
+    processed = len(candidates)
+    
+    # فحص آخر شمعة لكل رمز
+    last = ends[candidates] - 1
+    levels = level_values(data.low[min_idx], data.high[peak_idx])
+    level, breakout = candle_levels(data.open[last], data.high[last], data.low[last], data.close[last], levels)
+    
+    results = []
+    for k in np.flatnonzero(level >= 0):
+        symbol = data.symbols[candidates[k]]
+        level_type = LEVEL_TYPES[level[k]]
+        name = symbols_map.get(symbol, symbol)
+        if market == 'saudi':
+            clean_sym = symbol.replace('.SR', '')
+            name = symbols_map.get(clean_sym, name)
+        
+        results.append({
+            'symbol': symbol,
+            'name': name,
+            'close': float(data.close[last[k]]),
+            'reason': f"اختراق {level_type}" if breakout[k] else f"ارتداد من {level_type}",
+            'level': float(levels[k, level[k]])
+        })
+    
+    print(f"Scan complete: {processed} stocks scanned, {len(results)} opportunities found")
+    result = {
         'results': results,
         'scanned': processed,
-        'total': len(symbols)
-    })
+        'total': len(data.symbols)
+    }
+    if as_of is not None:
+        result['as_of'] = str(as_of)
+    return result
+
+
+@app.route('/api/scan/fibo_gann', methods=['GET'])
+def scan_fibo_gann():
+    """
+    فحص جميع الأسهم لاستخراج الفرص (اختراق أو ارتداد) - من الذاكرة أو الحساب المسبق
+    
+    ?as_of=YYYY-MM-DD: ما كان الفحص سيظهره في ذلك التاريخ
+    """
+    market = request.args.get('market', 'saudi')
+    if market not in ['saudi', 'us']:
+        return jsonify({'error': 'Invalid market'}), 400
+    fmt, error = requested_format()
+    if error:
+        return error
+    try:
+        as_of = parse_date_arg('as_of')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return scan_response(get_scan('fibo_gann', market, as_of), fmt)
 
 
 @app.route('/api/market-data/<market>', methods=['GET'])
 def market_data(market):
-    """إرجاع بيانات السوق للعرض في قائمة الأسهم"""
+    """
+    إرجاع بيانات السوق للعرض في قائمة الأسهم (مع ETag: 304 حتى التحديث التالي للسوق)
+    
+    ترتيب وتصفية وتقسيم على الخادم (مثلاً أعلى 20 ارتفاعاً):
+    ?sort=change_percent|change|price|volume|symbol&order=desc|asc
+    &min_change=&max_change=&min_volume=&limit=&offset=
+    """
+    if market not in ['saudi', 'us']:
+        return jsonify({'error': 'Invalid market'}), 400
+    
+    fmt, error = requested_format()
+    if error:
+        return error
     try:
-        # الحصول على التاريخ المطلوب (اختياري)
-        target_date = request.args.get('date', None)
-        
-        # Try Supabase first
-        if USE_SUPABASE:
-            try:
-                return get_market_data_from_supabase(market, target_date)
-            except Exception as e:
-                print(f"Supabase error, falling back to CSV: {e}")
-        
-        # Fallback to CSV
-        if market == 'saudi':
-            directory = os.path.join(BASE_DIR, 'data_sa')
-            # تحميل خريطة الأسماء
-            symbols_map = {}
-            try:
-                symbols_path = os.path.join(BASE_DIR, 'symbols_sa.txt')
-                if os.path.exists(symbols_path):
-                    df_sym = pd.read_csv(symbols_path)
-                    for _, row in df_sym.iterrows():
-                        symbols_map[str(row['Symbol']).strip()] = str(row['NameAr']).strip()
-            except: pass
-        elif market == 'us':
-            directory = os.path.join(BASE_DIR, 'data_us')
-            symbols_map = {}
-        else:
-            return jsonify({'error': 'Invalid market'}), 400
-            
-        if not os.path.exists(directory):
-            print(f"Directory not found: {os.path.abspath(directory)}")
-            return jsonify({'data': [], 'date': None, 'available_dates': []})
-            
-        print(f"Reading market data from: {os.path.abspath(directory)}")
-        if target_date:
-            print(f"Target date requested: {target_date}")
-            
-        data_list = []
-        actual_date = None  # التاريخ الفعلي المستخدم
-        available_dates = set()  # جميع التواريخ المتاحة
-        
-        for filename in os.listdir(directory):
-            if not filename.endswith('.csv'): continue
-            
-            symbol = filename[:-4]
-            file_path = os.path.join(directory, filename)
-            
-            try:
-                # قراءة الملف
-                df = pd.read_csv(file_path)
-                
-                if len(df) < 2: continue
-                
-                # تحويل التاريخ
-                if 'Date' in df.columns:
-                    df['Date'] = pd.to_datetime(df['Date'])
-                    df = df.sort_values('Date')
-                
-                # جمع جميع التواريخ المتاحة
-                for d in df['Date']:
-                    available_dates.add(d.strftime('%Y-%m-%d'))
-                
-                # إذا تم تحديد تاريخ معين
-                if target_date:
-                    target_dt = pd.to_datetime(target_date)
-                    # البحث عن أقرب تاريخ
-                    df_filtered = df[df['Date'] <= target_dt]
-                    if len(df_filtered) == 0:
-                        continue  # لا توجد بيانات قبل هذا التاريخ
-                    last_row = df_filtered.iloc[-1]
-                    
-                    # إيجاد الصف السابق
-                    last_idx = df_filtered.index[-1]
-                    if last_idx > 0:
-                        prev_row = df.iloc[last_idx - 1]
-                    else:
-                        prev_row = last_row  # لا يوجد سابق
-                else:
-                    # استخدام آخر تاريخ
-                    last_row = df.iloc[-1]
-                    prev_row = df.iloc[-2]
-                
-                # حفظ التاريخ الفعلي
-                if actual_date is None:
-                    actual_date = last_row['Date'].strftime('%Y-%m-%d')
-                
-                price = float(last_row['Close'])
-                prev_close = float(prev_row['Close'])
-                change = price - prev_close
-                change_pct = (change / prev_close) * 100
-                volume = int(last_row['Volume'])
-                
-                name = symbols_map.get(symbol, symbol)
-                if market == 'saudi':
-                    clean_sym = symbol.replace('.SR', '')
-                    name = symbols_map.get(clean_sym, name)
-                
-                data_list.append({
-                    'symbol': symbol,
-                    'name': name,
-                    'price': round(price, 2),
-                    'change': round(change, 2),
-                    'change_percent': round(change_pct, 2),
-                    'volume': volume
-                })
-                
-            except Exception as e:
-                continue
-        
-        # إذا لم توجد بيانات للتاريخ المحدد
-        if target_date and len(data_list) == 0:
-            return jsonify({
-                'data': [],
-                'date': target_date,
-                'message': 'لا توجد بيانات لهذا التاريخ'
-            })
-                
-        return jsonify({
-            'data': data_list,
-            'date': actual_date,
-            'available_dates': sorted(list(available_dates), reverse=True)[:30]  # آخر 30 تاريخ
-        })
-        
+        query = parse_snapshot_query()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    data = market_store.get(market)
+    etag = make_etag('market-data', market, data.version, names_version())
+    return conditional_response(etag, lambda: build_market_data_response(market, fmt, query))
+
+
+def parse_snapshot_query():
+    """معاملات الترتيب والتصفية لبيانات السوق (ترفع ValueError عند قيمة غير صالحة)"""
+    args = request.args
+    sort = args.get('sort') or None
+    if sort is not None and sort not in SNAPSHOT_SORT_KEYS:
+        raise ValueError(f"sort must be one of: {', '.join(SNAPSHOT_SORT_KEYS)}")
+    order = args.get('order', 'desc')
+    if order not in ('asc', 'desc'):
+        raise ValueError('order must be asc or desc')
+    
+    def number(name, cast=float, minimum=None):
+        value = args.get(name)
+        if value in (None, ''):
+            return None
+        try:
+            value = cast(value)
+        except ValueError:
+            raise ValueError(f'{name} must be a number')
+        if minimum is not None and value < minimum:
+            raise ValueError(f'{name} must be >= {minimum}')
+        return value
+    
+    return {
+        'sort': sort,
+        'descending': order == 'desc',
+        'min_change': number('min_change'),
+        'max_change': number('max_change'),
+        'min_volume': number('min_volume'),
+        'limit': number('limit', int, 1),
+        'offset': number('offset', int, 0) or 0,
+    }
+
+
+def build_market_data_response(market, fmt='json', query=None):
+    """إرجاع بيانات السوق بالصيغة المطلوبة (json أو صيغة عمودية)"""
+    try:
+        payload = market_data_payload(market, request.args.get('date', None))
     except Exception as e:
         print(f"Error getting market data: {e}")
         return jsonify({'error': str(e)}), 500
+    
+    snapshot, payload['total'] = query_snapshot(payload.pop('data'), **(query or {}))
+    if fmt == 'json':
+        return jsonify({'data': snapshot_records(snapshot), **payload})
+    return columnar_response({field: snapshot[field] for field in SNAPSHOT_FIELDS}, fmt, meta=payload)
+
+
+def market_data_payload(market, target_date=None):
+    """
+    بيانات السوق للعرض في قائمة الأسهم
+    
+    Returns:
+        dict: data (أعمدة اللقطة)، date، available_dates
+    """
+    if market not in ['saudi', 'us']:
+        raise ValueError('Invalid market')
+    
+    data = market_store.get(market)
+    target = np.datetime64(pd.Timestamp(target_date).date(), 'D') if target_date else None
+    
+    # الذاكرة المحملة من Supabase تغطي آخر STORE_SUPABASE_DAYS:
+    # التاريخ ضمنها يحسب منها مباشرة، والأقدم يقرأ من اللقطات اليومية المحفوظة
+    covered = len(data.trading_dates) > 0 and (target is None or target >= data.trading_dates[0])
+    in_store = covered and (data.source == 'supabase' or not USE_SUPABASE)
+    
+    if target is not None and not in_store:
+        payload = daily_snapshot_payload(market, str(target), data)
+        if payload is not None:
+            return payload
+    
+    # Try Supabase first
+    if USE_SUPABASE and not in_store:
+        try:
+            payload = get_market_data_from_supabase(market, target_date)
+            payload['data'] = records_to_snapshot(payload.get('data', []))
+            return payload
+        except Exception as e:
+            print(f"Supabase error, falling back to CSV: {e}")
+    
+    # Fallback to in-memory market data (loaded once from CSV files)
+    if len(data) == 0:
+        return {'data': empty_snapshot(), 'date': None, 'available_dates': []}
+    
+    snapshot, as_of = compute_snapshot(data, load_symbols_map(market), target)
+    
+    # إذا لم توجد بيانات للتاريخ المحدد
+    if target_date and len(snapshot['symbol']) == 0:
+        return {
+            'data': snapshot,
+            'date': target_date,
+            'message': 'لا توجد بيانات لهذا التاريخ'
+        }
+    
+    return {
+        'data': snapshot,
+        'date': str(as_of) if as_of is not None else None,
+        'available_dates': data.available_dates  # آخر 30 تاريخ (من فهرس التواريخ)
+    }
+
+
+def daily_snapshot_payload(market, target_date, data):
+    """
+    بيانات السوق لتاريخ سابق من اللقطة اليومية المحفوظة (ملف محلي أو صف واحد في Supabase)
+    
+    Returns:
+        dict بنفس صيغة market_data_payload أو None إذا لم توجد لقطة
+    """
+    found = load_daily_snapshot(market, target_date)
+    if found is None and USE_SUPABASE:
+        row = get_market_snapshot(market, target_date)
+        if row:
+            found = (row['date'], columns_to_frame(row['data']))
+    if found is None:
+        return None
+    
+    date, frame = found
+    return {
+        'data': daily_frame_to_snapshot(frame, load_symbols_map(market)),
+        'date': date,
+        'available_dates': data.available_dates
+    }
 
 
 def get_market_data_from_supabase(market, target_date=None):
@@ -1018,7 +1473,7 @@ def get_market_data_from_supabase(market, target_date=None):
         target_date: Optional date filter (YYYY-MM-DD)
     
     Returns:
-        JSON response with data list
+        dict with data list
     """
     from supabase_client import get_supabase_client
     
@@ -1078,13 +1533,13 @@ def get_market_data_from_supabase_fallback(client, market, target_date, symbols_
     date_result = date_query.execute()
     
     if not date_result.data or len(date_result.data) == 0:
-        return jsonify({'data': [], 'date': None, 'message': 'لا توجد بيانات'})
+        return {'data': [], 'date': None, 'message': 'لا توجد بيانات'}
     
     # Get unique dates and take last 10 (enough to ensure every symbol has at least 2 entries)
     unique_dates = sorted(list(set([r['date'] for r in date_result.data])), reverse=True)[:10]
     
     if not unique_dates:
-        return jsonify({'data': [], 'date': None, 'message': 'لا توجد تواريخ'})
+        return {'data': [], 'date': None, 'message': 'لا توجد تواريخ'}
     
     latest_date = unique_dates[0]
     
@@ -1099,7 +1554,7 @@ def get_market_data_from_supabase_fallback(client, market, target_date, symbols_
     result = data_query.execute()
     
     if not result.data:
-        return jsonify({'data': [], 'date': None, 'message': 'لا توجد بيانات'})
+        return {'data': [], 'date': None, 'message': 'لا توجد بيانات'}
     
     # Process data efficiently
     df = pd.DataFrame(result.data)
@@ -1140,20 +1595,22 @@ def get_market_data_from_supabase_fallback(client, market, target_date, symbols_
             'volume': volume
         })
     
-    return jsonify({
+    return {
         'data': data_list,
         'date': latest_date,
         'count': len(data_list)
-    })
+    }
 
 
-def get_stock_data_from_source(symbol, market):
+def get_stock_data_from_source(symbol, market, start_date=None, end_date=None):
     """
     Get stock data from Supabase or CSV (fallback)
     
     Args:
         symbol: Stock symbol
         market: 'saudi' or 'us'
+        start_date: Start date (YYYY-MM-DD) optional - Supabase only
+        end_date: End date (YYYY-MM-DD) optional - Supabase only
     
     Returns:
         pandas DataFrame with columns: Date, Open, High, Low, Close, Volume
@@ -1161,7 +1618,11 @@ def get_stock_data_from_source(symbol, market):
     if USE_SUPABASE:
         try:
             # Get data from Supabase
-            data = get_stock_data(symbol, market)
+            if start_date or end_date:
+                # فترة محددة: استعلام مقسم لصفحات (قد تتجاوز حد الصفوف في الطلب الواحد)
+                data = get_stock_data_batch([symbol], market, start_date=start_date, end_date=end_date)
+            else:
+                data = get_stock_data(symbol, market)
             if data and len(data) > 0:
                 df = pd.DataFrame(data)
                 df['Date'] = pd.to_datetime(df['date'])
@@ -1178,278 +1639,276 @@ def get_stock_data_from_source(symbol, market):
         except Exception as e:
             print(f"Supabase error for {symbol}, falling back to CSV: {e}")
     
-    # Fallback to CSV
-    if market == 'saudi':
-        directory = os.path.join(BASE_DIR, 'data_sa')
-    else:
-        directory = os.path.join(BASE_DIR, 'data_us')
+    # Fallback to in-memory market data (loaded once from CSV files)
+    return market_store.get(market).frame(symbol)
+
+
+def compute_weekly_scan(market, as_of=None):
+    """
+    فحص أسبوعي للأسهم بناءً على شروط محددة (من بيانات السوق في الذاكرة)
+    1. شمعة خضراء بإغلاق قريب من الأعلى
+    2. الإغلاق متجاوز أو على حدود قمة سابقة (6 أشهر)
+    3. الحجم أكبر من الشمعة السابقة
     
-    file_path = os.path.join(directory, f'{symbol}.csv')
+    الشموع الأسبوعية لجميع الأسهم من market_bars (تجميع واحد للسوق) بدلاً من resample لكل سهم،
+    ويستخدم الأسبوع قبل الأخير (المكتمل) بدلاً من الأخير (قد يكون غير مكتمل).
     
-    if os.path.exists(file_path):
-        df = pd.read_csv(file_path)
-        df['Date'] = pd.to_datetime(df['Date'])
-        df = df.sort_values('Date')
-        return df
+    as_of: تقييم الفحص على البيانات حتى هذا التاريخ (np.datetime64) بدلاً من آخر أسبوع
+    """
+    symbols_map = load_symbols_map(market)
+    data = market_store.get(market)
     
-    return None
+    starts, ends = window_rows(data, WEEKLY_SCAN_DAYS, as_of)
+    scan = weekly_scan_candles(data, starts, ends)
+    bars = weekly_bars(data)
+    
+    # الشروط متتالية: كل شرط يحسب فقط للأسهم التي اجتازت ما قبله
+    passed = scan['green']
+    passed_green = int(passed.sum())
+    passed &= scan['short_shadow']
+    passed_shadow = int(passed.sum())
+    passed &= scan['near_peak']
+    passed_peak = int(passed.sum())
+    passed &= scan['volume_up']
+    passed_volume = int(passed.sum())
+    
+    matched = np.flatnonzero(passed)
+    symbols = scan['symbols'][matched]
+    week = scan['week'][matched]
+    names = symbol_names([data.symbols[i] for i in symbols], symbols_map)
+    
+    results = []
+    for k, i, w, name in zip(matched, symbols, week, names):
+        open_p, close_p = float(bars['open'][w]), float(bars['close'][w])
+        volume = float(bars['volume'][w])
+        max_prev_volume = float(scan['prev_volume'][k])
+        volume_ratio = (volume / max_prev_volume) if max_prev_volume > 0 else 1
+        results.append({
+            'symbol': data.symbols[i],
+            'name': name,
+            'close': round(close_p, 2),
+            'open': round(open_p, 2),
+            'high': round(float(bars['high'][w]), 2),
+            'low': round(float(bars['low'][w]), 2),
+            'volume': int(volume),
+            'prev_volume': int(max_prev_volume),
+            'volume_ratio': round(float(volume_ratio), 2),
+            'highest_6m': round(float(scan['highest'][k]), 2),
+            'change_percent': round(float((close_p - open_p) / open_p) * 100, 2),
+            'date': str(scan['label'][k])
+        })
+    
+    # ترتيب النتائج حسب نسبة التغيير
+    results.sort(key=lambda x: x['change_percent'], reverse=True)
+    
+    # طباعة إحصائيات الفحص
+    total_stocks = len(data.symbols)
+    print(f"\n=== Weekly Scan Stats for {market.upper()} ===")
+    print(f"Total stocks checked: {total_stocks}")
+    print(f"Passed green candle: {passed_green}")
+    print(f"Passed short shadow: {passed_shadow}")
+    print(f"Passed peak level: {passed_peak}")
+    print(f"Passed volume increase: {passed_volume}")
+    print(f"Final results: {len(results)}")
+    print("=" * 40)
+    
+    result = {
+        'success': True,
+        'market': market,
+        'count': len(results),
+        'results': results,
+        'stats': {
+            'total_checked': total_stocks,
+            'passed_green': passed_green,
+            'passed_shadow': passed_shadow,
+            'passed_peak': passed_peak,
+            'passed_volume': passed_volume
+        }
+    }
+    if as_of is not None:
+        result['as_of'] = str(as_of)
+    return result
 
 
 @app.route('/api/scan/weekly/<market>', methods=['GET'])
 def weekly_scan(market):
     """
-    فحص أسبوعي للأسهم بناءً على شروط محددة - محسّن للسرعة
-    1. شمعة خضراء بإغلاق قريب من الأعلى
-    2. الإغلاق متجاوز أو على حدود قمة سابقة (6 أشهر)
-    3. الحجم أكبر من الشمعة السابقة
+    فحص أسبوعي للأسهم - من الذاكرة أو الحساب المسبق
+    
+    ?as_of=YYYY-MM-DD: ما كان الفحص سيظهره في ذلك التاريخ
     """
     try:
         # التحقق من السوق
         if market not in ['saudi', 'us']:
             return jsonify({'error': 'Invalid market'}), 400
         
-        results = []
-        total_stocks = 0
-        passed_green = 0
-        passed_shadow = 0
-        passed_peak = 0
-        passed_volume = 0
+        fmt, error = requested_format()
+        if error:
+            return error
+        try:
+            as_of = parse_date_arg('as_of')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # تحميل خريطة الأسماء للسوق السعودي
-        symbols_map = {}
-        if market == 'saudi':
-            try:
-                symbols_path = os.path.join(BASE_DIR, 'symbols_sa.txt')
-                if os.path.exists(symbols_path):
-                    df_sym = pd.read_csv(symbols_path)
-                    for _, row in df_sym.iterrows():
-                        full_symbol = str(row['Symbol']).strip()
-                        name = str(row['NameAr']).strip()
-                        symbols_map[full_symbol] = name
-                        if full_symbol.endswith('.SR'):
-                            symbols_map[full_symbol.replace('.SR', '')] = name
-            except Exception as e:
-                print(f"Warning: Could not load Saudi symbols: {e}")
+        return scan_response(get_scan('weekly', market, as_of), fmt)
         
-        # استعلام واحد لجميع بيانات السوق (آخر 6 أشهر)
-        if USE_SUPABASE:
-            try:
-                from supabase_client import get_supabase_client
-                from datetime import datetime, timedelta
-                
-                client = get_supabase_client()
-                if client:
-                    print(f"Fetching all {market} market data for weekly scan...")
-                    
-                    # جلب 6 أشهر لكلا السوقين (الفلترة الأسبوعية تحتاج بيانات أكثر)
-                    six_months_ago = (datetime.now() - timedelta(days=180)).strftime('%Y-%m-%d')
-                    
-                    all_data = []
-                    limit = 1000
-                    offset = 0
-                    
-                    while True:
-                        result = client.table('stock_data')\
-                            .select('symbol, date, open, high, low, close, volume')\
-                            .eq('market', market)\
-                            .gte('date', six_months_ago)\
-                            .order('symbol')\
-                            .order('date')\
-                            .range(offset, offset + limit - 1)\
-                            .execute()
-                        
-                        if not result.data:
-                            break
-                        
-                        all_data.extend(result.data)
-                        
-                        if len(result.data) < limit:
-                            break
-                        
-                        offset += limit
-                    
-                    if not all_data:
-                        return jsonify({
-                            'results': [],
-                            'stats': {
-                                'total_checked': 0,
-                                'passed_green': 0,
-                                'passed_shadow': 0,
-                                'passed_peak': 0,
-                                'passed_volume': 0
-                            }
-                        })
-                    
-                    print(f"Fetched {len(all_data)} records, processing weekly patterns...")
-                    
-                    # تحويل إلى DataFrame للمعالجة السريعة
-                    df_all = pd.DataFrame(all_data)
-                    df_all['date'] = pd.to_datetime(df_all['date'])
-                    df_all = df_all.sort_values(['symbol', 'date'])
-                    
-                    symbols = df_all['symbol'].unique()
-                    
-                    # فحص كل سهم
-                    for symbol in symbols:
-                        total_stocks += 1
-                        
-                        try:
-                            # استخراج بيانات السهم من DataFrame الكبير (سريع!)
-                            symbol_data = df_all[df_all['symbol'] == symbol].copy()
-                            
-                            if len(symbol_data) < 30:  # نحتاج بيانات كافية
-                                continue
-                            
-                            # تحويل لصيغة DataFrame المطلوبة
-                            symbol_data = symbol_data.rename(columns={
-                                'date': 'Date',
-                                'open': 'Open',
-                                'high': 'High',
-                                'low': 'Low',
-                                'close': 'Close',
-                                'volume': 'Volume'
-                            })
-                            
-                            # تحويل لبيانات أسبوعية
-                            symbol_data.set_index('Date', inplace=True)
-                            weekly = symbol_data.resample('W').agg({
-                                'Open': 'first',
-                                'High': 'max',
-                                'Low': 'min',
-                                'Close': 'last',
-                                'Volume': 'sum'
-                            }).dropna()
-                            
-                            if len(weekly) < 26:  # نحتاج 6 أشهر على الأقل (~26 أسبوع)
-                                continue
-                            
-                            # استخدام الأسبوع قبل الأخير (المكتمل) بدلاً من الأخير (قد يكون غير مكتمل)
-                            last_candle = weekly.iloc[-2]  # الأسبوع المكتمل الأخير
-                            prev_candle = weekly.iloc[-3]
-                            prev_prev_candle = weekly.iloc[-4]
-                            
-                            # الشرط 1: شمعة خضراء بإغلاق قريب من الأعلى
-                            is_green = last_candle['Close'] > last_candle['Open']
-                            
-                            if not is_green:
-                                continue
-                            
-                            passed_green += 1
-                            
-                            body_size = abs(last_candle['Close'] - last_candle['Open'])
-                            upper_shadow = last_candle['High'] - max(last_candle['Open'], last_candle['Close'])
-                            
-                            if body_size > 0:
-                                has_short_upper_shadow = upper_shadow < (body_size * 0.3)
-                            else:
-                                has_short_upper_shadow = upper_shadow < 0.01
-                            
-                            if not has_short_upper_shadow:
-                                continue
-                            
-                            passed_shadow += 1
-                            
-                            # الشرط 2: الإغلاق متجاوز أو على حدود قمة سابقة (6 أشهر)
-                            last_6_months = weekly.iloc[-27:-2]  # تعديل النطاق لأننا نستخدم -2 الآن
-                            highest_in_6months = last_6_months['High'].max()
-                            
-                            close_near_or_above_peak = last_candle['Close'] >= (highest_in_6months * 0.98)
-                            
-                            if not close_near_or_above_peak:
-                                continue
-                            
-                            passed_peak += 1
-                            
-                            # الشرط 3: الحجم أكبر من أي من الشمعتين السابقتين
-                            volume_increased = (last_candle['Volume'] > prev_candle['Volume']) or \
-                                               (last_candle['Volume'] > prev_prev_candle['Volume'])
-                            
-                            if not volume_increased:
-                                continue
-                            
-                            passed_volume += 1
-                            
-                            # جميع الشروط تحققت!
-                            max_prev_volume = max(prev_candle['Volume'], prev_prev_candle['Volume'])
-                            volume_ratio = (last_candle['Volume'] / max_prev_volume) if max_prev_volume > 0 else 1
-                            
-                            # الحصول على الاسم العربي للسوق السعودي
-                            stock_name = symbol
-                            if market == 'saudi':
-                                clean_sym = symbol.replace('.SR', '')
-                                stock_name = symbols_map.get(symbol, symbols_map.get(clean_sym, symbol))
-                            
-                            results.append({
-                                'symbol': symbol,
-                                'name': stock_name,
-                                'close': round(float(last_candle['Close']), 2),
-                                'open': round(float(last_candle['Open']), 2),
-                                'high': round(float(last_candle['High']), 2),
-                                'low': round(float(last_candle['Low']), 2),
-                                'volume': int(last_candle['Volume']),
-                                'prev_volume': int(max_prev_volume),
-                                'volume_ratio': round(float(volume_ratio), 2),
-                                'highest_6m': round(float(highest_in_6months), 2),
-                                'change_percent': round(((last_candle['Close'] - last_candle['Open']) / last_candle['Open']) * 100, 2),
-                                'date': weekly.index[-1].strftime('%Y-%m-%d')
-                            })
-                            
-                        except Exception as e:
-                            print(f"Error processing {symbol}: {e}")
-                            continue
-                    
-                    # ترتيب النتائج حسب نسبة التغيير
-                    results.sort(key=lambda x: x['change_percent'], reverse=True)
-                    
-                    # طباعة إحصائيات الفحص
-                    print(f"\n=== Weekly Scan Stats for {market.upper()} ===")
-                    print(f"Total stocks checked: {total_stocks}")
-                    print(f"Passed green candle: {passed_green}")
-                    print(f"Passed short shadow: {passed_shadow}")
-                    print(f"Passed peak level: {passed_peak}")
-                    print(f"Passed volume increase: {passed_volume}")
-                    print(f"Final results: {len(results)}")
-                    print("=" * 40)
-                    
-                    return jsonify({
-                        'success': True,
-                        'market': market,
-                        'count': len(results),
-                        'results': results,
-                        'stats': {
-                            'total_checked': total_stocks,
-                            'passed_green': passed_green,
-                            'passed_shadow': passed_shadow,
-                            'passed_peak': passed_peak,
-                            'passed_volume': passed_volume
-                        }
-                    })
-            
-            except Exception as e:
-                print(f"Supabase weekly scan error: {e}")
-                # Fall back to CSV method
+    except Exception as e:
+        print(f"Error in weekly scan: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+def compute_custom_scan(market, node, as_of=None):
+    """
+    فحص مخصص: الرموز التي يتحقق فيها الشرط في آخر شمعة (أو آخر شمعة في as_of أو قبله)
+    
+    Args:
+        node: شرط محلل (screener.compile_expression)
+    """
+    data = market_store.get(market)
+    rows = data.as_of_rows(as_of if as_of is not None else data.trading_dates[-1]) \
+        if len(data.date) else np.array([], dtype=np.int64)
+    has_row = rows >= data.offsets[:-1]
+    symbols = np.flatnonzero(has_row)
+    rows = rows[has_row]
+    
+    matches = evaluate_expression(data, node, rows)
+    symbols, rows = symbols[matches], rows[matches]
+    names = symbol_names([data.symbols[i] for i in symbols], load_symbols_map(market))
+    prev_close = data.close[np.maximum(rows - 1, data.offsets[symbols])]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change_pct = np.where(prev_close > 0, (data.close[rows] - prev_close) / prev_close * 100, 0.0)
+    
+    results = [{
+        'symbol': data.symbols[i],
+        'name': name,
+        'date': str(data.date[r]),
+        'close': round(float(data.close[r]), 2),
+        'change_percent': round(float(change), 2),
+        'volume': int(data.volume[r]),
+    } for i, r, name, change in zip(symbols, rows, names, change_pct)]
+    
+    print(f"Custom scan complete: {len(rows)} of {len(has_row)} stocks match {expression_text(node)}")
+    result = {
+        'expression': expression_text(node),
+        'results': results,
+        'scanned': int(has_row.sum()),
+        'total': len(data.symbols)
+    }
+    if as_of is not None:
+        result['as_of'] = str(as_of)
+    return result
+
+
+@app.route('/api/scan/custom', methods=['GET'])
+def custom_scan():
+    """
+    فحص بشرط يكتبه المستخدم (لغة screener) على جميع الرموز - من الذاكرة
+    
+    ?market=saudi&expr=close > sma(50) and volume > 1.5 * avg_volume(20)&as_of=YYYY-MM-DD
+    """
+    try:
+        market = request.args.get('market', 'saudi')
+        if market not in ['saudi', 'us']:
+            return jsonify({'error': 'Invalid market'}), 400
+        fmt, error = requested_format()
+        if error:
+            return error
+        try:
+            as_of = parse_date_arg('as_of')
+            node = compile_expression(request.args.get('expr'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # CSV Fallback (for local development)
-        print("Using CSV fallback for weekly scan...")
-        # Return empty for now as CSV won't be available on Render
-        return jsonify({
-            'success': False,
-            'error': 'Supabase connection failed',
-            'results': [],
-            'stats': {
-                'total_checked': 0,
-                'passed_green': 0,
-                'passed_shadow': 0,
-                'passed_peak': 0,
-                'passed_volume': 0
-            }
-        })
+        data = market_store.get(market)
+        # نفس الشرط بصياغة مختلفة (مسافات أو أقواس) يستخدم نفس النتيجة
+        variant = f"{expression_text(node)}:{as_of}"
+        try:
+            result = scan_cache.get('custom', market, data.version,
+                                    lambda: compute_custom_scan(market, node, as_of), variant=variant)
+        except ScreenerError as e:
+            return jsonify({'error': str(e)}), 400
+        return scan_response(result, fmt)
         
     except Exception as e:
-        print(f"Error in weekly scan: {e}")
+        print(f"Error in custom scan: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+# دوال الحساب لكل فحص (تستخدم للطلبات وللحساب المسبق بعد التحديث)
+SCAN_FUNCTIONS = {
+    'fibo_gann': compute_fibo_gann_scan,
+    'weekly': compute_weekly_scan,
+}
+
+
+def get_scan(name, market, as_of=None):
+    """نتيجة الفحص من الذاكرة، أو حسابها إذا تغيرت بيانات السوق (لكل تاريخ as_of نتيجة مستقلة)"""
+    data = market_store.get(market)
+    return scan_cache.get(name, market, data.version, lambda: SCAN_FUNCTIONS[name](market, as_of),
+                          variant=str(as_of) if as_of is not None else None)
+
+
+# أقصى عدد آفاق في طلب الاختبار التاريخي
+BACKTEST_MAX_HORIZONS = 10
+
+
+@app.route('/api/backtest/<market>', methods=['GET'])
+def backtest_scan(market):
+    """
+    اختبار تاريخي لقاعدة فحص على جميع الرموز وجميع التواريخ (من بيانات السوق في الذاكرة)
+    
+    ?rule=fibo_gann|weekly&horizons=5,10,20&start=YYYY-MM-DD&end=YYYY-MM-DD
+    """
+    if market not in ['saudi', 'us']:
+        return jsonify({'error': 'Invalid market'}), 400
+    rule = request.args.get('rule', 'fibo_gann')
+    if rule not in BACKTEST_RULES:
+        return jsonify({'error': f"rule must be one of: {', '.join(BACKTEST_RULES)}"}), 400
+    try:
+        start = parse_date_arg('start')
+        end = parse_date_arg('end')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        horizons = sorted({int(h) for h in request.args.get('horizons', '').split(',') if h.strip()}) \
+            or list(DEFAULT_HORIZONS)
+    except ValueError:
+        return jsonify({'error': 'horizons must be comma separated integers'}), 400
+    if len(horizons) > BACKTEST_MAX_HORIZONS or not all(1 <= h <= MAX_HORIZON for h in horizons):
+        return jsonify({'error': f'At most {BACKTEST_MAX_HORIZONS} horizons between 1 and {MAX_HORIZON}'}), 400
+    
+    try:
+        data = market_store.get(market)
+        variant = f"{rule}:{','.join(map(str, horizons))}:{start}:{end}"
+        result = scan_cache.get('backtest', market, data.version,
+                                lambda: run_backtest(data, rule, market, horizons, start, end), variant=variant)
+        return jsonify(result)
+    except Exception as e:
+        print(f"Error in backtest: {e}")
         return jsonify({'error': str(e)}), 500
 
 
+def scan_response(result, fmt):
+    """رد الفحص: json كما هو، أو النتائج كأعمدة مع باقي الحقول"""
+    if fmt == 'json':
+        return jsonify(result)
+    meta = {key: value for key, value in result.items() if key != 'results'}
+    return columnar_response(records_to_columns(result['results']), fmt, meta=meta)
+
+
+def precompute_scans(market):
+    """حساب جميع الفحوصات مسبقاً بعد تحديث بيانات السوق"""
+    data = market_store.get(market)
+    timings = {}
+    for name, compute in SCAN_FUNCTIONS.items():
+        try:
+            entry = scan_cache.compute(name, market, data.version, lambda: compute(market))
+            timings[name] = entry['elapsed_ms']
+        except Exception as e:
+            print(f"Precompute {name} scan failed for {market}: {e}")
+    return timings
+
+
 @app.route('/api/test/supabase', methods=['GET'])
 def test_supabase():
     """Test Supabase connection and data"""
@@ -1523,10 +1982,15 @@ if __name__ == '__main__':
     print("  - POST /api/fetch/saudi         Fetch Saudi data [AUTH]")
     print("  - POST /api/fetch/us            Fetch US data [AUTH]")
     print("  - GET  /api/market-summary      Market summary")
+    print("  - GET  /api/market-summary/stream  Market summary stream (SSE)")
     print("  - GET  /api/status/<job_id>     Job status [AUTH]")
+    print("  - GET  /api/status/<id>/stream  Job progress stream (SSE) [AUTH]")
     print("  - GET  /api/jobs                List jobs [AUTH]")
+    print("  - GET  /api/jobs/queue          Fetch queue [AUTH]")
+    print("  - GET  /api/schedule            Scheduled refresh status")
     print("  - GET  /api/symbols/<market>    Get symbols")
     print("  - GET  /api/history/<market>    Get history")
+    print("  - GET  /api/history/<market>?symbols=  Batch history")
     print("  - GET  /api/scan/fibo_gann      Scan opportunities")
     print("  - GET  /api/scan/weekly         Weekly scan")
     print("  - GET  /api/market-data         Market data")
@@ -1541,11 +2005,14 @@ if __name__ == '__main__':
     try:
         from initialize_data import initialize_data
         print("\n🔍 Checking for data files...")
-        initialize_data(background=True)
+        initialize_data(background=True, on_market_done=refresh_market)
     except Exception as e:
         print(f"⚠️  Could not initialize data: {e}")
         print("You can manually update data from the web interface.")
     
+    start_refresh_scheduler()
+    summary_poller.start()
+    
     print("\n" + "=" * 50)
     print("🚀 SERVER READY")
     print("=" * 50)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Backtest for MeshalStock
+اختبار تاريخي لإشارات فحص فيبو/جان والفحص الأسبوعي
+
+الإشارات لكل رمز في كل تاريخ من scan_rules (مرور واحد على مصفوفات السوق)،
+ثم العائد بعد عدد أيام تداول محدد (horizons) من إغلاق يوم الإشارة،
+مع نسبة النجاح (عائد موجب) ومقارنة بعائد جميع الأيام في نفس الفترة.
+
+مثال:
+    python backtest.py saudi --rule fibo_gann --horizons 5,10,20
+    python backtest.py us --rule weekly --start 2024-01-01 --end 2024-12-31
+"""
+
+import json
+import argparse
+
+import numpy as np
+
+import scan_rules
+from market_store import KEY_STRIDE, load_market_from_csv
+
+RULES = ('fibo_gann', 'weekly')
+DEFAULT_HORIZONS = (5, 10, 20)
+MAX_HORIZON = 250
+
+
+def rule_signals(data, rule, market):
+    """
+    إشارات القاعدة مع تصنيف كل إشارة
+
+    Returns:
+        (rows, groups) - groups: dict اسم التصنيف -> قيمة لكل إشارة (مثل kind و level لفيبو/جان)
+    """
+    if rule == 'fibo_gann':
+        signals = scan_rules.fibo_gann_signals(data, scan_rules.FIBO_GANN_DAYS[market])
+        kinds = np.where(signals['breakout'], 'breakout', 'bounce')
+        levels = np.array(scan_rules.LEVEL_TYPES, dtype=object)[signals['level']]
+        return signals['rows'], {'kind': kinds, 'level': levels}
+    if rule == 'weekly':
+        return scan_rules.weekly_signals(data)['rows'], {}
+    raise ValueError(f"rule must be one of: {', '.join(RULES)}")
+
+
+def forward_returns(data, rows, horizons):
+    """
+    العائد (%) من إغلاق الصف حتى إغلاق الصف بعد h يوم تداول لنفس الرمز (NaN إذا لم يصل)
+
+    Returns:
+        dict: h -> np.ndarray
+    """
+    symbol_end = data.offsets[1:][data.row_keys[rows] // KEY_STRIDE]
+    entry = data.close[rows]
+    returns = {}
+    for h in horizons:
+        target = rows + h
+        valid = (target < symbol_end) & (entry > 0)
+        ret = np.full(len(rows), np.nan)
+        ret[valid] = (data.close[target[valid]] / entry[valid] - 1) * 100
+        returns[h] = ret
+    return returns
+
+
+def summarize(returns):
+    """إحصائيات العوائد لكل أفق: العدد والمتوسط والوسيط ونسبة النجاح"""
+    summary = {}
+    for h, ret in returns.items():
+        ret = ret[np.isfinite(ret)]
+        summary[str(h)] = {
+            'count': int(len(ret)),
+            'mean_return': round(float(ret.mean()), 3) if len(ret) else None,
+            'median_return': round(float(np.median(ret)), 3) if len(ret) else None,
+            'hit_rate': round(float((ret > 0).mean() * 100), 2) if len(ret) else None,
+        }
+    return summary
+
+
+def run_backtest(data, rule, market, horizons=DEFAULT_HORIZONS, start=None, end=None, recent=20):
+    """
+    اختبار تاريخي لقاعدة فحص على بيانات سوق كاملة
+
+    Args:
+        data: MarketData
+        rule: 'fibo_gann' أو 'weekly'
+        market: 'saudi' or 'us' (لنافذة فيبو/جان)
+        horizons: أيام التداول بعد الإشارة
+        start / end: np.datetime64 - فترة تواريخ الإشارات (None = الكل)
+        recent: عدد آخر الإشارات المعادة في النتيجة
+
+    Returns:
+        dict: signals، horizons (الإحصائيات)، baseline (جميع الأيام)، groups، recent
+    """
+    horizons = sorted(set(int(h) for h in horizons))
+    rows, groups = rule_signals(data, rule, market)
+
+    in_range = np.ones(len(data.date), dtype=bool)
+    if start is not None:
+        in_range &= data.date >= start
+    if end is not None:
+        in_range &= data.date <= end
+    keep = in_range[rows]
+    rows = rows[keep]
+    groups = {name: values[keep] for name, values in groups.items()}
+
+    returns = forward_returns(data, rows, horizons)
+    baseline = forward_returns(data, np.flatnonzero(in_range), horizons)
+
+    by_group = {}
+    for name, values in groups.items():
+        by_group[name] = {
+            str(value): summarize({h: ret[values == value] for h, ret in returns.items()})
+            for value in np.unique(values)
+        }
+
+    symbols = np.array(data.symbols, dtype=object)
+    latest = rows[np.argsort(data.date[rows], kind='stable')[::-1][:recent]]
+    return {
+        'rule': rule,
+        'market': market,
+        'signals': int(len(rows)),
+        'symbols': int(len(np.unique(data.row_keys[rows] // KEY_STRIDE))),
+        'start': str(data.date[rows].min()) if len(rows) else None,
+        'end': str(data.date[rows].max()) if len(rows) else None,
+        'horizons': summarize(returns),
+        'baseline': summarize(baseline),
+        'groups': by_group,
+        'recent': [
+            {'symbol': symbols[data.row_keys[r] // KEY_STRIDE], 'date': str(data.date[r]),
+             'close': round(float(data.close[r]), 2)}
+            for r in latest
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backtest the Fibo/Gann and weekly scan rules')
+    parser.add_argument('market', choices=['saudi', 'us'])
+    parser.add_argument('--rule', choices=RULES, default='fibo_gann')
+    parser.add_argument('--horizons', type=str, default=','.join(str(h) for h in DEFAULT_HORIZONS),
+                        help='Comma separated trading-day horizons')
+    parser.add_argument('--start', type=str, help='First signal date (YYYY-MM-DD)')
+    parser.add_argument('--end', type=str, help='Last signal date (YYYY-MM-DD)')
+    parser.add_argument('--recent', type=int, default=20, help='Number of latest signals to list')
+    args = parser.parse_args()
+
+    data = load_market_from_csv(args.market)
+    result = run_backtest(
+        data, args.rule, args.market,
+        horizons=[int(h) for h in args.horizons.split(',') if h.strip()],
+        start=np.datetime64(args.start, 'D') if args.start else None,
+        end=np.datetime64(args.end, 'D') if args.end else None,
+        recent=args.recent
+    )
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark for MeshalStock scan kernels
+مقارنة نسخ نوى الفحص (scan_kernels) على بيانات السوق من ملفات CSV
+
+المقاطع: نافذة فيبو/جان لكل رمز في آخر عدد من تواريخ التداول (مثل تشغيل الفحص بـ as_of لكل تاريخ)،
+ثم المستويات وفحص آخر شمعة لكل مقطع. يتحقق أيضاً من تطابق نتائج جميع النسخ.
+
+مثال:
+    python benchmark_scans.py saudi
+    python benchmark_scans.py us --dates 60 --repeat 10 --python
+"""
+
+import time
+import argparse
+
+import numpy as np
+
+import scan_kernels
+from market_store import KEY_STRIDE, load_market_from_csv
+from scan_rules import FIBO_GANN_DAYS, PEAK_SEARCH_BARS
+
+
+def scan_segments(data, days, dates):
+    """
+    حدود نافذة الأيام لكل رمز في كل تاريخ من آخر dates تاريخ تداول
+
+    Returns:
+        (starts, ends) - مقطع لكل (تاريخ، رمز) له صفوف
+    """
+    symbol_ids = np.arange(len(data.symbols), dtype=np.int64)
+    starts, ends = [], []
+    for as_of in data.trading_dates[-dates:]:
+        end = data.as_of_rows(as_of) + 1
+        cutoff = (as_of - np.timedelta64(days, 'D')).astype(np.int64)
+        start = np.minimum(np.searchsorted(data.row_keys, symbol_ids * KEY_STRIDE + cutoff), end)
+        starts.append(start)
+        ends.append(end)
+    starts, ends = np.concatenate(starts), np.concatenate(ends)
+    keep = ends > starts
+    return starts[keep], ends[keep]
+
+
+def run_kernels(kernels, data, starts, ends):
+    """تشغيل النوى الثلاث بالتسلسل (نفس خطوات compute_fibo_gann_scan)"""
+    min_idx, peak_idx = kernels['first_peaks'](data.low, data.high, starts, ends, PEAK_SEARCH_BARS)
+    found = peak_idx >= 0
+    min_idx, peak_idx = min_idx[found], peak_idx[found]
+    last = ends[found] - 1
+    levels = kernels['level_values'](data.low[min_idx], data.high[peak_idx])
+    level, breakout = kernels['candle_levels'](data.open[last], data.high[last], data.low[last],
+                                               data.close[last], levels)
+    return {'peak_idx': peak_idx, 'levels': levels, 'level': level, 'breakout': breakout}
+
+
+def best_time(func, repeat):
+    """أفضل زمن (بالثواني) من repeat تشغيل"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Fibo/Gann scan kernels (Numba vs NumPy)')
+    parser.add_argument('market', choices=['saudi', 'us'])
+    parser.add_argument('--dates', type=int, default=20, help='Number of latest trading dates to scan')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per implementation (best time is reported)')
+    parser.add_argument('--python', action='store_true', help='Include the uncompiled Python loops')
+    args = parser.parse_args()
+
+    data = load_market_from_csv(args.market)
+    starts, ends = scan_segments(data, FIBO_GANN_DAYS[args.market], max(args.dates, 1))
+    print(f"📊 {args.market}: {len(data.symbols)} رمز، {len(data.date)} صف، {len(starts)} مقطع")
+    if not scan_kernels.JIT_AVAILABLE:
+        print("⚠️ Numba غير مثبتة (pip install numba) - المقارنة لنسخة NumPy فقط")
+
+    implementations = dict(scan_kernels.IMPLEMENTATIONS)
+    if args.python:
+        implementations['python'] = {
+            'first_peaks': scan_kernels._first_peaks_loop,
+            'level_values': scan_kernels._level_values_loop,
+            'candle_levels': scan_kernels._candle_levels_loop,
+        }
+
+    results = {}
+    for name, kernels in implementations.items():
+        # التشغيل الأول يشمل ترجمة Numba (أو تحميلها من الذاكرة المؤقتة)
+        start = time.perf_counter()
+        results[name] = run_kernels(kernels, data, starts, ends)
+        first_run = time.perf_counter() - start
+        elapsed = best_time(lambda: run_kernels(kernels, data, starts, ends), 1 if name == 'python' else args.repeat)
+        print(f"  {name:<8} {elapsed * 1000:10.2f} ms   (التشغيل الأول {first_run * 1000:.1f} ms)")
+
+    reference = results['numpy']
+    for name, result in results.items():
+        same = all(np.array_equal(result[key], reference[key]) for key in ('peak_idx', 'level', 'breakout')) \
+            and np.allclose(result['levels'], reference['levels'], rtol=0, atol=1e-9)
+        print(f"  {name:<8} {'✅ مطابق' if same else '❌ مختلف'} لنسخة numpy"
+              f" ({int((result['level'] >= 0).sum())} إشارة)")
+
+    print(f"النسخة المستخدمة في الخادم: {scan_kernels.active_implementation()}")
+
+
+if __name__ == "__main__":
+    main()
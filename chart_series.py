@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Chart Series for MeshalStock
+تجهيز بيانات الرسم البياني على الخادم: تجميع الشموع (يومي/أسبوعي/شهري/ربع سنوي/N يوم)
+وتقليل عدد النقاط مع الحفاظ على شكل المنحنى (LTTB)
+
+جميع الدوال تعمل على dict من مصفوفات numpy بالمفاتيح:
+    date (datetime64[D]), open, high, low, close, volume
+مرتبة حسب التاريخ.
+"""
+
+import numpy as np
+
+from market_bars import TIMEFRAMES, parse_timeframe, period_keys, period_labels, reduce_groups
+
+RESOLUTIONS = ('daily',) + TIMEFRAMES
+FIELDS = ('date', 'open', 'high', 'low', 'close', 'volume')
+
+
+def check_resolution(resolution):
+    """
+    التحقق من الدقة: daily أو weekly/monthly/quarterly أو Nd (كل N يوم تداول)
+
+    Raises:
+        ValueError: دقة غير معروفة
+    """
+    if resolution == 'daily':
+        return
+    try:
+        parse_timeframe(resolution)
+    except ValueError:
+        raise ValueError(f"resolution must be one of: {', '.join(RESOLUTIONS)} or Nd (e.g. 5d)") from None
+
+
+def aggregate(series, resolution, trading_dates=None):
+    """
+    تجميع الشموع اليومية إلى أسبوعية (تبدأ الأحد: تشمل أسبوع تداول السعودية الأحد-الخميس
+    وأمريكا الاثنين-الجمعة) أو شهرية أو ربع سنوية أو كل N يوم تداول (market_bars)
+
+    Args:
+        trading_dates: تواريخ التداول في السوق (مطلوبة لـ Nd)
+
+    Returns:
+        dict بنفس المفاتيح، date = بداية الفترة
+        (المفاتيح الأخرى مثل المؤشرات الفنية: قيمة آخر يوم في الفترة)
+    """
+    if resolution == 'daily' or len(series['date']) == 0:
+        return series
+    keys = period_keys(series['date'], resolution, 'sunday', trading_dates)
+    result, starts, ends = reduce_groups(series, keys)
+    result['date'] = period_labels(keys[starts], resolution, 'sunday', trading_dates)
+    result.update({field: values[ends] for field, values in series.items() if field not in FIELDS})
+    return result
+
+
+def lttb_indices(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets: اختيار threshold نقطة تحافظ على شكل المنحنى
+
+    Args:
+        x: مصفوفة أرقام متزايدة (مثلاً أيام)
+        y: القيم
+        threshold: عدد النقاط المطلوب (>= 3)
+
+    Returns:
+        مصفوفة فهارس النقاط المختارة (تشمل الأولى والأخيرة)
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    # حدود الحاويات للنقاط الوسطى (بدون الأولى والأخيرة)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # متوسط الحاوية التالية (أو النقطة الأخيرة)
+        next_start, next_end = end, edges[i + 2] if i + 2 < len(edges) else n
+        if next_end <= next_start:
+            next_end = next_start + 1
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        # مساحة المثلث مع النقطة المختارة السابقة ومتوسط الحاوية التالية
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def downsample(series, points):
+    """تقليل عدد الشموع إلى points نقطة بخوارزمية LTTB على سعر الإغلاق"""
+    if not points or len(series['date']) <= points:
+        return series
+    x = series['date'].astype('datetime64[D]').astype(np.int64)
+    indices = lttb_indices(x, series['close'], points)
+    return {field: values[indices] for field, values in series.items()}
+
+
+def shape_series(series, resolution='daily', points=None, trading_dates=None):
+    """تجميع ثم تقليل النقاط"""
+    return downsample(aggregate(series, resolution, trading_dates), points)
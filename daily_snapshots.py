@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Daily Snapshots for MeshalStock
+لقطة مضغوطة لكل يوم تداول لكل سوق (للتصفح حسب التاريخ بدون إعادة بناء اللقطة من التاريخ الكامل)
+
+ملف CSV لكل يوم: snapshots_sa/YYYY-MM-DD.csv و snapshots_us/YYYY-MM-DD.csv
+بالأعمدة: symbol, close, prev_close, change_percent, volume
+ونسخة بنفس المحتوى (عمودياً) في جدول market_snapshots في Supabase.
+
+تكتب من مسار الجلب (ingest_engine) بعد كل عملية تضيف بيانات.
+"""
+
+import os
+import bisect
+
+import numpy as np
+import pandas as pd
+
+from market_snapshot import snapshot_rows
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SNAPSHOT_DIRS = {
+    'saudi': os.path.join(BASE_DIR, 'snapshots_sa'),
+    'us': os.path.join(BASE_DIR, 'snapshots_us'),
+}
+
+SNAPSHOT_COLUMNS = ['symbol', 'close', 'prev_close', 'change_percent', 'volume']
+
+
+def build_daily_snapshots(data, since=None):
+    """
+    لقطة كل يوم تداول من مصفوفات السوق
+
+    نفس صفوف اللقطة المحسوبة من الذاكرة لنفس التاريخ (market_snapshot.snapshot_rows):
+    آخر صف لكل رمز في اليوم أو قبله، للرموز ذات صفين على الأقل.
+
+    Args:
+        data: MarketData
+        since: np.datetime64 - الأيام من هذا التاريخ فقط (None = جميع الأيام)
+
+    Yields:
+        (date 'YYYY-MM-DD', DataFrame بأعمدة SNAPSHOT_COLUMNS)
+    """
+    if len(data.date) == 0:
+        return
+    symbols = np.array(data.symbols, dtype=object)
+    dates = data.trading_dates if since is None else data.trading_dates[data.trading_dates >= since]
+
+    for date in dates:
+        rows, last, prev = snapshot_rows(data, date)
+        close = data.close[last]
+        prev_close = data.close[prev]
+        yield str(date), pd.DataFrame({
+            'symbol': symbols[rows],
+            # بدون تقريب هنا: التقريب مرة واحدة عند العرض (مثل اللقطة المحسوبة من الذاكرة)
+            'close': close,
+            'prev_close': prev_close,
+            'change_percent': (close - prev_close) / prev_close * 100,
+            'volume': data.volume[last].astype(np.int64),
+        })
+
+
+def write_daily_snapshots(market, data, since=None):
+    """
+    حفظ لقطات الأيام محلياً (الملفات غير المتغيرة لا يعاد كتابتها)
+
+    Returns:
+        dict: date -> DataFrame للأيام التي تغيرت (للرفع إلى Supabase)
+    """
+    directory = SNAPSHOT_DIRS[market]
+    os.makedirs(directory, exist_ok=True)
+    changed = {}
+    for date, frame in build_daily_snapshots(data, since):
+        text = frame.to_csv(index=False)
+        path = os.path.join(directory, f"{date}.csv")
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8', newline='') as f:
+                if f.read() == text:
+                    continue
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+        changed[date] = frame
+    return changed
+
+
+def snapshot_dates(market):
+    """تواريخ اللقطات المحفوظة محلياً (مرتبة تصاعدياً)"""
+    directory = SNAPSHOT_DIRS[market]
+    if not os.path.exists(directory):
+        return []
+    return sorted(name[:-4] for name in os.listdir(directory) if name.endswith('.csv'))
+
+
+def load_daily_snapshot(market, target_date):
+    """
+    لقطة آخر يوم تداول في target_date أو قبله (قراءة ملف واحد)
+
+    Returns:
+        (date 'YYYY-MM-DD', DataFrame) أو None
+    """
+    dates = snapshot_dates(market)
+    i = bisect.bisect_right(dates, str(target_date))
+    if i == 0:
+        return None
+    date = dates[i - 1]
+    try:
+        frame = pd.read_csv(os.path.join(SNAPSHOT_DIRS[market], f"{date}.csv"), dtype={'symbol': str})
+    except (OSError, ValueError, pd.errors.EmptyDataError) as e:
+        print(f"⚠ Could not read {market} snapshot {date}: {e}")
+        return None
+    return date, frame
+
+
+def frame_to_columns(frame):
+    """DataFrame اللقطة -> أعمدة (قوائم) لتخزينها كـ JSON في Supabase"""
+    return {column: frame[column].tolist() for column in SNAPSHOT_COLUMNS}
+
+
+def columns_to_frame(columns):
+    """أعمدة اللقطة من Supabase -> DataFrame"""
+    return pd.DataFrame({column: columns.get(column, []) for column in SNAPSHOT_COLUMNS})
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Event Hub for MeshalStock
+توزيع الأحداث (Server-Sent Events) على المشتركين
+
+كل موضوع (topic) مثل 'job:<id>' أو 'market-summary' له مصدر واحد ينشر الحدث مرة واحدة،
+والمحور يوزعه على طوابير المشتركين:
+- طابور كل مشترك محدود الحجم: المشترك البطيء يعلم بأنه فاته أحداث (lagged)
+  فيستبدلها بلقطة كاملة بدلاً من أن تنمو الذاكرة بلا حد
+- حد أقصى لعدد المشتركين في كل موضوع
+- ميزانية مشتركة (StreamBudget) لعدد البث المفتوح عبر عدة محاور: كل بث يشغل thread
+  في gunicorn (gthread) طوال مدته، فيجب أن يبقى المجموع أقل بكثير من --threads
+"""
+
+import json
+import queue
+import threading
+import itertools
+
+
+class HubFull(Exception):
+    """تجاوز الحد الأقصى للمشتركين في الموضوع أو ميزانية البث المشتركة"""
+
+
+class StreamBudget:
+    """عداد مشترك لعدد الاشتراكات المفتوحة في جميع المحاور التي تستخدمه"""
+
+    def __init__(self, max_streams):
+        self.max_streams = max_streams
+        self.lock = threading.Lock()
+        self.active = 0
+
+    def acquire(self):
+        """حجز مكان لبث جديد (False إذا اكتملت الميزانية)"""
+        with self.lock:
+            if self.active >= self.max_streams:
+                return False
+            self.active += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.active = max(0, self.active - 1)
+
+
+class Subscription:
+    """اشتراك واحد في موضوع (يقرأ منه طلب SSE واحد)"""
+
+    def __init__(self, hub, topic, max_queue):
+        self.hub = hub
+        self.topic = topic
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.lagged = False
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.lagged = True
+
+    def get(self, timeout):
+        """
+        الحدث التالي أو None عند انتهاء المهلة
+
+        Returns:
+            (event_id, kind, data) أو None
+        """
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def reset(self):
+        """تفريغ الطابور بعد التأخر (المستهلك سيرسل لقطة كاملة)"""
+        self.lagged = False
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class EventHub:
+    """محور نشر واشتراك آمن للاستخدام من عدة threads"""
+
+    def __init__(self, max_subscribers=100, max_queue=256, budget=None):
+        """
+        Args:
+            max_subscribers: أقصى عدد مشتركين لكل موضوع
+            max_queue: حجم طابور كل مشترك
+            budget: StreamBudget مشتركة مع محاور أخرى (None = بدون حد إجمالي)
+        """
+        self.max_subscribers = max_subscribers
+        self.max_queue = max_queue
+        self.budget = budget
+        self.lock = threading.Lock()
+        self.topics = {}  # topic -> set of Subscription
+        self.counter = itertools.count(1)
+
+    def subscribe(self, topic):
+        """اشتراك جديد (يرفع HubFull عند تجاوز الحد)"""
+        with self.lock:
+            if len(self.topics.get(topic, ())) >= self.max_subscribers:
+                raise HubFull(topic)
+            if self.budget is not None and not self.budget.acquire():
+                raise HubFull(topic)
+            subscription = Subscription(self, topic, self.max_queue)
+            self.topics.setdefault(topic, set()).add(subscription)
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscribers = self.topics.get(subscription.topic)
+            if subscribers is None or subscription not in subscribers:
+                return
+            subscribers.discard(subscription)
+            if self.budget is not None:
+                self.budget.release()
+            if not subscribers:
+                del self.topics[subscription.topic]
+
+    def publish(self, topic, kind, data):
+        """نشر حدث لجميع مشتركي الموضوع (لا يحظر أبداً)"""
+        with self.lock:
+            subscribers = list(self.topics.get(topic, ()))
+        if not subscribers:
+            return
+        event = (next(self.counter), kind, data)
+        for subscription in subscribers:
+            subscription.put(event)
+
+    def subscriber_count(self, topic):
+        with self.lock:
+            return len(self.topics.get(topic, ()))
+
+
+def format_sse(kind, data, event_id=None):
+    """تنسيق حدث بصيغة text/event-stream"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {kind}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False, default=str)}")
+    return "\n".join(lines) + "\n\n"
@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Indicators for MeshalStock
+المؤشرات الفنية (SMA و EMA و RSI و ATR ومتوسط الحجم) لجميع رموز السوق
+
+كل مؤشر له حالة جارية لكل رمز (مثل آخر قيمة EMA أو نافذة SMA)، وكل شمعة يومية جديدة
+تحدّث الحالة بعدد ثابت من العمليات لكل رمز. الحساب يمر على موضع الشمعة داخل الرمز
+(الشمعة الأولى لجميع الرموز، ثم الثانية ...) فكل خطوة عملية مصفوفات على جميع الرموز.
+
+الحالة والقيم تحفظ في indicators_sa.npz و indicators_us.npz بعد كل عملية جلب،
+والتحديث التالي يحسب الصفوف الجديدة فقط. الرمز الذي تغير تاريخه السابق يعاد حسابه بالكامل:
+بصمة (checksum) لكل رمز من التاريخ والأسعار والحجم في جميع صفوفه تقارن ببصمة نفس الصفوف الآن.
+
+الأسماء: <نوع>_<الفترة> مثل sma_50 و rsi_14 و volume_sma_20.
+"""
+
+import os
+import re
+
+import numpy as np
+
+from market_store import segment_rows
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+INDICATOR_FILES = {
+    'saudi': os.path.join(BASE_DIR, 'indicators_sa.npz'),
+    'us': os.path.join(BASE_DIR, 'indicators_us.npz'),
+}
+
+DEFAULT_INDICATORS = ('sma_20', 'sma_50', 'sma_200', 'ema_12', 'ema_26', 'rsi_14', 'atr_14', 'volume_sma_20')
+MAX_PERIOD = 500
+
+_NAME_PATTERN = re.compile(r'^(sma|ema|rsi|atr|volume_sma)_(\d+)$')
+
+# بصمة الصفوف: بتات التاريخ وكل حقل تستخدمه المؤشرات مضروبة بعدد فردي كبير (modulo 2^64)
+CHECKSUM_FIELDS = ('close', 'high', 'low', 'volume')
+_CHECKSUM_MULTIPLIERS = (0x9E3779B97F4A7C15, 0xBF58476D1CE4E5B9, 0x94D049BB133111EB,
+                         0xD6E8FEB86659FD93, 0xFF51AFD7ED558CCD)
+
+
+# ==================== المؤشرات ====================
+
+class SMA:
+    """متوسط متحرك بسيط: نافذة دائرية بآخر period قيمة ومجموعها"""
+
+    def __init__(self, period, field='close'):
+        self.period = period
+        self.field = field
+
+    def init_state(self, count):
+        return {
+            'window': np.zeros((count, self.period)),
+            'total': np.zeros(count),
+            'count': np.zeros(count, dtype=np.int64),
+        }
+
+    def restore(self, state):
+        # المجموع من النافذة (بدون تراكم أخطاء التقريب عبر عمليات الجلب)
+        state['total'] = state['window'].sum(axis=1)
+
+    def step(self, state, idx, bar):
+        x = bar[self.field]
+        count = state['count'][idx]
+        pos = count % self.period
+        oldest = np.where(count >= self.period, state['window'][idx, pos], 0.0)
+        total = state['total'][idx] + x - oldest
+        state['window'][idx, pos] = x
+        state['total'][idx] = total
+        state['count'][idx] = count + 1
+        return np.where(count + 1 >= self.period, total / self.period, np.nan)
+
+
+class EMA:
+    """متوسط متحرك أسي (البداية = متوسط أول period قيمة)"""
+
+    def __init__(self, period, field='close'):
+        self.period = period
+        self.field = field
+        self.alpha = 2.0 / (period + 1)
+
+    def init_state(self, count):
+        return {'value': np.zeros(count), 'count': np.zeros(count, dtype=np.int64)}
+
+    def restore(self, state):
+        pass
+
+    def step(self, state, idx, bar):
+        x = bar[self.field]
+        count = state['count'][idx] + 1
+        value = state['value'][idx]
+        # قبل اكتمال الفترة value = مجموع القيم
+        value = np.where(count < self.period, value + x,
+                         np.where(count == self.period, (value + x) / self.period,
+                                  value + self.alpha * (x - value)))
+        state['value'][idx] = value
+        state['count'][idx] = count
+        return np.where(count >= self.period, value, np.nan)
+
+
+def _wilder(average, x, changes, period):
+    """تنعيم وايلدر: مجموع حتى اكتمال الفترة، ثم المتوسط، ثم (السابق × (period - 1) + الجديد) / period"""
+    return np.where(changes < period, average + x,
+                    np.where(changes == period, (average + x) / period,
+                             (average * (period - 1) + x) / period))
+
+
+class RSI:
+    """مؤشر القوة النسبية (وايلدر)"""
+
+    def __init__(self, period):
+        self.period = period
+
+    def init_state(self, count):
+        return {
+            'prev_close': np.zeros(count),
+            'gain': np.zeros(count),
+            'loss': np.zeros(count),
+            'count': np.zeros(count, dtype=np.int64),
+        }
+
+    def restore(self, state):
+        pass
+
+    def step(self, state, idx, bar):
+        x = bar['close']
+        # عدد التغيرات بعد هذه الشمعة = عدد الشموع السابقة
+        changes = state['count'][idx]
+        change = np.where(changes > 0, x - state['prev_close'][idx], 0.0)
+        started = changes > 0
+        gain = np.where(started, _wilder(state['gain'][idx], np.maximum(change, 0.0), changes, self.period), 0.0)
+        loss = np.where(started, _wilder(state['loss'][idx], np.maximum(-change, 0.0), changes, self.period), 0.0)
+        state['gain'][idx] = gain
+        state['loss'][idx] = loss
+        state['prev_close'][idx] = x
+        state['count'][idx] = changes + 1
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rsi = np.where(loss > 0, 100 - 100 / (1 + gain / loss), np.where(gain > 0, 100.0, 50.0))
+        return np.where(changes >= self.period, rsi, np.nan)
+
+
+class ATR:
+    """متوسط المدى الحقيقي (وايلدر) - أول شمعة: المدى = القمة - القاع"""
+
+    def __init__(self, period):
+        self.period = period
+
+    def init_state(self, count):
+        return {'prev_close': np.zeros(count), 'atr': np.zeros(count), 'count': np.zeros(count, dtype=np.int64)}
+
+    def restore(self, state):
+        pass
+
+    def step(self, state, idx, bar):
+        high, low, close = bar['high'], bar['low'], bar['close']
+        count = state['count'][idx]
+        prev_close = np.where(count > 0, state['prev_close'][idx], close)
+        true_range = np.maximum(high - low, np.maximum(np.abs(high - prev_close), np.abs(low - prev_close)))
+        atr = _wilder(state['atr'][idx], true_range, count + 1, self.period)
+        state['atr'][idx] = atr
+        state['prev_close'][idx] = close
+        state['count'][idx] = count + 1
+        return np.where(count + 1 >= self.period, atr, np.nan)
+
+
+def parse_indicator(name):
+    """
+    اسم المؤشر -> كائن الحساب
+
+    Raises:
+        ValueError: اسم غير معروف أو فترة خارج الحدود
+    """
+    match = _NAME_PATTERN.match(name)
+    if not match:
+        raise ValueError(f"unknown indicator '{name}' (use sma_N, ema_N, rsi_N, atr_N or volume_sma_N)")
+    kind, period = match.group(1), int(match.group(2))
+    if not 1 <= period <= MAX_PERIOD:
+        raise ValueError(f'indicator period must be between 1 and {MAX_PERIOD}')
+    if kind == 'sma':
+        return SMA(period)
+    if kind == 'volume_sma':
+        return SMA(period, 'volume')
+    if kind == 'ema':
+        return EMA(period)
+    if kind == 'rsi':
+        return RSI(period)
+    return ATR(period)
+
+
+# ==================== الحساب ====================
+
+class IndicatorSet:
+    """قيم المؤشرات لكل صف في بيانات السوق + الحالة الجارية لكل رمز"""
+
+    def __init__(self, names, symbols, offsets, columns, states, last_date, last_close, first_date, checksum,
+                 version=None):
+        """
+        Args:
+            names: أسماء المؤشرات
+            symbols / offsets: نفس ترتيب MarketData
+            columns: dict اسم المؤشر -> قيمة لكل صف (NaN قبل اكتمال الفترة)
+            states: dict اسم المؤشر -> dict حقل الحالة -> مصفوفة لكل رمز
+            last_date / last_close / first_date: لكل رمز (لاكتشاف تغير التاريخ السابق)
+            checksum: بصمة صفوف كل رمز (symbol_checksums)
+            version: إصدار بيانات السوق المحسوبة منه
+        """
+        self.names = list(names)
+        self.symbols = list(symbols)
+        self.offsets = offsets
+        self.columns = columns
+        self.states = states
+        self.last_date = last_date
+        self.last_close = last_close
+        self.first_date = first_date
+        self.checksum = checksum
+        self.version = version
+        self.symbol_index = {symbol: i for i, symbol in enumerate(self.symbols)}
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+
+def prefix_checksums(data):
+    """
+    بصمة تراكمية لصفوف السوق: القيمة r = مجموع بصمات الصفوف 0..r (uint64 مع الالتفاف)
+
+    بصمة الصف تتغير بتغير أي بت في التاريخ أو CHECKSUM_FIELDS، فمجموعها لصفوف رمز
+    يكشف أي تعديل في تاريخه (وليس فقط أوله وآخره).
+    """
+    digest = data.date.astype(np.int64).view(np.uint64) * np.uint64(_CHECKSUM_MULTIPLIERS[0])
+    for field, multiplier in zip(CHECKSUM_FIELDS, _CHECKSUM_MULTIPLIERS[1:]):
+        values = np.ascontiguousarray(getattr(data, field), dtype=np.float64)
+        digest ^= values.view(np.uint64) * np.uint64(multiplier)
+    return np.cumsum(digest, dtype=np.uint64)
+
+
+def symbol_checksums(cumulative, starts, lengths):
+    """بصمة الصفوف [starts[i], starts[i] + lengths[i]) لكل i من prefix_checksums (0 للمقطع الفارغ)"""
+    lengths = np.asarray(lengths, dtype=np.int64)
+    has_rows = lengths > 0
+    if len(cumulative) == 0:
+        return np.zeros(len(lengths), dtype=np.uint64)
+    end = np.where(has_rows, starts + lengths - 1, 0)
+    before = np.where(has_rows & (starts > 0), cumulative[np.maximum(starts - 1, 0)], np.uint64(0))
+    return np.where(has_rows, cumulative[end] - before, np.uint64(0)).astype(np.uint64)
+
+
+def reusable_symbols(previous, data, cumulative=None):
+    """
+    لكل رمز في data: رقمه في previous وعدد الصفوف المحسوبة مسبقاً (0 = يعاد حسابه)
+
+    يعاد استخدام الرمز إذا كانت صفوفه السابقة بداية صفوفه الحالية: نفس أول وآخر تاريخ
+    وآخر إغلاق في نفس الموضع، ونفس بصمة جميع تلك الصفوف (أي تعديل في منتصف التاريخ يعيد الحساب).
+
+    Args:
+        cumulative: prefix_checksums(data) إذا حسبت مسبقاً
+    """
+    count = len(data.symbols)
+    prev_index = np.array([previous.symbol_index.get(symbol, -1) for symbol in data.symbols], dtype=np.int64)
+    found = prev_index >= 0
+    j = np.where(found, prev_index, 0)
+    prev_lengths = previous.lengths[j] if len(previous.symbols) else np.zeros(count, dtype=np.int64)
+    starts = data.offsets[:-1]
+    ok = found & (prev_lengths > 0) & (prev_lengths <= np.diff(data.offsets))
+    if not ok.any():
+        return prev_index, np.zeros(count, dtype=np.int64)
+    first_row = np.where(ok, starts, 0)
+    last_row = np.where(ok, starts + prev_lengths - 1, 0)
+    ok &= data.date[first_row] == previous.first_date[j]
+    ok &= data.date[last_row] == previous.last_date[j]
+    ok &= data.close[last_row] == previous.last_close[j]
+    if cumulative is None:
+        cumulative = prefix_checksums(data)
+    ok &= symbol_checksums(cumulative, starts, np.where(ok, prev_lengths, 0)) == previous.checksum[j]
+    return prev_index, np.where(ok, prev_lengths, 0)
+
+
+def update_indicators(previous, data, names=DEFAULT_INDICATORS):
+    """
+    المؤشرات لجميع صفوف data: الصفوف المحسوبة في previous تنسخ، والباقي يحسب من الحالة المحفوظة
+
+    Args:
+        previous: IndicatorSet سابق أو None (حساب كامل)
+        data: MarketData
+        names: أسماء المؤشرات
+
+    Returns:
+        (IndicatorSet, stats) - stats: rows (الصفوف المحسوبة) و recomputed (رموز أعيد حسابها بالكامل)
+    """
+    names = list(names)
+    kernels = {name: parse_indicator(name) for name in names}
+    count = len(data.symbols)
+    lengths = np.diff(data.offsets)
+    states = {name: kernel.init_state(count) for name, kernel in kernels.items()}
+    columns = {name: np.full(len(data.date), np.nan) for name in names}
+
+    done = np.zeros(count, dtype=np.int64)
+    cumulative = prefix_checksums(data)
+    if previous is not None and set(names) <= set(previous.names):
+        prev_index, done = reusable_symbols(previous, data, cumulative)
+        reuse = np.flatnonzero(done > 0)
+        source = prev_index[reuse]
+        dest_rows = segment_rows(data.offsets[reuse], done[reuse])
+        source_rows = segment_rows(previous.offsets[source], done[reuse])
+        for name, kernel in kernels.items():
+            columns[name][dest_rows] = previous.columns[name][source_rows]
+            for field, values in states[name].items():
+                values[reuse] = previous.states[name][field][source]
+            kernel.restore(states[name])
+
+    # الخطوة k: الشمعة رقم done + k لكل رمز بقي له صفوف (الأطول أولاً: الرموز النشطة بداية المصفوفة)
+    remaining = lengths - done
+    order = np.argsort(-remaining, kind='stable')
+    active_counts = np.searchsorted(-remaining[order], -np.arange(int(remaining.max()) if count else 0),
+                                    side='left')
+    row_base = data.offsets[:-1] + done
+    bar_fields = {'close', 'high', 'low'} | {k.field for k in kernels.values() if hasattr(k, 'field')}
+    for k, active in enumerate(active_counts):
+        idx = order[:active]
+        rows = row_base[idx] + k
+        bar = {field: getattr(data, field)[rows] for field in bar_fields}
+        for name, kernel in kernels.items():
+            columns[name][rows] = kernel.step(states[name], idx, bar)
+
+    ends = data.offsets[1:] - 1
+    has_rows = lengths > 0
+    last = np.where(has_rows, ends, 0)
+    first = np.where(has_rows, data.offsets[:-1], 0)
+    empty_date = np.datetime64('NaT', 'D')
+    result = IndicatorSet(
+        names, data.symbols, data.offsets, columns, states,
+        last_date=np.where(has_rows, data.date[last] if len(data.date) else empty_date, empty_date),
+        last_close=np.where(has_rows, data.close[last] if len(data.date) else np.nan, np.nan),
+        first_date=np.where(has_rows, data.date[first] if len(data.date) else empty_date, empty_date),
+        checksum=symbol_checksums(cumulative, data.offsets[:-1], lengths),
+        version=data.version,
+    )
+    stats = {'rows': int(remaining.sum()), 'recomputed': int(((done == 0) & has_rows).sum())}
+    return result, stats
+
+
+# ==================== الحفظ ====================
+
+def save_indicators(market, indicator_set):
+    """حفظ القيم والحالة (كتابة ذرية)"""
+    arrays = {
+        'names': np.array(indicator_set.names),
+        'symbols': np.array(indicator_set.symbols, dtype=str),
+        'offsets': indicator_set.offsets,
+        'last_date': indicator_set.last_date,
+        'last_close': indicator_set.last_close,
+        'first_date': indicator_set.first_date,
+        'checksum': indicator_set.checksum,
+    }
+    for name in indicator_set.names:
+        arrays[f'column:{name}'] = indicator_set.columns[name]
+        for field, values in indicator_set.states[name].items():
+            arrays[f'state:{name}:{field}'] = values
+
+    path = INDICATOR_FILES[market]
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+def load_indicators(market):
+    """
+    المؤشرات المحفوظة للسوق
+
+    Returns:
+        IndicatorSet أو None إذا لم تحفظ بعد أو تعذرت قراءتها
+    """
+    path = INDICATOR_FILES[market]
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as stored:
+            names = stored['names'].tolist()
+            columns = {name: stored[f'column:{name}'] for name in names}
+            states = {name: {} for name in names}
+            for key in stored.files:
+                if key.startswith('state:'):
+                    _, name, field = key.split(':', 2)
+                    states[name][field] = stored[key]
+            return IndicatorSet(
+                names, stored['symbols'].tolist(), stored['offsets'], columns, states,
+                last_date=stored['last_date'], last_close=stored['last_close'], first_date=stored['first_date'],
+                checksum=stored['checksum'],
+            )
+    except (OSError, ValueError, KeyError) as e:
+        print(f"⚠ Could not read {market} indicators: {e}")
+        return None
+
+
+def symbol_indicators(indicator_set, data, symbol, dates):
+    """
+    قيم المؤشرات لرمز في تواريخ محددة (NaN للتواريخ غير الموجودة في بيانات السوق)
+
+    Returns:
+        dict اسم المؤشر -> np.ndarray بطول dates
+    """
+    bounds = data.bounds(symbol)
+    if bounds is None or bounds[0] == bounds[1]:
+        return {name: np.full(len(dates), np.nan) for name in indicator_set.names}
+    start, end = bounds
+    symbol_dates = data.date[start:end]
+    pos = np.minimum(np.searchsorted(symbol_dates, dates), len(symbol_dates) - 1)
+    found = symbol_dates[pos] == dates
+    return {name: np.where(found, indicator_set.columns[name][start + pos], np.nan)
+            for name in indicator_set.names}
@@ -0,0 +1,796 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ingest Engine for MeshalStock
+محرك موحد لجلب وتحديث بيانات الأسهم من yfinance
+
+fetch_*_data.py و update_*_data.py أصبحت نقاط دخول رفيعة فوق هذا الملف.
+الفروقات بين الأسواق (المسارات، اسم السوق) في MARKETS،
+والفروقات بين وضعي الجلب والتحديث (auto_adjust ...) في MODES.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from io import StringIO
+
+import pandas as pd
+import yfinance as yf
+
+import numpy as np
+
+import market_calendar
+import market_store
+import daily_snapshots
+import indicators
+
+# Supabase integration (optional - falls back to CSV only)
+try:
+    from supabase_client import insert_stock_data_batch, upsert_market_snapshots, SUPABASE_KEY
+    USE_SUPABASE = bool(SUPABASE_KEY)
+except ImportError:
+    USE_SUPABASE = False
+    print("⚠ Supabase not available, saving to CSV only")
+
+# --- الإعدادات ---
+# تحديد المجلد الأساسي بناءً على موقع الملف الحالي
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_START_DATE = '2024-11-01'  # تاريخ البداية الافتراضي للأسهم الجديدة
+COLUMNS = ['Date', 'Open', 'High', 'Low', 'Close', 'Volume']
+PRICE_COLUMNS = COLUMNS[1:]
+
+DEFAULT_WORKERS = 2
+DEFAULT_BATCH_SIZE = 20          # عدد الرموز في كل طلب yfinance
+DEFAULT_REQUESTS_PER_SECOND = 1  # نفس معدل time.sleep(1) القديم لكن لكل دفعة
+SUPABASE_BATCH_SIZE = 500
+
+# إعدادات كل سوق
+MARKETS = {
+    'saudi': {
+        'market': 'saudi',
+        'label': 'السعودية',
+        'symbols_file': os.path.join(BASE_DIR, 'symbols_sa.txt'),
+        'data_dir': os.path.join(BASE_DIR, 'data_sa'),
+        'log_prefix': 'saudi',
+        'test_symbols': ['1120.SR', '2222.SR', '7010.SR'],
+    },
+    'us': {
+        'market': 'us',
+        'label': 'الأمريكية',
+        'symbols_file': os.path.join(BASE_DIR, 'sp500_tickers.csv'),
+        'data_dir': os.path.join(BASE_DIR, 'data_us'),
+        'log_prefix': 'us',
+        'test_symbols': ['AAPL', 'MSFT', 'GOOGL'],
+    },
+}
+
+# إعدادات كل وضع تشغيل
+# fetch: يجلب قائمة الرموز من ملف الرموز، بأسعار معدلة، ويرفع على Supabase
+# update: يحدث الملفات الموجودة فقط، بأسعار غير معدلة، ويشمل جلسة اليوم الجارية
+MODES = {
+    'fetch': {
+        'auto_adjust': True,
+        'include_today': False,
+        'upload': True,
+        'symbols_from_files': False,
+    },
+    'update': {
+        'auto_adjust': False,
+        'include_today': True,
+        'upload': False,
+        'symbols_from_files': True,
+    },
+}
+
+OUTCOMES = ['new', 'updated', 'up_to_date', 'failed', 'no_new_data']
+
+
+# --- الدالات ---
+
+def setup_logging(log_file, sink=None):
+    """
+    إعداد تسجيل الأحداث في ملف وسطر الأوامر.
+    sink: دالة اختيارية تستقبل كل سطر بدلاً من الطباعة (مثل سجل المهمة في الخادم)
+    """
+    lock = threading.Lock()
+
+    def log(message):
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        log_message = f"[{timestamp}] {message}"
+        with lock:
+            if sink is not None:
+                sink(log_message)
+            else:
+                try:
+                    print(log_message)
+                except UnicodeEncodeError:
+                    # في حالة فشل طباعة الرموز العربية في الكونسول
+                    print(log_message.encode('utf-8', errors='ignore').decode('ascii', errors='ignore'))
+            with open(log_file, 'a', encoding='utf-8') as f:
+                f.write(log_message + '\n')
+    return log
+
+
+class RateLimiter:
+    """محدد معدل مشترك بين جميع العمال (حد أدنى للفاصل بين الطلبات)"""
+
+    def __init__(self, requests_per_second):
+        self.interval = 1.0 / requests_per_second if requests_per_second > 0 else 0
+        self.lock = threading.Lock()
+        self.next_slot = 0.0
+
+    def wait(self):
+        """الانتظار حتى يتوفر مكان للطلب التالي"""
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class ProgressReporter:
+    """
+    قناة تقدم منظمة: أحداث JSON (سطر لكل حدث) على واصف ملف مخصص،
+    منفصلة عن السجلات النصية المقروءة على stdout.
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_fd(cls, fd):
+        """إنشاء قناة على واصف ملف (1 = stdout عندما لا تتوفر أنابيب إضافية)"""
+        if fd == 1:
+            return cls(sys.stdout)
+        return cls(os.fdopen(fd, 'w', encoding='utf-8', buffering=1))
+
+    def emit(self, event, **fields):
+        """إرسال حدث"""
+        if self.stream is None:
+            return
+        line = json.dumps({'event': event, 'ts': round(time.time(), 3), **fields}, ensure_ascii=False)
+        with self.lock:
+            try:
+                self.stream.write(line + '\n')
+                self.stream.flush()
+            except (OSError, ValueError):
+                # القارئ أغلق القناة - نكمل العمل بدون أحداث
+                self.stream = None
+
+
+def get_symbols_from_file(file_path, log):
+    """
+    تقرأ رموز الأسهم من ملف CSV أو TXT.
+    يفترض أن الملف يحتوي على عمود 'Symbol'.
+    """
+    if not os.path.exists(file_path):
+        log(f"E: لم يتم العثور على ملف الرموز {file_path}")
+        return None
+    try:
+        df = pd.read_csv(file_path)
+        if 'Symbol' not in df.columns:
+            log(f"E: ملف الرموز {file_path} لا يحتوي على عمود 'Symbol'.")
+            return None
+        # إزالة أي رموز تحتوي على '^' وأي قيم فارغة
+        symbols = df['Symbol'].dropna().astype(str).str.strip()
+        symbols = symbols[~symbols.str.contains(r'\^', na=False)]
+        return symbols.tolist()
+    except Exception as e:
+        log(f"E: حدث خطأ عند قراءة ملف الرموز {file_path}: {e}")
+        return None
+
+
+def get_symbols_from_dir(data_dir):
+    """إرجاع الرموز الموجودة كملفات CSV في مجلد البيانات"""
+    if not os.path.exists(data_dir):
+        return []
+    return sorted(f[:-4] for f in os.listdir(data_dir) if f.endswith('.csv'))
+
+
+def read_and_clean_csv(file_path, log):
+    """
+    يقرأ ملف CSV بأي من التنسيقات القديمة أو الجديدة، وينظفه، ويوحد الأعمدة.
+    يرجع DataFrame بأعمدة COLUMNS مرتبة حسب التاريخ أو None.
+    """
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            # تجاهل الأسطر الفارغة تماماً
+            lines = [line.rstrip('\n') for line in f if line.strip(', \r\n')]
+
+        if not lines:
+            return None
+
+        header = [c.strip() for c in lines[0].split(',')]
+        if header and header[0].lower() in ('date', 'price'):
+            # ترويسة بسطر واحد (Date,...) أو التنسيق القديم (Price/Ticker/Date)
+            names = ['Date'] + header[1:]
+            body = [line for line in lines[1:] if line.split(',')[0].strip().lower() not in ('ticker', 'date', '')]
+        else:
+            names = COLUMNS
+            body = lines
+
+        df = pd.read_csv(StringIO("\n".join(body)), header=None, names=names, float_precision='round_trip')
+        if not all(col in df.columns for col in COLUMNS):
+            return None
+        df = df[COLUMNS]
+
+        # --- تنظيف وتوحيد شامل للبيانات ---
+        df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
+        for col in PRICE_COLUMNS:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+        df.dropna(subset=COLUMNS, inplace=True)
+        if not df.empty:
+            df['Volume'] = df['Volume'].astype('int64')
+
+        df = df.drop_duplicates(subset=['Date'], keep='last').sort_values('Date')
+        return df.reset_index(drop=True)
+
+    except Exception as e:
+        log(f"حدث خطأ غير متوقع أثناء قراءة وتنظيف {os.path.basename(file_path)}: {e}")
+        return None
+
+
+def inspect_file(file_path):
+    """
+    قراءة ترويسة الملف وآخر سطر فيه فقط (بدون تحليل الملف كاملاً).
+
+    Returns:
+        dict بالمفاتيح: last_date, columns, clean
+        clean=False يعني تنسيقاً قديماً يحتاج إعادة كتابة كاملة
+        أو None إذا لم يكن الملف موجوداً أو كان فارغاً
+    """
+    if not os.path.exists(file_path):
+        return None
+
+    try:
+        with open(file_path, 'rb') as f:
+            header = f.readline().decode('utf-8').strip()
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(0, size - 4096))
+            tail = f.read().decode('utf-8', errors='ignore')
+    except OSError:
+        return None
+
+    columns = [c.strip() for c in header.split(',')]
+    last_line = next((line for line in reversed(tail.splitlines()) if line.strip(', ')), '')
+    clean = columns[:1] == ['Date'] and set(PRICE_COLUMNS).issubset(columns)
+
+    last_date = None
+    if clean and last_line and last_line != header:
+        last_date = pd.to_datetime(last_line.split(',')[0], errors='coerce')
+        if pd.isna(last_date):
+            clean, last_date = False, None
+
+    return {'last_date': last_date, 'columns': columns, 'clean': clean, 'ends_with_newline': tail.endswith('\n')}
+
+
+def save_to_supabase(market, symbol, data, log):
+    """
+    حفظ البيانات في Supabase
+
+    Args:
+        market: 'saudi' or 'us'
+        symbol: رمز السهم
+        data: DataFrame بأعمدة COLUMNS
+        log: logging function
+
+    Returns:
+        عدد السجلات المحفوظة أو 0 في حالة الفشل
+    """
+    if not USE_SUPABASE or data.empty:
+        return 0
+
+    try:
+        # بناء السجلات دفعة واحدة بدلاً من iterrows
+        frame = data[COLUMNS].copy()
+        frame[PRICE_COLUMNS] = frame[PRICE_COLUMNS].fillna(0)
+        dates = frame['Date'].dt.strftime('%Y-%m-%d').tolist()
+        records = [
+            {
+                'symbol': symbol,
+                'market': market,
+                'date': date,
+                'open': float(o),
+                'high': float(h),
+                'low': float(l),
+                'close': float(c),
+                'volume': int(v),
+            }
+            for date, o, h, l, c, v in zip(dates, frame['Open'], frame['High'], frame['Low'],
+                                           frame['Close'], frame['Volume'])
+        ]
+
+        total_uploaded = 0
+        for i in range(0, len(records), SUPABASE_BATCH_SIZE):
+            total_uploaded += insert_stock_data_batch(records[i:i + SUPABASE_BATCH_SIZE])
+
+        log(f"[Supabase] {symbol}: تم رفع {total_uploaded} سجل")
+        return total_uploaded
+
+    except Exception as e:
+        log(f"[Supabase] تحذير: فشل الرفع على Supabase لـ {symbol}: {e}")
+        return 0
+
+
+def extract_symbol_frame(data, symbol, batch_size):
+    """
+    استخراج بيانات سهم واحد من نتيجة yf.download لدفعة رموز.
+    يرجع DataFrame بأعمدة COLUMNS أو None إذا لم توجد بيانات.
+    """
+    if data is None or data.empty:
+        return None
+
+    if isinstance(data.columns, pd.MultiIndex):
+        for level in range(data.columns.nlevels):
+            if symbol in data.columns.get_level_values(level):
+                frame = data.xs(symbol, axis=1, level=level)
+                break
+        else:
+            return None
+    elif batch_size == 1:
+        frame = data
+    else:
+        return None
+
+    if 'Close' not in frame.columns:
+        return None
+
+    frame = frame[[col for col in PRICE_COLUMNS if col in frame.columns]].dropna(subset=['Close'])
+    if frame.empty:
+        return None
+
+    frame = frame.copy()
+    index = pd.DatetimeIndex(frame.index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    frame.index = index.normalize()
+    frame.index.name = 'Date'
+    frame = frame.reset_index()
+
+    for col in PRICE_COLUMNS:
+        if col not in frame.columns:
+            frame[col] = 0
+    frame['Volume'] = pd.to_numeric(frame['Volume'], errors='coerce').fillna(0).astype('int64')
+    return frame[COLUMNS]
+
+
+def write_symbol_data(file_path, info, new_rows, log):
+    """
+    كتابة البيانات الجديدة للملف.
+    - ملف جديد: كتابة كاملة بترويسة موحدة
+    - ملف نظيف: إلحاق الصفوف الجديدة فقط في نهاية الملف (append-only)
+    - تنسيق قديم: قراءة ودمج وإعادة كتابة كاملة (فقط إذا تغير المحتوى)
+
+    Returns:
+        (outcome, rows_written, bytes_written)
+    """
+    if info is None:
+        text = new_rows.to_csv(index=False, date_format='%Y-%m-%d')
+        with open(file_path, 'w', encoding='utf-8', newline='') as f:
+            f.write(text)
+        return 'new', len(new_rows), len(text.encode('utf-8'))
+
+    if info['clean']:
+        if info['last_date'] is not None:
+            new_rows = new_rows[new_rows['Date'] > info['last_date']]
+        if new_rows.empty:
+            return 'no_new_data', 0, 0
+        # الحفاظ على ترتيب أعمدة الملف الموجود
+        text = new_rows[info['columns']].to_csv(index=False, header=False, date_format='%Y-%m-%d')
+        if not info['ends_with_newline']:
+            text = '\n' + text
+        with open(file_path, 'a', encoding='utf-8', newline='') as f:
+            f.write(text)
+        return 'updated', len(new_rows), len(text.encode('utf-8'))
+
+    old_rows = read_and_clean_csv(file_path, log)
+    combined = pd.concat([old_rows, new_rows], ignore_index=True) if old_rows is not None else new_rows
+    combined = combined.drop_duplicates(subset=['Date'], keep='last').sort_values('Date')
+    added = len(combined) - (len(old_rows) if old_rows is not None else 0)
+    if added <= 0:
+        return 'no_new_data', 0, 0
+    text = combined.to_csv(index=False, date_format='%Y-%m-%d')
+    written = write_if_changed(file_path, text)
+    return 'updated', added, len(text.encode('utf-8')) if written else 0
+
+
+def write_if_changed(file_path, text):
+    """
+    كتابة النص للملف فقط إذا اختلف عن المحتوى الحالي.
+
+    Returns:
+        True إذا تمت الكتابة
+    """
+    if os.path.exists(file_path):
+        with open(file_path, 'r', encoding='utf-8', newline='') as f:
+            if f.read() == text:
+                return False
+    with open(file_path, 'w', encoding='utf-8', newline='') as f:
+        f.write(text)
+    return True
+
+
+def migrate_files(market, log):
+    """
+    خطوة ترحيل صريحة (تشغل مرة واحدة): تنظيف جميع ملفات السوق وتوحيد تنسيقها.
+    الملفات النظيفة أصلاً لا يعاد كتابتها.
+
+    Returns:
+        dict: checked, rewritten, failed
+    """
+    cfg = MARKETS[market]
+    result = {'checked': 0, 'rewritten': 0, 'failed': 0}
+
+    for symbol in get_symbols_from_dir(cfg['data_dir']):
+        file_path = os.path.join(cfg['data_dir'], f"{symbol}.csv")
+        result['checked'] += 1
+        df = read_and_clean_csv(file_path, log)
+        if df is None or df.empty:
+            log(f"⚠️ الملف {symbol}.csv فارغ أو لا يحتوي على بيانات صالحة بعد التنظيف. سيتم تخطيه.")
+            result['failed'] += 1
+            continue
+        if write_if_changed(file_path, df.to_csv(index=False, date_format='%Y-%m-%d')):
+            log(f"[ترحيل] تم توحيد تنسيق {symbol}")
+            result['rewritten'] += 1
+
+    log(f"[ترحيل] تم فحص {result['checked']} ملف، أعيدت كتابة {result['rewritten']}، فشل {result['failed']}")
+    return result
+
+
+def plan_symbol(symbol, cfg, mode_cfg, now=None):
+    """
+    تحديد ما إذا كان السهم يحتاج طلباً من yfinance وتاريخ البداية،
+    بناءً على الجلسات المتوقعة في تقويم السوق (وليس مجرد مقارنة التواريخ).
+
+    Returns:
+        dict بالمفاتيح: symbol, path, info, last_date,
+        start (اليوم التالي لآخر تاريخ محفوظ، أو None إذا لم تكن هناك جلسات ناقصة)،
+        avoided (True إذا كانت المقارنة البسيطة للتواريخ سترسل طلباً بلا فائدة)
+    """
+    path = os.path.join(cfg['data_dir'], f"{symbol}.csv")
+    info = inspect_file(path)
+
+    last_date = info['last_date'] if info else None
+    if info is not None and not info['clean']:
+        # تنسيق قديم - نحتاج قراءة كاملة لمعرفة آخر تاريخ
+        df = read_and_clean_csv(path, lambda message: None)
+        last_date = df['Date'].max() if df is not None and not df.empty else None
+
+    start, avoided = None, False
+    if last_date is not None:
+        sessions = market_calendar.expected_sessions(
+            cfg['market'], last_date.date(), now, include_open=mode_cfg['include_today'])
+        if sessions:
+            # البداية من اليوم التالي لآخر تاريخ (وليس أول جلسة في التقويم) حتى لا يضيع يوم تداول
+            # اعتبره التقويم إغلاقاً بالخطأ - الكتابة تلحق فقط ما بعد آخر تاريخ فلا تعود الفجوة تملأ
+            start = (last_date + timedelta(days=1)).date()
+        else:
+            # القاعدة القديمة: الطلب إذا كان (آخر تاريخ + 1) قبل تاريخ النهاية (بتوقيت السوق مثل التقويم)
+            market_today = market_calendar.market_now(cfg['market'], now).date()
+            naive_end = market_today + timedelta(days=1 if mode_cfg['include_today'] else 0)
+            avoided = (last_date + timedelta(days=1)).date() < naive_end
+    else:
+        start = datetime.strptime(DEFAULT_START_DATE, '%Y-%m-%d').date()
+
+    return {
+        'symbol': symbol,
+        'path': path,
+        'info': info,
+        'last_date': last_date,
+        'start': start,
+        'avoided': avoided,
+    }
+
+
+def make_batches(plans, batch_size):
+    """تجميع الرموز التي تشترك في تاريخ البداية في دفعات"""
+    by_start = {}
+    for plan in plans:
+        by_start.setdefault(plan['start'], []).append(plan)
+
+    batches = []
+    for start in sorted(by_start):
+        group = by_start[start]
+        for i in range(0, len(group), batch_size):
+            batches.append(group[i:i + batch_size])
+    return batches
+
+
+def process_batch(batch, cfg, mode_cfg, end_date, limiter, log):
+    """
+    جلب دفعة رموز بطلب واحد ثم كتابة ملف كل سهم.
+
+    Returns:
+        list of dict: symbol, outcome, rows, bytes, fetch_ms, write_ms
+        (fetch_ms هو زمن طلب الدفعة كاملة ومشترك بين رموزها)
+    """
+    symbols = [plan['symbol'] for plan in batch]
+    start = batch[0]['start']
+
+    def result(symbol, outcome, rows=0, nbytes=0, write_ms=0.0):
+        return {
+            'symbol': symbol,
+            'outcome': outcome,
+            'rows': rows,
+            'bytes': nbytes,
+            'fetch_ms': round(fetch_ms, 1),
+            'write_ms': round(write_ms, 1),
+        }
+
+    fetch_started = time.perf_counter()
+    try:
+        limiter.wait()
+        fetch_started = time.perf_counter()
+        data = yf.download(
+            tickers=symbols,
+            start=start.strftime('%Y-%m-%d'),
+            end=end_date.strftime('%Y-%m-%d'),
+            auto_adjust=mode_cfg['auto_adjust'],
+            group_by='ticker',
+            threads=False,
+            progress=False
+        )
+    except Exception as e:
+        fetch_ms = (time.perf_counter() - fetch_started) * 1000
+        log(f"[خطأ] فشل جلب الدفعة {symbols[0]}..{symbols[-1]}: {e}")
+        return [result(symbol, 'failed') for symbol in symbols]
+    fetch_ms = (time.perf_counter() - fetch_started) * 1000
+
+    results = []
+    for plan in batch:
+        symbol = plan['symbol']
+        write_started = time.perf_counter()
+        try:
+            new_rows = extract_symbol_frame(data, symbol, len(symbols))
+            if new_rows is None:
+                results.append(result(symbol, 'no_new_data'))
+                continue
+
+            outcome, rows, nbytes = write_symbol_data(plan['path'], plan['info'], new_rows, log)
+            if outcome in ('new', 'updated') and mode_cfg['upload']:
+                save_to_supabase(cfg['market'], symbol, new_rows.tail(rows), log)
+            results.append(result(symbol, outcome, rows, nbytes, (time.perf_counter() - write_started) * 1000))
+
+        except Exception as e:
+            log(f"[خطأ] خطأ أثناء تحديث البيانات لـ {symbol}: {e}")
+            results.append(result(symbol, 'failed', write_ms=(time.perf_counter() - write_started) * 1000))
+
+    return results
+
+
+def run_ingest(market, mode='fetch', symbols=None, workers=DEFAULT_WORKERS,
+               batch_size=DEFAULT_BATCH_SIZE, requests_per_second=DEFAULT_REQUESTS_PER_SECOND, log=None,
+               reporter=None):
+    """
+    تشغيل عملية جلب/تحديث كاملة لسوق واحد.
+
+    Args:
+        market: 'saudi' or 'us'
+        mode: 'fetch' or 'update'
+        symbols: قائمة رموز محددة (اختياري)
+        workers: عدد الدفعات التي تجلب بالتوازي
+        batch_size: عدد الرموز في كل طلب yfinance
+        requests_per_second: الحد الأعلى لطلبات yfinance في الثانية
+        log: logging function
+        reporter: كائن بدالة emit(event, **fields) لأحداث التقدم المنظمة (اختياري)
+
+    Returns:
+        dict بإحصائيات النتائج
+    """
+    cfg = MARKETS[market]
+    mode_cfg = MODES[mode]
+    if log is None:
+        log = setup_logging(log_file_path(market, mode))
+    if reporter is None:
+        reporter = ProgressReporter()
+    started = time.perf_counter()
+
+    log("=" * 60)
+    log(f"*** بدء عملية تحديث بيانات الأسهم {cfg['label']} ***")
+    log("=" * 60)
+
+    # التأكد من وجود مجلد المخرجات
+    if not os.path.exists(cfg['data_dir']):
+        os.makedirs(cfg['data_dir'])
+        log(f"[مجلد] تم إنشاء المجلد: {cfg['data_dir']}")
+
+    # جلب قائمة الرموز
+    if not symbols:
+        if mode_cfg['symbols_from_files']:
+            symbols = get_symbols_from_dir(cfg['data_dir'])
+        else:
+            symbols = get_symbols_from_file(cfg['symbols_file'], log)
+
+    stats = {outcome: 0 for outcome in OUTCOMES}
+    stats['calls_avoided'] = 0
+    if not symbols:
+        log(f"[خطأ] فشل في الحصول على قائمة الرموز لسوق {market}")
+        reporter.emit('done', stats=stats, elapsed_ms=0, error='no_symbols')
+        return stats
+
+    total_symbols = len(symbols)
+    log(f"[معلومة] تم العثور على {total_symbols} رمزًا")
+    log("=" * 60)
+    reporter.emit('start', market=market, mode=mode, total=total_symbols)
+
+    # آخر جلسة متوقعة حسب تقويم السوق - yfinance يعتبر تاريخ النهاية غير مشمول
+    last_session = market_calendar.last_session(market, include_open=mode_cfg['include_today'])
+    end_date = last_session + timedelta(days=1)
+    log(f"[تقويم] آخر جلسة متوقعة: {last_session.strftime('%Y-%m-%d')}")
+
+    done = 0
+
+    def record(detail):
+        nonlocal done
+        done += 1
+        symbol, outcome = detail['symbol'], detail['outcome']
+        stats[outcome] = stats.get(outcome, 0) + 1
+        log(f"--- التقدم: {done}/{total_symbols} ({(done / total_symbols * 100):.1f}%) ---")
+        log(f"[معالجة] {symbol}: {outcome}")
+        log(f"[احصائيات] جديد: {stats['new']}, محدث: {stats['updated']}, محدث مسبقاً: {stats['up_to_date']}, فشل: {stats['failed']}")
+        reporter.emit('symbol', progress=done, total=total_symbols, stats=dict(stats), **detail)
+
+    pending = []
+    for symbol in symbols:
+        plan = plan_symbol(symbol, cfg, mode_cfg)
+        if plan['start'] is None:
+            stats['calls_avoided'] += int(plan['avoided'])
+            record({'symbol': symbol, 'outcome': 'up_to_date', 'rows': 0, 'bytes': 0, 'fetch_ms': 0, 'write_ms': 0})
+        else:
+            pending.append(plan)
+
+    batches = make_batches(pending, max(1, batch_size))
+    log(f"[جلب] {len(pending)} رمز في {len(batches)} دفعة ({workers} عامل)")
+
+    limiter = RateLimiter(requests_per_second)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [executor.submit(process_batch, batch, cfg, mode_cfg, end_date, limiter, log) for batch in batches]
+        for future in as_completed(futures):
+            for detail in future.result():
+                record(detail)
+
+    # لقطات الأيام المتغيرة (أو جميع الأيام إذا لم تحفظ لقطات بعد) والمؤشرات الفنية للصفوف الجديدة
+    has_snapshots = bool(daily_snapshots.snapshot_dates(market))
+    has_indicators = os.path.exists(indicators.INDICATOR_FILES[market])
+    if stats['new'] or stats['updated'] or not has_snapshots or not has_indicators:
+        data = market_store.load_market_from_csv(market)
+        since = min((plan['start'] for plan in pending), default=None) if has_snapshots else None
+        try:
+            update_daily_snapshots(market, since, mode_cfg['upload'], log, data=data)
+        except Exception as e:
+            log(f"[خطأ] فشل حفظ اللقطات اليومية: {e}")
+        try:
+            update_indicators(market, log, data=data)
+        except Exception as e:
+            log(f"[خطأ] فشل تحديث المؤشرات الفنية: {e}")
+
+    log("\n" + "=" * 60)
+    log("*** انتهت عملية تحديث البيانات! ***")
+    log("=" * 60)
+    log("[النتائج النهائية]:")
+    log(f"   [+] ملفات جديدة: {stats['new']}")
+    log(f"   [+] ملفات محدثة: {stats['updated']}")
+    log(f"   [+] ملفات محدثة بالفعل: {stats['up_to_date']}")
+    log(f"   [-] فشل: {stats['failed']}")
+    log(f"   - لا توجد بيانات جديدة: {stats['no_new_data']}")
+    log(f"   - طلبات تم تجنبها (لا جلسة متوقعة): {stats['calls_avoided']}")
+    log("=" * 60)
+    reporter.emit('done', stats=stats, elapsed_ms=round((time.perf_counter() - started) * 1000, 1))
+
+    return stats
+
+
+def update_daily_snapshots(market, since, upload, log, data=None):
+    """
+    حفظ لقطة كل يوم تداول تغير منذ since (محلياً وفي Supabase عند تفعيل الرفع)
+
+    Args:
+        market: 'saudi' or 'us'
+        since: أول تاريخ ربما تغير (date) أو None لإعادة بناء جميع الأيام
+        upload: رفع الأيام المتغيرة إلى جدول market_snapshots
+        data: MarketData من ملفات CSV (None = تحميلها)
+
+    Returns:
+        عدد الأيام التي تغيرت
+    """
+    started = time.perf_counter()
+    if data is None:
+        data = market_store.load_market_from_csv(market)
+    changed = daily_snapshots.write_daily_snapshots(
+        market, data, since=np.datetime64(since, 'D') if since is not None else None)
+    if changed and upload and USE_SUPABASE:
+        saved = upsert_market_snapshots(
+            market, {date: daily_snapshots.frame_to_columns(frame) for date, frame in changed.items()})
+        log(f"[لقطات] تم رفع {saved} لقطة يومية إلى Supabase")
+    log(f"[لقطات] تم تحديث {len(changed)} لقطة يومية في {time.perf_counter() - started:.1f} ثانية")
+    return len(changed)
+
+
+def update_indicators(market, log, data=None, rebuild=False):
+    """
+    تحديث المؤشرات الفنية المحفوظة: الصفوف الجديدة فقط من الحالة الجارية لكل رمز
+
+    Args:
+        market: 'saudi' or 'us'
+        data: MarketData من ملفات CSV (None = تحميلها)
+        rebuild: تجاهل الحالة المحفوظة وإعادة الحساب بالكامل
+
+    Returns:
+        عدد الصفوف المحسوبة
+    """
+    started = time.perf_counter()
+    if data is None:
+        data = market_store.load_market_from_csv(market)
+    previous = None if rebuild else indicators.load_indicators(market)
+    result, stats = indicators.update_indicators(previous, data)
+    if stats['rows'] or previous is None or len(previous.symbols) != len(result.symbols):
+        indicators.save_indicators(market, result)
+    log(f"[مؤشرات] تم حساب {stats['rows']} صف ({stats['recomputed']} رمز بالكامل) "
+        f"في {time.perf_counter() - started:.1f} ثانية")
+    return stats['rows']
+
+
+def log_file_path(market, mode):
+    """مسار ملف السجل لسوق ووضع تشغيل"""
+    return os.path.join(BASE_DIR, f"{MARKETS[market]['log_prefix']}_data_{mode}.log")
+
+
+def main(market, mode):
+    """نقطة الدخول المشتركة لسكربتات fetch_* و update_*"""
+    cfg = MARKETS[market]
+    parser = argparse.ArgumentParser(description=f'{mode.title()} {market} stock data')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Number of concurrent download batches')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Symbols per yfinance request')
+    parser.add_argument('--rate', type=float, default=DEFAULT_REQUESTS_PER_SECOND, help='Max yfinance requests per second')
+    parser.add_argument('--test', action='store_true', help='Run in test mode')
+    parser.add_argument('--symbols', type=str, help='Comma separated symbols for testing')
+    parser.add_argument('--progress-fd', type=int, default=None,
+                        help='File descriptor for machine-readable JSON progress events')
+    parser.add_argument('--migrate', action='store_true',
+                        help='One-off cleanup: normalize every existing CSV file, then exit')
+    parser.add_argument('--snapshots', action='store_true',
+                        help='Rebuild the daily market snapshots from the CSV files, then exit')
+    parser.add_argument('--indicators', action='store_true',
+                        help='Recompute the technical indicators from the CSV files, then exit')
+    args = parser.parse_args()
+
+    if args.migrate:
+        log = setup_logging(log_file_path(market, 'migrate'))
+        migrate_files(market, log)
+        return
+
+    if args.snapshots:
+        log = setup_logging(log_file_path(market, 'snapshots'))
+        update_daily_snapshots(market, None, MODES[mode]['upload'], log)
+        return
+
+    if args.indicators:
+        log = setup_logging(log_file_path(market, 'indicators'))
+        update_indicators(market, log, rebuild=True)
+        return
+
+    symbols = None
+    if args.test:
+        symbols = args.symbols.split(',') if args.symbols else cfg['test_symbols']
+
+    reporter = ProgressReporter.from_fd(args.progress_fd) if args.progress_fd is not None else None
+
+    run_ingest(
+        market,
+        mode=mode,
+        symbols=symbols,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        requests_per_second=args.rate,
+        reporter=reporter
+    )
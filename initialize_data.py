@@ -6,8 +6,6 @@ Downloads essential stock data if not present
 """
 
 import os
-import sys
-import subprocess
 from pathlib import Path
 from datetime import datetime
 
@@ -26,8 +24,14 @@ def check_data_exists():
     # Need at least 50 stocks in each market
     return len(sa_files) >= 50 and len(us_files) >= 50
 
-def fetch_data_background():
-    """Fetch data in background without blocking server startup"""
+def fetch_data_background(on_market_done=None):
+    """
+    Fetch data in background without blocking server startup
+    
+    Args:
+        on_market_done: Optional callback(market) after each market finishes
+                        (e.g. refresh the server's in-memory market data)
+    """
     
     print("\n" + "=" * 70)
     print("🚀 BACKGROUND DATA FETCH STARTED")
@@ -41,29 +45,22 @@ def fetch_data_background():
         marker_file = BASE_DIR / '.data_fetch_in_progress'
         marker_file.write_text(f"Started at {datetime.now().isoformat()}")
         
-        # Fetch US data (limit to top stocks for faster initial load)
-        print("📊 Fetching US market data (top 100 stocks)...")
-        result_us = subprocess.run([
-            sys.executable,
-            str(BASE_DIR / 'fetch_us_data.py')
-        ], capture_output=True, text=True, timeout=900)  # 15 min timeout
+        # الجلب يتم داخل نفس العملية عبر محرك الجلب (بدون تشغيل مفسر جديد)
+        from ingest_engine import run_ingest
         
-        if result_us.returncode == 0:
-            print("✓ US data fetch completed")
-        else:
-            print(f"⚠ US data fetch had issues: {result_us.stderr[:200]}")
+        # Fetch US data
+        print("📊 Fetching US market data...")
+        stats_us = run_ingest('us', mode='fetch')
+        print(f"✓ US data fetch completed: {stats_us}")
+        if on_market_done:
+            on_market_done('us')
         
         # Fetch Saudi data
         print("📊 Fetching Saudi market data...")
-        result_sa = subprocess.run([
-            sys.executable,
-            str(BASE_DIR / 'fetch_saudi_data.py')
-        ], capture_output=True, text=True, timeout=900)  # 15 min timeout
-        
-        if result_sa.returncode == 0:
-            print("✓ Saudi data fetch completed")
-        else:
-            print(f"⚠ Saudi data fetch had issues: {result_sa.stderr[:200]}")
+        stats_sa = run_ingest('saudi', mode='fetch')
+        print(f"✓ Saudi data fetch completed: {stats_sa}")
+        if on_market_done:
+            on_market_done('saudi')
         
         # Remove marker file
         if marker_file.exists():
@@ -73,19 +70,18 @@ def fetch_data_background():
         print("✓ BACKGROUND DATA FETCH COMPLETE")
         print("=" * 70)
         
-    except subprocess.TimeoutExpired:
-        print("⚠ Data fetch timed out (15 minutes). You can update manually from the web interface.")
     except Exception as e:
         print(f"⚠ Warning: Data initialization failed: {e}")
         print("You can manually update data from the web interface.")
 
-def initialize_data(background=True):
+def initialize_data(background=True, on_market_done=None):
     """
     Initialize data if not present
     
     Args:
         background: If True, fetch data in background thread (non-blocking)
                    If False, fetch data synchronously (blocking)
+        on_market_done: Optional callback(market) after each market finishes
     """
     
     if check_data_exists():
@@ -99,13 +95,13 @@ def initialize_data(background=True):
     if background:
         # Start background fetch in a separate thread
         import threading
-        thread = threading.Thread(target=fetch_data_background, daemon=True)
+        thread = threading.Thread(target=fetch_data_background, args=(on_market_done,), daemon=True)
         thread.start()
         print("✓ Background data fetch started. Server will continue to start...")
         return True
     else:
         # Synchronous fetch (blocking)
-        fetch_data_background()
+        fetch_data_background(on_market_done)
         return True
 
 if __name__ == '__main__':
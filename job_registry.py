@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Job Registry for MeshalStock
+سجل المهام: حالة كل مهمة جلب، مع حد أعلى للذاكرة وحفظ اختياري على القرص
+
+- سجل نصي دائري (ring buffer) لكل مهمة بدلاً من قائمة تنمو بلا حد
+- حذف المهام المنتهية حسب العمر ثم حسب الأقدم استخداماً (LRU)
+- حفظ الحالة في ملف JSON صغير لتبقى بعد إعادة تشغيل عمّال gunicorn
+"""
+
+import os
+import copy
+import json
+import time
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime
+
+# الحالات التي تعني أن المهمة انتهت ويمكن حذفها
+FINISHED_STATUSES = {'completed', 'failed', 'error', 'interrupted'}
+
+# عدد أسطر السجل التي تحفظ على القرص لكل مهمة
+PERSISTED_OUTPUT_LINES = 20
+
+
+def _pid_alive(pid):
+    """هل العملية ما زالت تعمل"""
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+class JobRegistry:
+    """سجل مهام محدود الحجم وآمن للاستخدام من عدة threads"""
+
+    def __init__(self, max_jobs=50, max_age_seconds=24 * 3600, max_output_lines=500,
+                 persist_path=None, save_interval=2.0):
+        """
+        Args:
+            max_jobs: أقصى عدد للمهام المنتهية المحفوظة
+            max_age_seconds: عمر المهمة المنتهية قبل حذفها
+            max_output_lines: حجم السجل الدائري لكل مهمة
+            persist_path: مسار ملف الحفظ (None لتعطيل الحفظ)
+            save_interval: أقل فاصل بين عمليات الحفظ أثناء التقدم (بالثواني)
+        """
+        self.max_jobs = max_jobs
+        self.max_age_seconds = max_age_seconds
+        self.max_output_lines = max_output_lines
+        self.persist_path = persist_path
+        self.save_interval = save_interval
+
+        self.lock = threading.RLock()
+        self.jobs = OrderedDict()
+        self.outputs = {}
+        self.finished_at = {}
+        self.last_used = {}
+        self.last_save = 0.0
+        self.file_stamp = None  # (mtime_ns, size) لآخر نسخة قرأناها أو كتبناها من ملف الحفظ
+
+        self.load()
+
+    # ----------------------------------------
+    # الكتابة
+    # ----------------------------------------
+
+    def create(self, job_id, **fields):
+        """تسجيل مهمة جديدة"""
+        with self.lock:
+            job = {
+                'status': 'starting',
+                'progress': 0,
+                'total': 0,
+                'started_at': datetime.now().isoformat(),
+                'stats': {},
+                'pid': os.getpid(),
+            }
+            job.update(fields)
+            self.jobs[job_id] = job
+            self.outputs[job_id] = deque(maxlen=self.max_output_lines)
+            self.last_used[job_id] = time.time()
+            self.evict()
+            self.save(force=True)
+            return copy.deepcopy(job)
+
+    def update(self, job_id, **fields):
+        """تحديث حقول مهمة"""
+        self.apply(job_id, lambda job: job.update(fields))
+
+    def apply(self, job_id, func):
+        """تطبيق دالة على قاموس المهمة تحت القفل"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return
+            func(job)
+            finished = job.get('status') in FINISHED_STATUSES
+            if finished and job_id not in self.finished_at:
+                self.finished_at[job_id] = time.time()
+            self.save(force=finished)
+
+    def append_output(self, job_id, line):
+        """إضافة سطر إلى السجل الدائري للمهمة"""
+        with self.lock:
+            output = self.outputs.get(job_id)
+            if output is None:
+                output = self.outputs[job_id] = deque(maxlen=self.max_output_lines)
+            output.append(line)
+
+    # ----------------------------------------
+    # القراءة
+    # ----------------------------------------
+
+    def get(self, job_id):
+        """نسخة من حالة المهمة أو None (مع البحث في ملف الحفظ إذا لم تكن في الذاكرة)"""
+        with self.lock:
+            if job_id not in self.jobs:
+                # قد تكون المهمة أنشئت في عامل gunicorn آخر
+                self.load()
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            self.jobs.move_to_end(job_id)
+            self.last_used[job_id] = time.time()
+            return copy.deepcopy(job)
+
+    def recent_output(self, job_id, count=10):
+        """آخر أسطر السجل"""
+        with self.lock:
+            output = self.outputs.get(job_id)
+            if not output:
+                return []
+            return list(output)[-count:]
+
+    def list(self, limit=20, offset=0, status=None):
+        """
+        قائمة المهام (الأحدث أولاً) مع ترقيم الصفحات
+
+        Returns:
+            (list of (job_id, job), total)
+        """
+        with self.lock:
+            items = [(job_id, copy.deepcopy(job)) for job_id, job in self.jobs.items()
+                     if status is None or job.get('status') == status]
+        items.sort(key=lambda item: item[1].get('started_at', ''), reverse=True)
+        return items[offset:offset + limit], len(items)
+
+    # ----------------------------------------
+    # الحذف والحفظ
+    # ----------------------------------------
+
+    def evict(self):
+        """
+        حذف المهام المنتهية القديمة ثم الأقل استخداماً فوق الحد
+
+        يطبق على المهام المدموجة من جميع العمّال: وقت الانتهاء وآخر استخدام محفوظان في الملف،
+        فتحذف كل العمليات نفس المهام ولا تعيد إحداها مهمة حذفتها أخرى.
+        """
+        with self.lock:
+            now = time.time()
+            for job_id, finished in list(self.finished_at.items()):
+                if now - finished > self.max_age_seconds:
+                    self._remove(job_id)
+
+            finished_ids = [job_id for job_id, job in self.jobs.items()
+                            if job.get('status') in FINISHED_STATUSES]
+            # من الأقدم استخداماً إلى الأحدث (ترتيب OrderedDict عند التساوي)
+            finished_ids.sort(key=lambda job_id: self.last_used.get(job_id, 0.0))
+            for job_id in finished_ids[:max(0, len(finished_ids) - self.max_jobs)]:
+                self._remove(job_id)
+
+    def _remove(self, job_id):
+        self.jobs.pop(job_id, None)
+        self.outputs.pop(job_id, None)
+        self.finished_at.pop(job_id, None)
+        self.last_used.pop(job_id, None)
+
+    def save(self, force=False):
+        """حفظ الحالة على القرص (بحد أدنى للفاصل الزمني ما لم يكن force)"""
+        if not self.persist_path:
+            return
+        with self.lock:
+            now = time.time()
+            if not force and now - self.last_save < self.save_interval:
+                return
+            self.last_save = now
+            # دمج مهام العمّال الآخرين (إذا تغير الملف منذ آخر قراءة أو كتابة) ثم الحذف على المجموعة المدموجة
+            self.load()
+            self.evict()
+            state = {
+                job_id: {
+                    'job': job,
+                    'output': list(self.outputs.get(job_id, []))[-PERSISTED_OUTPUT_LINES:],
+                    'finished_at': self.finished_at.get(job_id),
+                    'last_used': self.last_used.get(job_id),
+                }
+                for job_id, job in self.jobs.items()
+            }
+            tmp_path = f"{self.persist_path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(state, f, ensure_ascii=False)
+                os.replace(tmp_path, self.persist_path)
+                self.file_stamp = self._stamp()
+            except OSError as e:
+                print(f"⚠ Could not persist job registry: {e}")
+
+    def _stamp(self):
+        try:
+            stat = os.stat(self.persist_path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def load(self):
+        """
+        تحميل المهام المحفوظة (المهام الجارية في هذه العملية لا تستبدل)
+
+        لا يعاد قراءة الملف إذا لم يتغير منذ آخر قراءة أو كتابة من هذه العملية.
+        """
+        if not self.persist_path:
+            return
+        with self.lock:
+            stamp = self._stamp()
+            if stamp is None or stamp == self.file_stamp:
+                return
+            try:
+                with open(self.persist_path, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"⚠ Could not load job registry: {e}")
+                return
+            self.file_stamp = stamp
+
+            for job_id, entry in state.items():
+                job = entry.get('job', {})
+                local = self.jobs.get(job_id)
+                if local is not None and local.get('pid') == os.getpid():
+                    continue
+                # مهمة كانت جارية في عملية لم تعد موجودة
+                if job.get('status') not in FINISHED_STATUSES and not _pid_alive(job.get('pid')):
+                    job['status'] = 'interrupted'
+                    job.setdefault('completed_at', datetime.now().isoformat())
+                self.jobs[job_id] = job
+                self.outputs[job_id] = deque(entry.get('output', []), maxlen=self.max_output_lines)
+                finished_at = entry.get('finished_at')
+                if finished_at is None and job.get('status') in FINISHED_STATUSES:
+                    finished_at = time.time()
+                if finished_at is not None:
+                    self.finished_at[job_id] = finished_at
+                self.last_used[job_id] = max(self.last_used.get(job_id, 0.0),
+                                             entry.get('last_used') or finished_at or 0.0)
+            self.evict()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Job Scheduler for MeshalStock
+جدولة مهام الجلب أمام JobRunner
+
+- مهمة واحدة جارية لكل سوق (لا يكتب طلبان على نفس ملفات data_*/ في نفس الوقت)
+- طلب مطابق لمهمة جارية يرتبط بها ويعيد نفس job_id
+- طلب مطابق لمهمة في الانتظار لا ينشئ مهمة جديدة (مع رفع أولويتها إن لزم)
+- باقي الطلبات تنتظر في طابور بأولويات
+"""
+
+import heapq
+import itertools
+import threading
+import uuid
+
+# الأولوية الأصغر تُنفذ أولاً
+PRIORITIES = {
+    'high': 0,    # طلب يدوي من المسؤول
+    'normal': 5,
+    'low': 10,    # التحديث المجدول
+}
+
+
+class JobScheduler:
+    """طابور مهام الجلب مع إزالة التكرار وحد للتوازي لكل سوق"""
+
+    def __init__(self, registry, executor, runner_factory, max_per_market=1):
+        """
+        Args:
+            registry: JobRegistry لتسجيل حالة المهام
+            executor: منفذ المهام المشترك (concurrent.futures)
+            runner_factory: دالة (job_id, market, options) -> كائن بدالة run()
+            max_per_market: أقصى عدد مهام جارية لكل سوق
+        """
+        self.registry = registry
+        self.executor = executor
+        self.runner_factory = runner_factory
+        self.max_per_market = max_per_market
+
+        self.lock = threading.Lock()
+        self.counter = itertools.count()
+        self.queues = {}    # market -> heap of [priority, seq, job_id]
+        self.pending = {}   # job_id -> {'key', 'market', 'options', 'entry'}
+        self.running = {}   # job_id -> {'key', 'market', 'options'}
+        self.done_callbacks = []
+
+    @staticmethod
+    def job_key(market, options):
+        """مفتاح المطابقة: مهمتان بنفس المفتاح تعتبران نفس العمل"""
+        symbols = options.get('symbols')
+        return (market, options.get('mode', 'fetch'), tuple(sorted(symbols)) if symbols else None)
+
+    def on_done(self, callback):
+        """تسجيل دالة تستدعى بعد انتهاء كل مهمة: callback(job_id, market, options)"""
+        self.done_callbacks.append(callback)
+
+    def submit(self, market, options=None, priority='normal'):
+        """
+        طلب مهمة جلب
+
+        Args:
+            market: 'saudi' or 'us'
+            options: dict (mode, symbols, workers)
+            priority: 'high', 'normal' or 'low'
+
+        Returns:
+            (job_id, disposition) حيث disposition: 'started' أو 'queued' أو 'attached'
+        """
+        options = dict(options or {})
+        key = self.job_key(market, options)
+        rank = PRIORITIES.get(priority, PRIORITIES['normal'])
+
+        with self.lock:
+            # 1. مهمة مطابقة جارية: الارتباط بها
+            for job_id, job in self.running.items():
+                if job['key'] == key:
+                    return job_id, 'attached'
+
+            # 2. مهمة مطابقة في الانتظار: عدم التكرار، مع رفع الأولوية
+            for job_id, job in self.pending.items():
+                if job['key'] == key:
+                    if rank < job['entry'][0]:
+                        job['entry'][0] = rank
+                        heapq.heapify(self.queues[market])
+                        self.registry.update(job_id, priority=priority)
+                    return job_id, 'attached'
+
+            # 3. مهمة جديدة
+            job_id = str(uuid.uuid4())
+            entry = [rank, next(self.counter), job_id]
+            self.pending[job_id] = {'key': key, 'market': market, 'options': options, 'entry': entry}
+            heapq.heappush(self.queues.setdefault(market, []), entry)
+            self.registry.create(job_id, status='queued', market=market, priority=priority,
+                                 mode=options.get('mode', 'fetch'))
+
+            started = self._dispatch(market)
+
+        return job_id, 'started' if job_id in started else 'queued'
+
+    def snapshot(self):
+        """حالة الطابور الحالية"""
+        with self.lock:
+            return {
+                'running': [{'job_id': job_id, 'market': job['market']} for job_id, job in self.running.items()],
+                'queued': [
+                    {'job_id': entry[2], 'market': market, 'priority': entry[0]}
+                    for market, heap in self.queues.items()
+                    for entry in sorted(heap)
+                ],
+            }
+
+    def _dispatch(self, market):
+        """تشغيل مهام السوق من الطابور حتى الحد الأقصى (يستدعى تحت القفل)"""
+        started = []
+        heap = self.queues.get(market, [])
+        while heap and sum(1 for job in self.running.values() if job['market'] == market) < self.max_per_market:
+            _, _, job_id = heapq.heappop(heap)
+            job = self.pending.pop(job_id)
+            self.running[job_id] = job
+            self.registry.update(job_id, status='starting')
+            runner = self.runner_factory(job_id, market, job['options'])
+            self.executor.submit(self._run, job_id, runner)
+            started.append(job_id)
+        return started
+
+    def _run(self, job_id, runner):
+        try:
+            runner.run()
+        finally:
+            with self.lock:
+                job = self.running.pop(job_id, None)
+                if job is not None:
+                    self._dispatch(job['market'])
+            if job is not None:
+                for callback in self.done_callbacks:
+                    try:
+                        callback(job_id, job['market'], job['options'])
+                    except Exception as e:
+                        print(f"Job done callback failed for {job_id}: {e}")
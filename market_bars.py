@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Market Bars for MeshalStock
+تجميع الشموع اليومية إلى أسبوعية وشهرية وربع سنوية وكل N يوم تداول
+لجميع رموز السوق في مرور واحد (مفتاح (رقم الرمز، رقم الفترة) ثم reduceat)
+
+الإطارات الزمنية:
+    weekly      أسبوع يبدأ الأحد (الرسم البياني) أو الاثنين (week_start='monday' مثل resample('W'))
+    monthly     شهر ميلادي
+    quarterly   ربع سنة ميلادي
+    Nd          كل N يوم تداول في السوق (مثل 5d) - الترقيم من أول تاريخ تداول في السوق
+
+الشموع محفوظة لكل (سوق، إطار) في bar_store، وعند تحديث بيانات السوق يعاد تجميع
+آخر شمعة لكل رمز والصفوف الجديدة فقط.
+"""
+
+import re
+import threading
+
+import numpy as np
+
+from market_store import KEY_STRIDE, segment_rows
+
+TIMEFRAMES = ('weekly', 'monthly', 'quarterly')
+MAX_BAR_DAYS = 250
+
+# 1970-01-01 كان يوم خميس: (الأيام منذ 1970 + الإزاحة) // 7 = رقم الأسبوع الذي يبدأ بهذا اليوم
+WEEK_OFFSETS = {'sunday': 4, 'monday': 3}
+
+BAR_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+_DAYS_PATTERN = re.compile(r'^(\d+)d$')
+
+
+def parse_timeframe(timeframe):
+    """
+    التحقق من الإطار الزمني
+
+    Returns:
+        (kind, days) - kind أحد TIMEFRAMES أو 'days' (مع عدد الأيام)
+
+    Raises:
+        ValueError: إطار غير معروف
+    """
+    if timeframe in TIMEFRAMES:
+        return timeframe, None
+    match = _DAYS_PATTERN.match(timeframe or '')
+    if match and 2 <= int(match.group(1)) <= MAX_BAR_DAYS:
+        return 'days', int(match.group(1))
+    raise ValueError(f"timeframe must be one of: {', '.join(TIMEFRAMES)} or Nd (2-{MAX_BAR_DAYS} trading days)")
+
+
+def period_keys(dates, timeframe, week_start='sunday', trading_dates=None):
+    """
+    رقم الفترة لكل تاريخ (متزايد مع التاريخ)
+
+    Args:
+        dates: datetime64[D]
+        trading_dates: تواريخ التداول في السوق مرتبة (مطلوبة لـ Nd فقط)
+    """
+    kind, days = parse_timeframe(timeframe)
+    dates = np.asarray(dates).astype('datetime64[D]')
+    if kind == 'weekly':
+        return (dates.astype(np.int64) + WEEK_OFFSETS[week_start]) // 7
+    months = dates.astype('datetime64[M]').astype(np.int64)
+    if kind == 'monthly':
+        return months
+    if kind == 'quarterly':
+        return months // 3
+    return np.searchsorted(trading_dates, dates) // days
+
+
+def period_labels(keys, timeframe, week_start='sunday', trading_dates=None):
+    """تاريخ بداية كل فترة (أول يوم في الأسبوع/الشهر/الربع، أو أول يوم تداول في N يوم)"""
+    kind, days = parse_timeframe(timeframe)
+    keys = np.asarray(keys, dtype=np.int64)
+    if kind == 'weekly':
+        return (keys * 7 - WEEK_OFFSETS[week_start]).astype('datetime64[D]')
+    if kind == 'monthly':
+        return keys.astype('datetime64[M]').astype('datetime64[D]')
+    if kind == 'quarterly':
+        return (keys * 3).astype('datetime64[M]').astype('datetime64[D]')
+    return trading_dates[keys * days]
+
+
+def reduce_groups(columns, keys):
+    """
+    تجميع صفوف متتالية بنفس المفتاح (المفاتيح مرتبة)
+
+    Args:
+        columns: dict بالحقول BAR_FIELDS (نفس طول keys)
+
+    Returns:
+        (bars dict بالحقول BAR_FIELDS, first, last) - first/last مواضع أول وآخر صف في كل مجموعة
+    """
+    first = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    last = np.r_[first[1:], len(keys)] - 1
+    bars = {
+        'open': columns['open'][first],
+        'high': np.maximum.reduceat(columns['high'], first),
+        'low': np.minimum.reduceat(columns['low'], first),
+        'close': columns['close'][last],
+        'volume': np.add.reduceat(columns['volume'], first),
+    }
+    return bars, first, last
+
+
+def empty_bars(symbol_count=0):
+    bars = {field: np.array([]) for field in BAR_FIELDS}
+    empty = np.array([], dtype=np.int64)
+    bars.update({'date': np.array([], dtype='datetime64[D]'), 'symbol': empty, 'first_row': empty,
+                 'last_row': empty, 'offsets': np.zeros(symbol_count + 1, dtype=np.int64)})
+    return bars
+
+
+def build_bars(data, timeframe, week_start='sunday', rows=None):
+    """
+    شموع جميع الرموز في مرور واحد
+
+    Args:
+        data: MarketData
+        rows: صفوف محددة (مرتبة، متصلة داخل كل رمز) أو None لجميع الصفوف
+
+    Returns:
+        dict: BAR_FIELDS، date (بداية الفترة)، symbol (رقم الرمز)، first_row و last_row لكل شمعة،
+              offsets (شموع الرمز i هي [offsets[i], offsets[i+1]))
+    """
+    if rows is None:
+        rows = np.arange(len(data.date), dtype=np.int64)
+    if len(rows) == 0:
+        return empty_bars(len(data.symbols))
+    symbol_ids = data.row_keys[rows] // KEY_STRIDE
+    periods = period_keys(data.date[rows], timeframe, week_start, data.trading_dates)
+    bars, first, last = reduce_groups({field: getattr(data, field)[rows] for field in BAR_FIELDS},
+                                      symbol_ids * KEY_STRIDE + periods)
+    bars['date'] = period_labels(periods[first], timeframe, week_start, data.trading_dates)
+    bars['symbol'] = symbol_ids[first]
+    bars['first_row'] = rows[first]
+    bars['last_row'] = rows[last]
+    bars['offsets'] = np.r_[0, np.cumsum(np.bincount(bars['symbol'], minlength=len(data.symbols)))]
+    return bars
+
+
+def update_bars(previous, previous_data, data, timeframe, week_start='sunday'):
+    """
+    شموع data انطلاقاً من شموع previous_data: الرموز التي أضيفت لها صفوف فقط
+    يعاد تجميع آخر شمعة لها والصفوف الجديدة، وباقي الرموز تنسخ أو يعاد تجميعها بالكامل
+    """
+    kind, _ = parse_timeframe(timeframe)
+    if kind == 'days':
+        # ترقيم N يوم يعتمد على تواريخ السوق: تاريخ جديد قبل آخر تاريخ يغير الترقيم
+        old_dates = previous_data.trading_dates
+        if len(old_dates) > len(data.trading_dates) or \
+                not np.array_equal(old_dates, data.trading_dates[:len(old_dates)]):
+            return build_bars(data, timeframe, week_start)
+
+    prev_index, kept = previous_data.shared_prefix(data)
+    lengths = np.diff(data.offsets)
+    j = np.where(kept > 0, prev_index, 0)
+    prev_counts = np.where(kept > 0, np.diff(previous['offsets'])[j], 0)
+    # الشموع المنسوخة: كل شموع الرمز السابقة عدا الأخيرة (قد تكتمل بالصفوف الجديدة)
+    keep_counts = np.maximum(prev_counts - 1, 0)
+    last_bar = previous['offsets'][j] + keep_counts
+    restart = np.where(prev_counts > 0,
+                       previous['first_row'][np.minimum(last_bar, max(len(previous['first_row']) - 1, 0))]
+                       - previous_data.offsets[j], 0)
+    restart = np.where(kept > 0, restart, 0)
+
+    rows = segment_rows(data.offsets[:-1] + restart, lengths - restart)
+    fresh = build_bars(data, timeframe, week_start, rows)
+
+    source = segment_rows(previous['offsets'][j], keep_counts)
+    if len(source) == 0:
+        return fresh
+    symbols = np.repeat(np.arange(len(data.symbols), dtype=np.int64), keep_counts)
+    shift = (data.offsets[:-1] - previous_data.offsets[j])[symbols]
+    merged = {}
+    for field in BAR_FIELDS + ('date',):
+        merged[field] = np.concatenate([previous[field][source], fresh[field]])
+    merged['symbol'] = np.concatenate([symbols, fresh['symbol']])
+    merged['first_row'] = np.concatenate([previous['first_row'][source] + shift, fresh['first_row']])
+    merged['last_row'] = np.concatenate([previous['last_row'][source] + shift, fresh['last_row']])
+    # ترتيب الرمز ثم التاريخ = ترتيب أول صف في بيانات السوق
+    order = np.argsort(merged['first_row'], kind='stable')
+    merged = {field: values[order] for field, values in merged.items()}
+    merged['offsets'] = np.r_[0, np.cumsum(np.bincount(merged['symbol'], minlength=len(data.symbols)))]
+    return merged
+
+
+class BarStore:
+    """شموع كل (سوق، إطار زمني، بداية الأسبوع) لآخر بيانات سوق مستخدمة"""
+
+    def __init__(self):
+        self.entries = {}  # (market, timeframe, week_start) -> (MarketData, bars)
+        self.lock = threading.Lock()
+        self.key_locks = {}
+
+    def _key_lock(self, key):
+        with self.lock:
+            return self.key_locks.setdefault(key, threading.Lock())
+
+    def get(self, data, timeframe, week_start='sunday'):
+        """
+        شموع الإطار الزمني لبيانات السوق (تجميع تزايدي إذا حسبت لبيانات سابقة لنفس السوق)
+
+        Returns:
+            dict كما في build_bars
+        """
+        parse_timeframe(timeframe)
+        key = (data.market, timeframe, week_start)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] is data:
+            return entry[1]
+        with self._key_lock(key):
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] is data:
+                return entry[1]
+            if entry is None:
+                bars = build_bars(data, timeframe, week_start)
+            else:
+                bars = update_bars(entry[1], entry[0], data, timeframe, week_start)
+            self.entries[key] = (data, bars)
+            return bars
+
+
+bar_store = BarStore()
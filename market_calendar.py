@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Market Calendar for MeshalStock
+تقويم التداول لتداول السعودية (الأحد - الخميس) وبورصة نيويورك (الاثنين - الجمعة + العطل)
+
+يستخدم لتحديد الجلسات المتوقعة لكل سهم قبل الاتصال بـ yfinance،
+بحيث لا نرسل طلباً لسهم لا توجد له جلسة جديدة متوقعة (عطلة نهاية الأسبوع أو عطلة رسمية).
+"""
+
+import os
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+# عطل تداول السعودية
+# يوم التأسيس (22 فبراير) واليوم الوطني (23 سبتمبر) ثابتة.
+# عطل الأعياد تعلنها تداول سنوياً - حدّث هذا الجدول عند الإعلان،
+# أو أضف تواريخ عبر متغير البيئة MARKET_HOLIDAYS_SAUDI (مفصولة بفواصل).
+SAUDI_FIXED_HOLIDAYS = [(2, 22), (9, 23)]
+SAUDI_EID_CLOSURES = [
+    # (من، إلى) شاملة
+    ('2024-04-07', '2024-04-14'),  # عيد الفطر 1445
+    ('2024-06-13', '2024-06-23'),  # عيد الأضحى 1445
+    ('2025-03-30', '2025-04-02'),  # عيد الفطر 1446
+    ('2025-06-05', '2025-06-10'),  # عيد الأضحى 1446
+    ('2026-03-19', '2026-03-24'),  # عيد الفطر 1447
+    ('2026-05-25', '2026-05-31'),  # عيد الأضحى 1447
+]
+
+# إغلاقات استثنائية لبورصة نيويورك (خارج القواعد الثابتة)
+NYSE_SPECIAL_CLOSURES = [
+    '2025-01-09',  # يوم حداد وطني (الرئيس كارتر)
+]
+
+# weekend: أرقام أيام الأسبوع (الاثنين = 0)
+CALENDARS = {
+    'saudi': {
+        'tz': 'Asia/Riyadh',
+        'weekend': {4, 5},  # الجمعة والسبت
+        'open': time(10, 0),
+        'close': time(15, 0),
+    },
+    'us': {
+        'tz': 'America/New_York',
+        'weekend': {5, 6},  # السبت والأحد
+        'open': time(9, 30),
+        'close': time(16, 0),
+    },
+}
+
+
+def _env_holidays(market):
+    """تواريخ عطل إضافية من متغيرات البيئة"""
+    raw = os.getenv(f'MARKET_HOLIDAYS_{market.upper()}', '')
+    result = set()
+    for item in raw.split(','):
+        item = item.strip()
+        if item:
+            result.add(date.fromisoformat(item))
+    return result
+
+
+def _nth_weekday(year, month, weekday, n):
+    """اليوم رقم n من يوم الأسبوع المحدد في الشهر (n=-1 للأخير)"""
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date(year + (month == 12), month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _easter(year):
+    """تاريخ عيد الفصح (الخوارزمية الغريغورية)"""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def _observed(d):
+    """قاعدة NYSE: عطلة السبت تنتقل للجمعة، وعطلة الأحد للاثنين"""
+    if d.weekday() == 5:
+        return d - timedelta(days=1)
+    if d.weekday() == 6:
+        return d + timedelta(days=1)
+    return d
+
+
+@lru_cache(maxsize=None)
+def _nyse_holidays(year):
+    holidays = {
+        _nth_weekday(year, 1, 0, 3),        # Martin Luther King Jr. Day
+        _nth_weekday(year, 2, 0, 3),        # Presidents' Day
+        _easter(year) - timedelta(days=2),  # Good Friday
+        _nth_weekday(year, 5, 0, -1),       # Memorial Day
+        _observed(date(year, 7, 4)),        # Independence Day
+        _nth_weekday(year, 9, 0, 1),        # Labor Day
+        _nth_weekday(year, 11, 3, 4),       # Thanksgiving
+        _observed(date(year, 12, 25)),      # Christmas
+    }
+    # رأس السنة: لا تغلق البورصة يوم الجمعة 31 ديسمبر إذا وقع 1 يناير سبتاً
+    new_year = date(year, 1, 1)
+    if new_year.weekday() != 5:
+        holidays.add(_observed(new_year))
+    if year >= 2022:
+        holidays.add(_observed(date(year, 6, 19)))  # Juneteenth
+    holidays.update(date.fromisoformat(d) for d in NYSE_SPECIAL_CLOSURES if d.startswith(str(year)))
+    return frozenset(holidays)
+
+
+@lru_cache(maxsize=None)
+def _saudi_holidays(year):
+    holidays = {date(year, month, day) for month, day in SAUDI_FIXED_HOLIDAYS}
+    for start, end in SAUDI_EID_CLOSURES:
+        d, last = date.fromisoformat(start), date.fromisoformat(end)
+        while d <= last:
+            if d.year == year:
+                holidays.add(d)
+            d += timedelta(days=1)
+    return frozenset(holidays)
+
+
+def holidays(market, year):
+    """مجموعة العطل الرسمية للسوق في سنة معينة"""
+    base = _saudi_holidays(year) if market == 'saudi' else _nyse_holidays(year)
+    extra = {d for d in _env_holidays(market) if d.year == year}
+    return base | extra
+
+
+def is_trading_day(market, d):
+    """هل التاريخ يوم تداول في السوق المحدد"""
+    cal = CALENDARS[market]
+    return d.weekday() not in cal['weekend'] and d not in holidays(market, d.year)
+
+
+def trading_days(market, start, end):
+    """
+    قائمة أيام التداول بين تاريخين (شاملة)
+
+    Args:
+        market: 'saudi' or 'us'
+        start: date
+        end: date
+
+    Returns:
+        list of date
+    """
+    days = []
+    d = start
+    while d <= end:
+        if is_trading_day(market, d):
+            days.append(d)
+        d += timedelta(days=1)
+    return days
+
+
+def previous_trading_day(market, d):
+    """آخر يوم تداول قبل التاريخ المحدد (غير شامل)"""
+    d -= timedelta(days=1)
+    while not is_trading_day(market, d):
+        d -= timedelta(days=1)
+    return d
+
+
+def market_now(market, now=None):
+    """الوقت الحالي بتوقيت السوق"""
+    tz = ZoneInfo(CALENDARS[market]['tz'])
+    if now is None:
+        return datetime.now(tz)
+    if now.tzinfo is None:
+        now = now.astimezone()
+    return now.astimezone(tz)
+
+
+def session_close(market, d):
+    """وقت إغلاق جلسة يوم معين (بتوقيت السوق)"""
+    cal = CALENDARS[market]
+    return datetime.combine(d, cal['close'], tzinfo=ZoneInfo(cal['tz']))
+
+
+def last_session(market, now=None, include_open=False):
+    """
+    آخر جلسة يفترض أن بياناتها متوفرة.
+
+    Args:
+        market: 'saudi' or 'us'
+        now: datetime (اختياري)
+        include_open: اعتبار جلسة اليوم إذا كانت قد بدأت ولم تغلق بعد
+
+    Returns:
+        date
+    """
+    local = market_now(market, now)
+    today = local.date()
+    if is_trading_day(market, today):
+        cal = CALENDARS[market]
+        threshold = cal['open'] if include_open else cal['close']
+        if local.time() >= threshold:
+            return today
+    return previous_trading_day(market, today)
+
+
+def expected_sessions(market, last_date, now=None, include_open=False):
+    """
+    الجلسات المتوقعة غير الموجودة بعد آخر تاريخ محفوظ للسهم.
+
+    Args:
+        market: 'saudi' or 'us'
+        last_date: آخر تاريخ في ملف السهم (date)
+        now: datetime (اختياري)
+        include_open: اعتبار جلسة اليوم الجارية
+
+    Returns:
+        list of date (فارغة إذا كان السهم محدثاً)
+    """
+    return trading_days(market, last_date + timedelta(days=1), last_session(market, now, include_open))
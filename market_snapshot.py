@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Market Snapshot for MeshalStock
+لقطة السوق (آخر سعر والتغير والحجم لكل رمز) كأعمدة numpy، مع الترتيب والتصفية
+والتقسيم لصفحات على الخادم
+
+تحسب اللقطة لجميع الرموز دفعة واحدة من مصفوفات market_store (بدون حلقة على الملفات)
+
+الأعمدة: symbol, name, price, change, change_percent, volume
+"""
+
+import numpy as np
+
+FIELDS = ['symbol', 'name', 'price', 'change', 'change_percent', 'volume']
+SORT_KEYS = ('change_percent', 'change', 'price', 'volume', 'symbol')
+
+
+def empty_snapshot():
+    """لقطة بدون صفوف"""
+    return records_to_snapshot([])
+
+
+def snapshot_rows(data, target_date=None):
+    """
+    صفوف اللقطة لجميع الرموز: آخر صف في التاريخ أو قبله والصف السابق له
+
+    نفس القواعد للقطة المحسوبة من الذاكرة واللقطات اليومية المحفوظة (daily_snapshots):
+    الرموز ذات صفين على الأقل، والصف السابق هو نفس الصف إذا كان أول صف للرمز،
+    وتستبعد الرموز ذات القيم غير المحدودة (مثل إغلاق سابق = 0).
+
+    Args:
+        data: MarketData
+        target_date: np.datetime64 - آخر صف في هذا التاريخ أو قبله لكل رمز (None = آخر صف)
+
+    Returns:
+        (symbol_ids, last, prev) - أرقام الرموز وصف اللقطة والصف السابق لكل منها
+    """
+    starts = data.offsets[:-1]
+    ends = data.offsets[1:]
+    valid = (ends - starts) >= 2
+
+    if target_date is None:
+        last = ends - 1
+    else:
+        # بحث ثنائي واحد لجميع الرموز في فهرس التواريخ
+        last = data.as_of_rows(target_date)
+        valid &= last >= starts
+
+    symbol_ids = np.flatnonzero(valid)
+    last = last[symbol_ids]
+    prev = np.maximum(last - 1, starts[symbol_ids])
+
+    price = data.close[last]
+    prev_close = data.close[prev]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change_pct = (price - prev_close) / prev_close * 100
+    ok = np.isfinite(price) & np.isfinite(change_pct) & np.isfinite(data.volume[last])
+    return symbol_ids[ok], last[ok], prev[ok]
+
+
+def compute_snapshot(data, names=None, target_date=None):
+    """
+    آخر سعر وتغيره عن الإغلاق السابق لجميع الرموز كعمليات على المصفوفات
+
+    Args:
+        data: MarketData
+        names: dict الرمز -> الاسم (للسعودي: مع أو بدون .SR)
+        target_date: np.datetime64 - آخر صف في هذا التاريخ أو قبله لكل رمز (None = آخر صف)
+
+    Returns:
+        (snapshot, as_of) - as_of أحدث تاريخ مستخدم (np.datetime64) أو None
+    """
+    names = names or {}
+    rows, last, prev = snapshot_rows(data, target_date)
+
+    price = data.close[last]
+    prev_close = data.close[prev]
+    change = price - prev_close
+    change_pct = change / prev_close * 100
+
+    symbols = np.array(data.symbols, dtype=object)[rows]
+    snapshot = {
+        'symbol': symbols,
+        'name': symbol_names(symbols, names),
+        'price': np.round(price, 2),
+        'change': np.round(change, 2),
+        'change_percent': np.round(change_pct, 2),
+        'volume': data.volume[last].astype(np.int64),
+    }
+    as_of = data.date[last].max() if len(last) else None
+    return snapshot, as_of
+
+
+def daily_frame_to_snapshot(frame, names=None):
+    """لقطة يوم محفوظة (daily_snapshots) -> أعمدة اللقطة"""
+    symbols = frame['symbol'].to_numpy(dtype=object)
+    close = frame['close'].to_numpy(dtype=np.float64)
+    return {
+        'symbol': symbols,
+        'name': symbol_names(symbols, names or {}),
+        'price': np.round(close, 2),
+        'change': np.round(close - frame['prev_close'].to_numpy(dtype=np.float64), 2),
+        'change_percent': np.round(frame['change_percent'].to_numpy(dtype=np.float64), 2),
+        'volume': frame['volume'].to_numpy(dtype=np.int64),
+    }
+
+
+def symbol_names(symbols, names):
+    """الاسم لكل رمز (للسعودي: بدون .SR ثم مع .SR، وإلا الرمز نفسه)"""
+    return np.array([names.get(s.replace('.SR', ''), names.get(s, s)) for s in symbols], dtype=object)
+
+
+def records_to_snapshot(records):
+    """قائمة كائنات (الصيغة الحالية لبيانات السوق) -> أعمدة numpy"""
+    return {
+        'symbol': np.array([r['symbol'] for r in records], dtype=object),
+        'name': np.array([r['name'] for r in records], dtype=object),
+        'price': np.array([r['price'] for r in records], dtype=np.float64),
+        'change': np.array([r['change'] for r in records], dtype=np.float64),
+        'change_percent': np.array([r['change_percent'] for r in records], dtype=np.float64),
+        'volume': np.array([r['volume'] for r in records], dtype=np.int64),
+    }
+
+
+def snapshot_records(snapshot):
+    """أعمدة اللقطة -> قائمة كائنات"""
+    columns = [snapshot[field].tolist() for field in FIELDS]
+    return [dict(zip(FIELDS, row)) for row in zip(*columns)]
+
+
+def query_snapshot(snapshot, sort=None, descending=True, min_change=None, max_change=None,
+                   min_volume=None, limit=None, offset=0):
+    """
+    تصفية وترتيب وتقسيم اللقطة
+
+    الترتيب مع limit يستخدم argpartition لاختيار أعلى offset+limit صف فقط
+    ثم يرتبها (بدلاً من ترتيب السوق بالكامل).
+
+    Args:
+        snapshot: أعمدة اللقطة
+        sort: مفتاح الترتيب (من SORT_KEYS) أو None للترتيب الأصلي
+        descending: ترتيب تنازلي
+        min_change / max_change: حدود نسبة التغير (%)
+        min_volume: أقل حجم تداول
+        limit: عدد الصفوف (None = الكل)
+        offset: عدد الصفوف المتجاوزة
+
+    Returns:
+        (snapshot_subset, total) - total = عدد الصفوف بعد التصفية وقبل التقسيم
+    """
+    mask = np.ones(len(snapshot['symbol']), dtype=bool)
+    if min_change is not None:
+        mask &= snapshot['change_percent'] >= min_change
+    if max_change is not None:
+        mask &= snapshot['change_percent'] <= max_change
+    if min_volume is not None:
+        mask &= snapshot['volume'] >= min_volume
+    rows = np.flatnonzero(mask)
+    total = len(rows)
+
+    end = total if limit is None else min(offset + limit, total)
+    if sort is not None and offset < end:
+        if sort == 'symbol':
+            # ترتيب نصي: لا يدعم argpartition على object
+            keys = snapshot['symbol'][rows].astype(str)
+            order = np.argsort(keys, kind='stable')
+            if descending:
+                order = order[::-1]
+        else:
+            keys = snapshot[sort][rows].astype(np.float64)
+            if descending:
+                keys = -keys
+            if end < total:
+                top = np.argpartition(keys, end - 1)[:end]
+                order = top[np.argsort(keys[top], kind='stable')]
+            else:
+                order = np.argsort(keys, kind='stable')
+        rows = rows[order]
+
+    rows = rows[offset:end]
+    return {field: values[rows] for field, values in snapshot.items()}, total
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Market Store for MeshalStock
+بيانات كل سوق في الذاكرة كمصفوفات عمودية (columnar)
+
+جميع أسهم السوق في مصفوفات متصلة (date, open, high, low, close, volume)
+مرتبة حسب الرمز ثم التاريخ، و offsets تحدد بداية ونهاية كل رمز:
+    بيانات الرمز رقم i هي [offsets[i], offsets[i+1])
+"""
+
+import os
+import time
+import threading
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DATA_DIRS = {
+    'saudi': os.path.join(BASE_DIR, 'data_sa'),
+    'us': os.path.join(BASE_DIR, 'data_us'),
+}
+
+PRICE_FIELDS = ['open', 'high', 'low', 'close', 'volume']
+# مسافة مفتاح (رمز، تاريخ): الأيام منذ 1970 أقل من هذا الرقم حتى سنة 2243
+KEY_STRIDE = 100000
+# عدد التواريخ المعروضة في قائمة التواريخ المتاحة
+AVAILABLE_DATES_COUNT = 30
+CSV_COLUMNS = ['Date', 'Open', 'High', 'Low', 'Close', 'Volume']
+
+
+class MarketData:
+    """لقطة ثابتة لبيانات سوق واحد (لا تعدل بعد الإنشاء)"""
+
+    def __init__(self, market, symbols, offsets, columns, source, version):
+        """
+        Args:
+            market: 'saudi' or 'us'
+            symbols: list of str (مرتبة)
+            offsets: np.ndarray int64 بطول len(symbols) + 1
+            columns: dict بالمفاتيح date (datetime64[D]) و PRICE_FIELDS (float64)
+            source: 'csv' or 'supabase'
+            version: رقم يتغير عند تغير البيانات (آخر تعديل للملفات أو وقت التحميل)
+        """
+        self.market = market
+        self.symbols = list(symbols)
+        self.offsets = offsets
+        self.date = columns['date']
+        self.open = columns['open']
+        self.high = columns['high']
+        self.low = columns['low']
+        self.close = columns['close']
+        self.volume = columns['volume']
+        self.source = source
+        self.version = version
+        self.loaded_at = time.time()
+        self.symbol_index = {symbol: i for i, symbol in enumerate(self.symbols)}
+
+        # فهرس التواريخ: تواريخ التداول في السوق، ومفتاح (رقم الرمز، التاريخ) مرتب لكل صف
+        # للبحث الثنائي "كما في تاريخ" لجميع الرموز دفعة واحدة
+        self.trading_dates = np.unique(self.date)
+        lengths = np.diff(self.offsets)
+        self.row_keys = (np.repeat(np.arange(len(self.symbols), dtype=np.int64), lengths) * KEY_STRIDE
+                         + self.date.astype(np.int64))
+        self.available_dates = np.datetime_as_string(
+            self.trading_dates[::-1][:AVAILABLE_DATES_COUNT], unit='D').tolist()
+
+    def __len__(self):
+        return len(self.symbols)
+
+    @property
+    def lengths(self):
+        """عدد الصفوف لكل رمز"""
+        return np.diff(self.offsets)
+
+    def as_of_rows(self, target_date):
+        """
+        آخر صف لكل رمز في target_date أو قبله (بحث ثنائي واحد لجميع الرموز)
+
+        Returns:
+            np.ndarray int64 بطول عدد الرموز - رقم الصف أو offsets[i] - 1 إذا لا يوجد صف
+        """
+        day = np.datetime64(target_date, 'D').astype(np.int64)
+        targets = np.arange(len(self.symbols), dtype=np.int64) * KEY_STRIDE + day
+        return np.searchsorted(self.row_keys, targets, side='right') - 1
+
+    def shared_prefix(self, other):
+        """
+        الصفوف المشتركة مع بيانات أحدث لنفس السوق (بيانات أضيفت في نهاية كل رمز فقط)
+
+        Args:
+            other: MarketData أحدث
+
+        Returns:
+            (index, kept) لكل رمز في other: رقمه هنا (-1 إذا لم يوجد)، وعدد صفوفه هنا
+            إذا كانت مطابقة لأول صفوفه في other (0 إذا تغيرت أو حذفت صفوف سابقة)
+        """
+        index = np.array([self.symbol_index.get(symbol, -1) for symbol in other.symbols], dtype=np.int64)
+        j = np.maximum(index, 0)
+        mine = self.lengths[j] if len(self.symbols) else np.zeros(len(index), dtype=np.int64)
+        kept = np.where((index >= 0) & (mine <= other.lengths), mine, 0)
+
+        rows = segment_rows(self.offsets[:-1][j], kept)
+        other_rows = segment_rows(other.offsets[:-1], kept)
+        changed = self.date[rows] != other.date[other_rows]
+        for field in PRICE_FIELDS:
+            changed |= getattr(self, field)[rows] != getattr(other, field)[other_rows]
+        owners = np.repeat(np.arange(len(index), dtype=np.int64), kept)
+        kept[np.unique(owners[changed])] = 0
+        return index, kept
+
+    def bounds(self, symbol):
+        """(start, end) لصفوف الرمز أو None"""
+        i = self.symbol_index.get(symbol)
+        if i is None:
+            return None
+        return int(self.offsets[i]), int(self.offsets[i + 1])
+
+    def frame(self, symbol):
+        """
+        بيانات رمز واحد كـ DataFrame بأعمدة: Date, Open, High, Low, Close, Volume
+
+        Returns:
+            DataFrame أو None إذا لم يوجد الرمز
+        """
+        bounds = self.bounds(symbol)
+        if bounds is None or bounds[0] == bounds[1]:
+            return None
+        start, end = bounds
+        return pd.DataFrame({
+            'Date': pd.to_datetime(self.date[start:end]),
+            'Open': self.open[start:end],
+            'High': self.high[start:end],
+            'Low': self.low[start:end],
+            'Close': self.close[start:end],
+            'Volume': self.volume[start:end].astype(np.int64),
+        })
+
+
+def segment_rows(starts, lengths):
+    """أرقام الصفوف [starts[i], starts[i] + lengths[i]) لجميع i متتالية"""
+    lengths = np.asarray(lengths, dtype=np.int64)
+    total = int(lengths.sum())
+    if total == 0:
+        return np.array([], dtype=np.int64)
+    shift = np.repeat(starts - np.r_[0, np.cumsum(lengths)[:-1]], lengths)
+    return shift + np.arange(total, dtype=np.int64)
+
+
+def build_market_data(market, df, source, version):
+    """
+    بناء MarketData من DataFrame طويل بأعمدة: symbol, date, open, high, low, close, volume
+    """
+    if df is None or df.empty:
+        empty = {'date': np.array([], dtype='datetime64[D]')}
+        empty.update({field: np.array([], dtype=np.float64) for field in PRICE_FIELDS})
+        return MarketData(market, [], np.zeros(1, dtype=np.int64), empty, source, version)
+
+    df = df.dropna(subset=['symbol', 'date', 'close'])
+    df = df.drop_duplicates(subset=['symbol', 'date'], keep='last')
+    df = df.sort_values(['symbol', 'date'], kind='mergesort')
+
+    symbols_col = df['symbol'].to_numpy()
+    starts = np.flatnonzero(np.r_[True, symbols_col[1:] != symbols_col[:-1]])
+    offsets = np.append(starts, len(df)).astype(np.int64)
+
+    columns = {'date': df['date'].to_numpy(dtype='datetime64[D]')}
+    for field in PRICE_FIELDS:
+        columns[field] = pd.to_numeric(df[field], errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+
+    return MarketData(market, symbols_col[starts].tolist(), offsets, columns, source, version)
+
+
+def csv_version(market):
+    """آخر وقت تعديل لملفات السوق (يتغير بعد كل عملية جلب تكتب بيانات)"""
+    directory = DATA_DIRS[market]
+    if not os.path.exists(directory):
+        return 0.0
+    latest = os.path.getmtime(directory)
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.endswith('.csv'):
+                latest = max(latest, entry.stat().st_mtime)
+    return latest
+
+
+def load_market_from_csv(market):
+    """تحميل جميع ملفات CSV للسوق في MarketData واحد"""
+    directory = DATA_DIRS[market]
+    version = csv_version(market)
+    frames = []
+    if os.path.exists(directory):
+        for filename in sorted(os.listdir(directory)):
+            if not filename.endswith('.csv'):
+                continue
+            try:
+                df = pd.read_csv(os.path.join(directory, filename), usecols=CSV_COLUMNS)
+            except (ValueError, pd.errors.EmptyDataError) as e:
+                print(f"Skipping {filename}: {e}")
+                continue
+            df['symbol'] = filename[:-4]
+            frames.append(df)
+
+    if not frames:
+        return build_market_data(market, None, 'csv', version)
+
+    df = pd.concat(frames, ignore_index=True)
+    df = df.rename(columns={col: col.lower() for col in CSV_COLUMNS})
+    df['date'] = pd.to_datetime(df['date'], errors='coerce')
+    return build_market_data(market, df, 'csv', version)
+
+
+def has_csv_data(market):
+    """هل توجد ملفات CSV محلية للسوق"""
+    directory = DATA_DIRS[market]
+    return os.path.exists(directory) and any(f.endswith('.csv') for f in os.listdir(directory))
+
+
+class MarketStore:
+    """
+    ذاكرة مشتركة لبيانات الأسواق.
+    يحمّل كل سوق مرة واحدة عند أول طلب، ويعاد التحميل بعد كل عملية جلب.
+    """
+
+    def __init__(self, loader):
+        """
+        Args:
+            loader: دالة (market) -> MarketData
+        """
+        self.loader = loader
+        self.data = {}
+        self.lock = threading.Lock()
+        self.market_locks = {market: threading.Lock() for market in DATA_DIRS}
+
+    def get(self, market):
+        """بيانات السوق (تحميل عند أول استخدام - تحميل واحد فقط في نفس الوقت)"""
+        data = self.data.get(market)
+        if data is not None:
+            return data
+        with self.market_locks[market]:
+            data = self.data.get(market)
+            if data is None:
+                data = self._load(market)
+        return data
+
+    def refresh(self, market):
+        """إعادة تحميل السوق (بعد انتهاء عملية جلب)"""
+        with self.market_locks[market]:
+            return self._load(market)
+
+    def _load(self, market):
+        started = time.perf_counter()
+        data = self.loader(market)
+        with self.lock:
+            self.data[market] = data
+        print(f"Market store: loaded {market} ({len(data)} symbols, {len(data.date)} rows, "
+              f"source={data.source}) in {time.perf_counter() - started:.2f}s")
+        return data
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Refresh Scheduler for MeshalStock
+تحديث تلقائي لبيانات كل سوق بعد إغلاق جلسته (تداول ونيويورك، حسب توقيت كل سوق)
+
+- يعمل في thread داخل الخادم، ويعمل في عامل gunicorn واحد فقط (قفل ملف)
+- يرسل مهمة جلب تزايدية عبر طابور المهام بعد الإغلاق بـ delay_minutes
+- إذا فات موعد التحديث (الخادم كان متوقفاً) يعمل فوراً عند التشغيل
+- يحفظ آخر تشغيل لكل سوق في ملف JSON لتقرأه جميع العمّال
+"""
+
+import os
+import json
+import threading
+from datetime import datetime, timedelta, timezone
+
+import market_calendar
+
+try:
+    import fcntl
+except ImportError:  # Windows: لا يوجد قفل ملفات، يعمل كل مثيل
+    fcntl = None
+
+# أقصى مدة نوم بين مراجعات الجدول (تغيير التوقيت الصيفي أو ساعة النظام)
+MAX_SLEEP_SECONDS = 300
+
+
+class RefreshScheduler:
+    """جدولة التحديث اليومي بعد إغلاق الأسواق"""
+
+    def __init__(self, markets, trigger, delay_minutes=30, lock_path=None, state_path=None, is_busy=None):
+        """
+        Args:
+            markets: list of market names
+            trigger: دالة (market) -> job_id ترسل مهمة الجلب
+            delay_minutes: الدقائق بعد الإغلاق قبل التحديث (حتى تكتمل بيانات yfinance)
+            lock_path: ملف القفل (عامل واحد فقط يشغل الجدولة)
+            state_path: ملف حفظ آخر تشغيل (None لتعطيل الحفظ)
+            is_busy: دالة () -> bool لتأجيل التحديث (مثلاً أثناء تهيئة البيانات الأولى)
+        """
+        self.markets = list(markets)
+        self.trigger = trigger
+        self.delay = timedelta(minutes=delay_minutes)
+        self.lock_path = lock_path
+        self.state_path = state_path
+        self.is_busy = is_busy
+
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.lock_file = None
+        self.next_runs = {}
+        self.last_runs = self._load_state()
+
+    # ----------------------------------------
+    # الجدول
+    # ----------------------------------------
+
+    def next_run(self, market, now=None):
+        """موعد التحديث القادم للسوق (datetime بتوقيت السوق)"""
+        now = market_calendar.market_now(market, now)
+        d = now.date()
+        while True:
+            if market_calendar.is_trading_day(market, d):
+                run_at = market_calendar.session_close(market, d) + self.delay
+                if run_at > now:
+                    return run_at
+            d += timedelta(days=1)
+
+    def last_due(self, market, now=None):
+        """آخر موعد تحديث مضى (datetime بتوقيت السوق)"""
+        now = market_calendar.market_now(market, now)
+        d = now.date()
+        while True:
+            if market_calendar.is_trading_day(market, d):
+                run_at = market_calendar.session_close(market, d) + self.delay
+                if run_at <= now:
+                    return run_at
+            d -= timedelta(days=1)
+
+    # ----------------------------------------
+    # التشغيل
+    # ----------------------------------------
+
+    def start(self):
+        """
+        بدء الجدولة إذا حصلت هذه العملية على القفل
+
+        Returns:
+            bool: True إذا بدأت الجدولة في هذه العملية
+        """
+        if self.thread is not None:
+            return True
+        if not self._acquire_lock():
+            print("Refresh scheduler: running in another worker")
+            return False
+
+        now = datetime.now(timezone.utc)
+        for market in self.markets:
+            last = self.last_runs.get(market, {}).get('scheduled_for')
+            # موعد فائت لم يعمل (الخادم كان متوقفاً): تشغيل فوري
+            if last is None or datetime.fromisoformat(last) < self.last_due(market, now):
+                self.next_runs[market] = now
+            else:
+                self.next_runs[market] = self.next_run(market, now)
+
+        self.thread = threading.Thread(target=self._loop, name='refresh-scheduler', daemon=True)
+        self.thread.start()
+        print("Refresh scheduler started: " + ", ".join(
+            f"{market} at {run_at.isoformat(timespec='minutes')}" for market, run_at in self.next_runs.items()))
+        return True
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _loop(self):
+        while not self.stop_event.is_set():
+            now = datetime.now(timezone.utc)
+            for market, run_at in list(self.next_runs.items()):
+                if run_at <= now:
+                    self._run_market(market, now)
+            wake = min(self.next_runs.values())
+            wait = (wake - datetime.now(timezone.utc)).total_seconds()
+            self.stop_event.wait(min(max(wait, 1), MAX_SLEEP_SECONDS))
+
+    def _run_market(self, market, now):
+        if self.is_busy and self.is_busy():
+            print(f"Refresh scheduler: {market} postponed (data initialization in progress)")
+            self.next_runs[market] = now + timedelta(minutes=10)
+            return
+
+        scheduled_for = self.last_due(market, now)
+        try:
+            job_id = self.trigger(market)
+        except Exception as e:
+            print(f"Refresh scheduler: could not start {market} refresh: {e}")
+            self.next_runs[market] = now + timedelta(minutes=10)
+            return
+
+        print(f"Refresh scheduler: {market} refresh started (job {job_id})")
+        with self.lock:
+            self.last_runs[market] = {
+                'job_id': job_id,
+                'scheduled_for': scheduled_for.isoformat(),
+                'triggered_at': datetime.now(timezone.utc).isoformat(),
+                'status': 'running',
+            }
+        self._save_state()
+        self.next_runs[market] = self.next_run(market, now)
+
+    def record(self, job_id, market, **fields):
+        """تسجيل نتيجة مهمة أطلقتها الجدولة (الحالة والتوقيتات)"""
+        with self.lock:
+            run = self.last_runs.get(market)
+            if run is None or run.get('job_id') != job_id:
+                return
+            run.update(fields)
+        self._save_state()
+
+    def status(self):
+        """الجدول وآخر تشغيل لكل سوق"""
+        now = datetime.now(timezone.utc)
+        active = self.thread is not None
+        # العمّال الآخرون يقرؤون آخر تشغيل من ملف الحالة
+        last_runs = self.last_runs if active else self._load_state()
+        markets = {}
+        for market in self.markets:
+            next_run = self.next_runs.get(market) if active else None
+            markets[market] = {
+                'timezone': market_calendar.CALENDARS[market]['tz'],
+                'next_run': (next_run or self.next_run(market, now)).isoformat(),
+                'last_run': last_runs.get(market),
+            }
+        return {
+            'active_in_this_worker': active,
+            'delay_minutes': int(self.delay.total_seconds() // 60),
+            'markets': markets,
+        }
+
+    # ----------------------------------------
+    # القفل والحفظ
+    # ----------------------------------------
+
+    def _acquire_lock(self):
+        if not self.lock_path or fcntl is None:
+            return True
+        try:
+            self.lock_file = open(self.lock_path, 'a')
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            if self.lock_file:
+                self.lock_file.close()
+                self.lock_file = None
+            return False
+
+    def _load_state(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return {}
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠ Could not load refresh schedule state: {e}")
+            return {}
+
+    def _save_state(self):
+        if not self.state_path:
+            return
+        with self.lock:
+            state = json.dumps(self.last_runs, ensure_ascii=False)
+        tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(state)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            print(f"⚠ Could not persist refresh schedule state: {e}")
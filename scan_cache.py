@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Scan Cache for MeshalStock
+نتائج الفحوصات (فيبو/جان والأسبوعي) محفوظة في الذاكرة لكل سوق
+
+النتيجة صالحة ما دام إصدار بيانات السوق (MarketData.version) ويوم الحساب لم يتغيرا،
+وتحسب مسبقاً بعد كل تحديث للبيانات حتى لا ينتظر أول مستخدم.
+
+نتائج التواريخ السابقة (as_of) تحفظ كنسخ (variant) مستقلة، بحد أقصى MAX_VARIANTS
+(الأقدم استخداماً يحذف أولاً).
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+
+# أقصى عدد نتائج محفوظة لتواريخ سابقة (as_of) لجميع الفحوصات
+MAX_VARIANTS = 64
+
+
+class ScanCache:
+    """ذاكرة نتائج الفحوصات مع حساب واحد فقط لكل فحص في نفس الوقت"""
+
+    def __init__(self):
+        self.entries = {}   # (name, market) -> entry
+        self.variants = OrderedDict()  # (name, market, variant) -> entry
+        self.lock = threading.Lock()
+        self.key_locks = {}
+
+    def _key_lock(self, key):
+        with self.lock:
+            return self.key_locks.setdefault(key, threading.Lock())
+
+    def get(self, name, market, version, compute, variant=None):
+        """
+        نتيجة الفحص من الذاكرة أو حسابها
+
+        Args:
+            name: اسم الفحص ('fibo_gann' أو 'weekly')
+            market: 'saudi' or 'us'
+            version: إصدار بيانات السوق الحالي
+            compute: دالة بدون وسائط تعيد نتيجة الفحص
+            variant: نسخة مستقلة من الفحص (مثل تاريخ as_of) أو None للفحص الحالي
+
+        Returns:
+            نتيجة الفحص
+        """
+        key = (name, market) if variant is None else (name, market, variant)
+        entry = self._lookup(key)
+        if self._valid(entry, version):
+            return entry['result']
+
+        with self._key_lock(key):
+            entry = self._lookup(key)
+            if self._valid(entry, version):
+                return entry['result']
+            return self.compute(name, market, version, compute, variant)['result']
+
+    def _lookup(self, key):
+        with self.lock:
+            if len(key) == 2:
+                return self.entries.get(key)
+            entry = self.variants.get(key)
+            if entry is not None:
+                self.variants.move_to_end(key)
+            return entry
+
+    def compute(self, name, market, version, compute, variant=None):
+        """حساب الفحص وحفظه (يستخدم للحساب المسبق بعد التحديث)"""
+        started = time.perf_counter()
+        result = compute()
+        entry = {
+            'result': result,
+            'version': version,
+            'day': date.today(),
+            'computed_at': datetime.now().isoformat(),
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+        }
+        with self.lock:
+            if variant is None:
+                self.entries[(name, market)] = entry
+            else:
+                self.variants[(name, market, variant)] = entry
+                self.variants.move_to_end((name, market, variant))
+                while len(self.variants) > MAX_VARIANTS:
+                    key, _ = self.variants.popitem(last=False)
+                    self.key_locks.pop(key, None)
+        return entry
+
+    def info(self):
+        """وقت ومدة آخر حساب لكل فحص"""
+        with self.lock:
+            return {
+                f"{name}/{market}": {key: entry[key] for key in ('computed_at', 'elapsed_ms', 'version')}
+                for (name, market), entry in self.entries.items()
+            }
+
+    @staticmethod
+    def _valid(entry, version):
+        return entry is not None and entry['version'] == version and entry['day'] == date.today()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Scan Kernels for MeshalStock
+نوى حلقات فحص فيبو/جان على مصفوفات مقسّمة (صفوف المقطع i هي [starts[i], ends[i]))
+
+    first_peaks     أقل قاع في كل مقطع وأول قمة محلية بعده (خلال limit شمعة)
+    level_values    مستويات جان وفيبوناتشي السبعة (ترتيب LEVEL_TYPES)
+    candle_levels   أول مستوى تلامسه الشمعة وتغلق فوقه (اختراق أو ارتداد)
+
+كل نواة بنسختين بنفس النتائج: حلقة مترجمة بـ Numba (إذا كانت مثبتة) ونسخة NumPy.
+SCAN_JIT=False يفرض نسخة NumPy. للمقارنة: python benchmark_scans.py saudi
+"""
+
+import os
+
+import numpy as np
+
+from market_store import segment_rows
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+JIT_AVAILABLE = njit is not None
+USE_JIT = JIT_AVAILABLE and os.getenv('SCAN_JIT', 'True').lower() in ('true', '1', 'yes')
+
+LEVEL_COUNT = 7
+
+
+# ========== حلقات (تترجم بـ Numba) ==========
+
+def _first_peaks_loop(low, high, starts, ends, limit):
+    count = len(starts)
+    min_idx = np.full(count, -1, np.int64)
+    peak_idx = np.full(count, -1, np.int64)
+    for k in range(count):
+        start, end = starts[k], ends[k]
+        if end <= start:
+            continue
+        m = start
+        for r in range(start + 1, end):
+            if low[r] < low[m]:
+                m = r
+        min_idx[k] = m
+        # نفس calculate_levels السابقة: i في range(1, min(len - 1, limit)) من القاع
+        for r in range(m + 1, m + min(end - m - 1, limit)):
+            if high[r] > high[r - 1] and high[r] > high[r + 1]:
+                peak_idx[k] = r
+                break
+    return min_idx, peak_idx
+
+
+def _level_values_loop(min_low, peak_high):
+    levels = np.empty((len(min_low), LEVEL_COUNT))
+    for k in range(len(min_low)):
+        low, peak = min_low[k], peak_high[k]
+        sqrt_low = np.sqrt(low)
+        delta = np.sqrt(peak) - sqrt_low
+        fib_range = peak - low
+        levels[k, 0] = (sqrt_low + 2 * delta) ** 2
+        levels[k, 1] = (sqrt_low + 3 * delta) ** 2
+        levels[k, 2] = (sqrt_low + 4 * delta) ** 2
+        levels[k, 3] = peak
+        levels[k, 4] = low + fib_range * 1.618
+        levels[k, 5] = low + fib_range * 2.618
+        levels[k, 6] = low + fib_range * 4.236
+    return levels
+
+
+def _candle_levels_loop(open_, high, low, close, levels):
+    count = len(close)
+    level = np.full(count, -1, np.int64)
+    breakout = np.zeros(count, np.bool_)
+    for k in range(count):
+        for j in range(levels.shape[1]):
+            value = levels[k, j]
+            if low[k] <= value and value <= high[k] and close[k] > value:
+                level[k] = j
+                breakout[k] = open_[k] < value
+                break
+    return level, breakout
+
+
+# ========== نسخة NumPy ==========
+
+def _first_peaks_numpy(low, high, starts, ends, limit):
+    count = len(starts)
+    min_idx = np.full(count, -1, np.int64)
+    peak_idx = np.full(count, -1, np.int64)
+    segments = np.flatnonzero(ends > starts)
+    if len(segments) == 0:
+        return min_idx, peak_idx
+    lengths = (ends - starts)[segments]
+    rows = segment_rows(starts[segments], lengths)
+    bounds = np.r_[0, np.cumsum(lengths)[:-1]]
+    total = len(rows)
+    position = np.arange(total, dtype=np.int64)
+
+    # أول ظهور لأقل قاع في كل مقطع
+    seg_low = low[rows]
+    seg_min = np.minimum.reduceat(seg_low, bounds)
+    first = np.minimum.reduceat(np.where(seg_low == np.repeat(seg_min, lengths), position, total), bounds)
+
+    # أقرب قمة محلية بعد القاع (جارتاها داخل المقطع لأن p <= نهاية المقطع - 2)
+    seg_high = high[rows]
+    is_peak = np.zeros(total, dtype=bool)
+    is_peak[1:-1] = (seg_high[1:-1] > seg_high[:-2]) & (seg_high[1:-1] > seg_high[2:])
+    next_peak = np.minimum.accumulate(np.where(is_peak, position, total)[::-1])[::-1]
+    peak = next_peak[np.minimum(first + 1, total - 1)]
+    tail = bounds + lengths - first
+    found = peak - first <= np.minimum(tail - 2, limit - 1)
+
+    min_idx[segments] = rows[first]
+    peak_idx[segments[found]] = rows[peak[found]]
+    return min_idx, peak_idx
+
+
+def _level_values_numpy(min_low, peak_high):
+    sqrt_low = np.sqrt(min_low)
+    delta = np.sqrt(peak_high) - sqrt_low
+    fib_range = peak_high - min_low
+    return np.column_stack([
+        (sqrt_low + 2 * delta) ** 2,
+        (sqrt_low + 3 * delta) ** 2,
+        (sqrt_low + 4 * delta) ** 2,
+        peak_high,
+        min_low + fib_range * 1.618,
+        min_low + fib_range * 2.618,
+        min_low + fib_range * 4.236,
+    ]).reshape(len(min_low), LEVEL_COUNT)
+
+
+def _candle_levels_numpy(open_, high, low, close, levels):
+    match = (low[:, None] <= levels) & (levels <= high[:, None]) & (close[:, None] > levels)
+    hit = match.any(axis=1)
+    level = np.where(hit, match.argmax(axis=1), -1)
+    value = levels[np.arange(len(close)), np.maximum(level, 0)]
+    return level, hit & (open_ < value)
+
+
+IMPLEMENTATIONS = {
+    'numpy': {
+        'first_peaks': _first_peaks_numpy,
+        'level_values': _level_values_numpy,
+        'candle_levels': _candle_levels_numpy,
+    },
+}
+if JIT_AVAILABLE:
+    IMPLEMENTATIONS['numba'] = {
+        'first_peaks': njit(cache=True, nogil=True)(_first_peaks_loop),
+        'level_values': njit(cache=True, nogil=True)(_level_values_loop),
+        'candle_levels': njit(cache=True, nogil=True)(_candle_levels_loop),
+    }
+
+_active = IMPLEMENTATIONS['numba' if USE_JIT else 'numpy']
+
+
+def active_implementation():
+    """اسم النسخة المستخدمة ('numba' أو 'numpy')"""
+    return 'numba' if USE_JIT else 'numpy'
+
+
+def _floats(values):
+    return np.ascontiguousarray(values, dtype=np.float64)
+
+
+def _indices(values):
+    return np.ascontiguousarray(values, dtype=np.int64)
+
+
+def first_peaks(low, high, starts, ends, limit):
+    """
+    أقل قاع (أول ظهور) في كل مقطع وأول قمة محلية بعده
+
+    القمة: صف أعلى من جارتيه، خلال limit - 1 صف بعد القاع، وجارته التالية داخل المقطع.
+
+    Args:
+        low / high: أعمدة السوق الكاملة
+        starts / ends: حدود المقاطع (صفوف المقطع i هي [starts[i], ends[i]))
+        limit: أقصى بحث عن القمة (بالشموع، شاملاً القاع)
+
+    Returns:
+        (min_idx, peak_idx) - أرقام الصفوف، -1 لمقطع فارغ أو بدون قمة
+    """
+    return _active['first_peaks'](_floats(low), _floats(high), _indices(starts), _indices(ends), int(limit))
+
+
+def level_values(min_low, peak_high):
+    """
+    مستويات جان وفيبوناتشي من القاع والقمة
+
+    Returns:
+        np.ndarray بشكل (n, 7) بترتيب LEVEL_TYPES
+    """
+    return _active['level_values'](_floats(min_low), _floats(peak_high))
+
+
+def candle_levels(open_, high, low, close, levels):
+    """
+    أول مستوى تلامسه كل شمعة (low <= المستوى <= high) وتغلق فوقه
+
+    Args:
+        open_ / high / low / close: قيم الشموع (n)
+        levels: (n, 7) من level_values
+
+    Returns:
+        (level, breakout) - رقم المستوى (-1 بدون تطابق)، True = اختراق (فتحت تحت المستوى)
+    """
+    return _active['candle_levels'](_floats(open_), _floats(high), _floats(low), _floats(close),
+                                    np.ascontiguousarray(levels, dtype=np.float64))
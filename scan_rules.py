@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Scan Rules for MeshalStock
+قواعد فحص فيبو/جان والفحص الأسبوعي مقيّمة لكل رمز في كل تاريخ دفعة واحدة
+(عمليات على مصفوفات السوق بالكامل، بدون حلقة على الرموز أو التواريخ)
+
+نفس منطق compute_fibo_gann_scan و compute_weekly_scan في api_server:
+قيمة الصف r = نتيجة الفحص لو شغّل بـ as_of = تاريخ الصف r.
+"""
+
+import numpy as np
+
+from market_bars import bar_store
+from scan_kernels import candle_levels, level_values
+
+# نافذة البيانات لكل فحص (بالأيام)
+FIBO_GANN_DAYS = {'saudi': 180, 'us': 90}
+WEEKLY_SCAN_DAYS = 180
+
+# أقل عدد شموع في نافذة فيبو/جان، وأقصى بحث عن أول قمة بعد القاع
+FIBO_MIN_BARS = 10
+PEAK_SEARCH_BARS = 50
+
+LEVEL_TYPES = ['Gann 180', 'Gann 270', 'Gann 360', 'Fibo 100', 'Fibo 161.8', 'Fibo 261.8', 'Fibo 423.6']
+
+# الفحص الأسبوعي: أقل عدد صفوف يومية وأسابيع في النافذة، ونطاق القمة السابقة (بالأسابيع)
+WEEKLY_MIN_ROWS = 30
+WEEKLY_MIN_WEEKS = 26
+WEEKLY_PEAK_WEEKS = 25
+
+def rolling_argmin(values, starts):
+    """
+    فهرس أقل قيمة (أول ظهور) في values[starts[i]:i+1] لكل i
+
+    جدول متناثر (sparse table): log2(أطول نافذة) مرور على المصفوفة ثم استعلام واحد لكل صف.
+    """
+    n = len(values)
+    if n == 0:
+        return np.array([], dtype=np.int64)
+    ends = np.arange(n, dtype=np.int64)
+    lengths = ends - starts + 1
+    levels = max(1, int(lengths.max()).bit_length())
+
+    table = np.empty((levels, n), dtype=np.int64)
+    table[0] = ends
+    for k in range(1, levels):
+        half = 1 << (k - 1)
+        left = table[k - 1]
+        right = table[k - 1][np.minimum(ends + half, n - 1)]
+        table[k] = np.where(values[right] < values[left], right, left)
+
+    k = np.floor(np.log2(lengths)).astype(np.int64)
+    left = table[k, starts]
+    right = table[k, ends - (1 << k) + 1]
+    return np.where(values[right] < values[left], right, left)
+
+
+def window_starts(data, days):
+    """أول صف في نافذة الأيام لكل صف (نفس الرمز، التاريخ >= تاريخ الصف - days)"""
+    return np.searchsorted(data.row_keys, data.row_keys - days)
+
+
+def fibo_gann_signals(data, days):
+    """
+    إشارات فيبو/جان (اختراق أو ارتداد) لكل رمز في كل تاريخ
+
+    لكل صف: أقل قاع في النافذة، أول قمة محلية بعده (خلال 50 شمعة)، المستويات السبعة،
+    ثم أول مستوى تلامسه الشمعة ويغلق فوقه.
+
+    Returns:
+        dict: rows (أرقام صفوف الإشارات)، level (رقم المستوى في LEVEL_TYPES)،
+              value (قيمة المستوى)، breakout (True = اختراق، False = ارتداد)
+    """
+    n = len(data.date)
+    empty = {'rows': np.array([], dtype=np.int64), 'level': np.array([], dtype=np.int64),
+             'value': np.array([]), 'breakout': np.array([], dtype=bool)}
+    if n < 3:
+        return empty
+    high, low = data.high, data.low
+    rows = np.arange(n, dtype=np.int64)
+
+    starts = window_starts(data, days)
+    min_idx = rolling_argmin(low, starts)
+    min_low = low[min_idx]
+    # طول الجزء من القاع حتى الصف الحالي
+    tail = rows - min_idx + 1
+    ok = (rows - starts + 1 >= FIBO_MIN_BARS) & (tail >= 3)
+
+    # أول قمة محلية بعد القاع: أقرب صف p >= القاع + 1 بقمة أعلى من جارتيها
+    is_peak = np.zeros(n, dtype=bool)
+    is_peak[1:-1] = (high[1:-1] > high[:-2]) & (high[1:-1] > high[2:])
+    next_peak = np.minimum.accumulate(np.where(is_peak, rows, n)[::-1])[::-1]
+    peak = next_peak[np.minimum(min_idx + 1, n - 1)]
+    ok &= peak - min_idx <= np.minimum(tail - 2, PEAK_SEARCH_BARS - 1)
+    peak_high = high[np.minimum(peak, n - 1)]
+    ok &= peak_high > min_low
+
+    rows = rows[ok]
+    if len(rows) == 0:
+        return empty
+
+    levels = level_values(min_low[ok], peak_high[ok])
+    level, breakout = candle_levels(data.open[rows], data.high[rows], data.low[rows], data.close[rows], levels)
+    hit = level >= 0
+    return {
+        'rows': rows[hit],
+        'level': level[hit],
+        'value': levels[hit, level[hit]],
+        'breakout': breakout[hit],
+    }
+
+
+def weekly_bars(data):
+    """
+    شموع أسبوعية (الاثنين - الأحد، مثل resample('W')) لجميع الرموز من market_bars
+
+    Returns:
+        dict: open, high, low, close, volume، symbol (رقم الرمز)، first_row و last_row لكل أسبوع
+    """
+    return bar_store.get(data, 'weekly', week_start='monday')
+
+
+def weekly_signals(data):
+    """
+    إشارات الفحص الأسبوعي لكل رمز في كل أسبوع
+
+    الأسبوع w مكتمل عند أول يوم تداول في الأسبوع التالي (الفحص يتجاهل الأسبوع الجاري)،
+    فتاريخ الإشارة هو أول صف في الأسبوع w + 1. الشروط الأربعة على الأسبوع w:
+    شمعة خضراء، ظل علوي قصير، إغلاق >= 98% من أعلى قمة في 25 أسبوعاً قبله،
+    وحجم أكبر من أحد الأسبوعين السابقين.
+
+    تقريب: القمة السابقة من الأسابيع الكاملة (الفحص المباشر يقطع أول أسبوع عند بداية النافذة).
+
+    Returns:
+        dict: rows (أرقام صفوف الإشارات)، week_row (آخر صف في الأسبوع w)، volume_ratio، highest
+    """
+    bars = weekly_bars(data)
+    count = len(bars['first_row'])
+    empty = {'rows': np.array([], dtype=np.int64), 'week_row': np.array([], dtype=np.int64),
+             'volume_ratio': np.array([]), 'highest': np.array([])}
+    if count < 4:
+        return empty
+
+    g = np.arange(count, dtype=np.int64)
+    symbol = bars['symbol']
+    symbol_first = np.flatnonzero(np.r_[True, symbol[1:] != symbol[:-1]])
+    position = g - np.repeat(symbol_first, np.diff(np.r_[symbol_first, count]))
+    symbol_start = g - position
+
+    # أعلى قمة في الأسابيع [w - 25, w - 1] (داخل نفس الرمز)
+    peak_idx = rolling_argmin(-bars['high'], np.maximum(g - (WEEKLY_PEAK_WEEKS - 1), symbol_start))
+    highest = np.full(count, np.nan)
+    highest[1:] = bars['high'][peak_idx[:-1]]
+
+    o, h, c, v = bars['open'], bars['high'], bars['close'], bars['volume']
+    ok = position >= WEEKLY_MIN_WEEKS - 2
+    ok[:-1] &= symbol[1:] == symbol[:-1]  # يوجد أسبوع تالٍ لنفس الرمز
+    ok[-1] = False
+
+    body = np.abs(c - o)
+    upper_shadow = h - np.maximum(o, c)
+    short_shadow = np.where(body > 0, upper_shadow < body * 0.3, upper_shadow < 0.01)
+    prev_v = np.r_[np.nan, v[:-1]]
+    prev_prev_v = np.r_[np.nan, np.nan, v[:-2]]
+    with np.errstate(invalid='ignore'):
+        ok &= (c > o) & short_shadow & (c >= highest * 0.98) & ((v > prev_v) | (v > prev_prev_v))
+
+    weeks = np.flatnonzero(ok)
+    max_prev = np.maximum(prev_v[weeks], prev_prev_v[weeks])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(max_prev > 0, v[weeks] / max_prev, 1.0)
+    return {
+        'rows': bars['first_row'][weeks + 1],
+        'week_row': bars['last_row'][weeks],
+        'volume_ratio': ratio,
+        'highest': highest[weeks],
+    }
+
+
+def range_max(values, lo, hi):
+    """أعلى قيمة في values[lo[i]:hi[i]] لكل i (نطاقات غير فارغة، reduceat واحد)"""
+    if len(lo) == 0:
+        return np.array([])
+    bounds = np.column_stack([lo, hi]).ravel()
+    return np.maximum.reduceat(np.r_[values, -np.inf], bounds)[::2]
+
+
+def weekly_scan_candles(data, starts, ends):
+    """
+    الفحص الأسبوعي لجميع الرموز على نافذة صفوف كل رمز [starts[i], ends[i])
+
+    نفس نتيجة resample('W') على صفوف النافذة: الأسابيع من weekly_bars (التاريخ الكامل)،
+    وأول أسبوع في النافذة (قد يبدأ قبلها) تؤخذ قمته من صفوف النافذة فقط.
+
+    Returns:
+        dict: symbols (أرقام الرموز ذات البيانات الكافية)، ولكل منها:
+              week (آخر أسبوع مكتمل في weekly_bars)، label (نهاية الأسبوع الجاري)، highest، prev_volume،
+              green، short_shadow، near_peak، volume_up (الشروط الأربعة، كل شرط مستقل)
+    """
+    bars = weekly_bars(data)
+    # الأسبوع الذي يحوي صف البداية وآخر صف لكل رمز (الأسابيع بترتيب الصفوف)
+    has_rows = ends - starts >= WEEKLY_MIN_ROWS
+    first_week = np.searchsorted(bars['first_row'], starts, side='right') - 1
+    current_week = np.searchsorted(bars['first_row'], ends - 1, side='right') - 1
+    symbols = np.flatnonzero(has_rows & (current_week - first_week + 1 >= WEEKLY_MIN_WEEKS))
+    first_week, current_week = first_week[symbols], current_week[symbols]
+
+    week = current_week - 1
+    o, h, c, v = (bars[field][week] for field in ('open', 'high', 'close', 'volume'))
+    prev_v, prev_prev_v = bars['volume'][week - 1], bars['volume'][week - 2]
+
+    # أعلى قمة في الأسابيع 25 قبل الأسبوع المكتمل (weekly.iloc[-27:-2])
+    lo = np.maximum(current_week - (WEEKLY_PEAK_WEEKS + 1), first_week)
+    partial = lo == first_week
+    highest = range_max(bars['high'], lo + partial, week)
+    partial_high = range_max(data.high, starts[symbols], bars['last_row'][first_week] + 1)
+    highest = np.where(partial, np.maximum(highest, partial_high), highest)
+
+    body = np.abs(c - o)
+    upper_shadow = h - np.maximum(o, c)
+    return {
+        'symbols': symbols,
+        'week': week,
+        'label': bars['date'][current_week] + np.timedelta64(6, 'D'),
+        'highest': highest,
+        'prev_volume': np.maximum(prev_v, prev_prev_v),
+        'green': c > o,
+        'short_shadow': np.where(body > 0, upper_shadow < body * 0.3, upper_shadow < 0.01),
+        'near_peak': c >= highest * 0.98,
+        'volume_up': (v > prev_v) | (v > prev_prev_v),
+    }
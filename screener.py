@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Screener for MeshalStock
+لغة فحص مخصص: شرط يكتبه المستخدم ويقيّم لجميع الرموز دفعة واحدة
+
+مثال:
+    close > sma(50) and volume > 1.5 * avg_volume(20) and weekly.close >= 0.98 * max(weekly.high, 26)
+
+الشرط يحلل مرة واحدة (ast مع قائمة مسموحة فقط، بدون eval) إلى شجرة عقد ثابتة،
+ثم يقيّم كعمليات مصفوفات على جميع صفوف السوق. العقد المتكررة تحسب مرة واحدة،
+ونتائج الدوال (sma و max ...) تحفظ بين الطلبات لنفس إصدار البيانات.
+
+الأعمدة: open, high, low, close, volume (يومي)، و weekly.<عمود> و monthly.<عمود> و quarterly.<عمود>
+لآخر أسبوع / شهر / ربع مكتمل.
+الدوال (n عدد صحيح ثابت، النافذة داخل نفس الرمز؛ بيانات أقل من n = لا يطابق):
+    sma(n) / sma(x, n)      متوسط متحرك (الافتراضي close)
+    avg_volume(n)           متوسط الحجم
+    max(x, n) / min(x, n)   أعلى / أقل قيمة في آخر n
+    prev(x) / prev(x, n)    القيمة قبل n صف (الافتراضي 1)
+    abs(x)
+"""
+
+import ast
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import scan_rules
+from market_bars import bar_store
+from market_store import PRICE_FIELDS
+
+# حدود الشرط (لحماية الخادم من شروط ضخمة)
+MAX_EXPRESSION_LENGTH = 500
+MAX_NODES = 100
+MAX_WINDOW = 1000
+
+TIMEFRAMES = ('weekly', 'monthly', 'quarterly')
+
+# اسم الدالة -> (أقل عدد وسائط، أكثر عدد وسائط)
+FUNCTIONS = {
+    'sma': (1, 2),
+    'avg_volume': (1, 1),
+    'max': (2, 2),
+    'min': (2, 2),
+    'prev': (1, 2),
+    'abs': (1, 1),
+}
+
+_BINARY_OPS = {ast.Add: 'add', ast.Sub: 'sub', ast.Mult: 'mul', ast.Div: 'div'}
+_COMPARE_OPS = {ast.Gt: 'gt', ast.GtE: 'ge', ast.Lt: 'lt', ast.LtE: 'le', ast.Eq: 'eq', ast.NotEq: 'ne'}
+_NUMPY_OPS = {
+    'add': np.add, 'sub': np.subtract, 'mul': np.multiply, 'div': np.divide,
+    'gt': np.greater, 'ge': np.greater_equal, 'lt': np.less, 'le': np.less_equal,
+    'eq': np.equal, 'ne': np.not_equal,
+}
+
+# أقصى عدد نتائج دوال محفوظة بين الطلبات (كل نتيجة مصفوفة بطول صفوف السوق)
+MAX_CACHED_SERIES = 32
+
+
+class ScreenerError(ValueError):
+    """خطأ في صياغة الشرط (يعرض للمستخدم كما هو)"""
+
+
+# ==================== التحليل ====================
+
+def compile_expression(expression):
+    """
+    تحليل الشرط إلى شجرة عقد (tuples قابلة للمقارنة وتستخدم كمفاتيح للتخزين)
+
+    Returns:
+        tuple - جذر الشجرة
+
+    Raises:
+        ScreenerError: صياغة غير صحيحة أو عنصر غير مسموح
+    """
+    expression = (expression or '').strip()
+    if not expression:
+        raise ScreenerError('expression is required')
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        raise ScreenerError(f'expression is longer than {MAX_EXPRESSION_LENGTH} characters')
+    try:
+        tree = ast.parse(expression, mode='eval')
+    except SyntaxError as e:
+        raise ScreenerError(f'invalid expression: {e.msg}') from None
+    if sum(1 for _ in ast.walk(tree)) > MAX_NODES:
+        raise ScreenerError(f'expression has more than {MAX_NODES} parts')
+
+    node = _compile(tree.body)
+    if node[0] not in ('compare', 'and', 'or', 'not'):
+        raise ScreenerError('expression must be a condition (use >, <, and, or ...)')
+    return node
+
+
+def _compile(node):
+    if isinstance(node, ast.BoolOp):
+        op = 'and' if isinstance(node.op, ast.And) else 'or'
+        return (op, tuple(_condition(value) for value in node.values))
+
+    if isinstance(node, ast.UnaryOp):
+        if isinstance(node.op, ast.Not):
+            return ('not', _condition(node.operand))
+        if isinstance(node.op, ast.USub):
+            operand = _number(node.operand)
+            if operand[0] == 'const':
+                return ('const', -operand[1])
+            return ('binop', 'mul', ('const', -1.0), operand)
+        if isinstance(node.op, ast.UAdd):
+            return _number(node.operand)
+
+    if isinstance(node, ast.Compare):
+        # a < b < c -> (a < b) and (b < c)
+        operands = [_number(node.left)] + [_number(value) for value in node.comparators]
+        parts = []
+        for op, left, right in zip(node.ops, operands[:-1], operands[1:]):
+            if type(op) not in _COMPARE_OPS:
+                raise ScreenerError('only >, >=, <, <=, == and != comparisons are allowed')
+            parts.append(('compare', _COMPARE_OPS[type(op)], left, right))
+        return parts[0] if len(parts) == 1 else ('and', tuple(parts))
+
+    if isinstance(node, ast.BinOp):
+        if type(node.op) not in _BINARY_OPS:
+            raise ScreenerError('only +, -, * and / are allowed')
+        return ('binop', _BINARY_OPS[type(node.op)], _number(node.left), _number(node.right))
+
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        try:
+            value = float(node.value)
+        except OverflowError:
+            value = math.inf
+        if not math.isfinite(value):
+            raise ScreenerError(f'number out of range: {node.value!r}'[:100])
+        return ('const', value)
+
+    if isinstance(node, ast.Name):
+        if node.id not in PRICE_FIELDS:
+            raise ScreenerError(f"unknown name '{node.id}' (use {', '.join(PRICE_FIELDS)})")
+        return ('field', 'daily', node.id)
+
+    if isinstance(node, ast.Attribute):
+        if not isinstance(node.value, ast.Name) or node.value.id not in TIMEFRAMES:
+            raise ScreenerError(f"only {', '.join(t + '.<field>' for t in TIMEFRAMES)} is allowed")
+        if node.attr not in PRICE_FIELDS:
+            raise ScreenerError(f"unknown field '{node.attr}' (use {', '.join(PRICE_FIELDS)})")
+        return ('field', node.value.id, node.attr)
+
+    if isinstance(node, ast.Call):
+        return _compile_call(node)
+
+    raise ScreenerError(f"'{ast.unparse(node)}' is not allowed")
+
+
+def _compile_call(node):
+    name = node.func.id if isinstance(node.func, ast.Name) else None
+    if name not in FUNCTIONS:
+        raise ScreenerError(f"unknown function (use {', '.join(FUNCTIONS)})")
+    if node.keywords:
+        raise ScreenerError(f'{name}() does not take keyword arguments')
+    low, high = FUNCTIONS[name]
+    if not low <= len(node.args) <= high:
+        count = low if low == high else f'{low} or {high}'
+        raise ScreenerError(f'{name}() takes {count} arguments')
+
+    args = node.args
+    if name == 'avg_volume':
+        return ('call', 'sma', ('field', 'daily', 'volume'), _window(name, args[0]))
+    if name == 'sma' and len(args) == 1:
+        return ('call', 'sma', ('field', 'daily', 'close'), _window(name, args[0]))
+    if not any(isinstance(child, (ast.Name, ast.Attribute)) for child in ast.walk(args[0])):
+        raise ScreenerError(f'{name}() needs a price field, not a number')
+    if name == 'abs':
+        return ('call', 'abs', _number(args[0]), 0)
+    if name == 'prev' and len(args) == 1:
+        return ('call', 'prev', _number(args[0]), 1)
+    return ('call', name, _number(args[0]), _window(name, args[1]))
+
+
+def _window(name, node):
+    """عدد الصفوف في دالة (عدد صحيح ثابت فقط)"""
+    if not (isinstance(node, ast.Constant) and type(node.value) is int and 1 <= node.value <= MAX_WINDOW):
+        raise ScreenerError(f'{name}() window must be an integer between 1 and {MAX_WINDOW}')
+    return node.value
+
+
+def _number(node):
+    compiled = _compile(node)
+    if compiled[0] in ('compare', 'and', 'or', 'not'):
+        raise ScreenerError(f"'{ast.unparse(node)}' must be a number, not a condition")
+    return compiled
+
+
+def _condition(node):
+    compiled = _compile(node)
+    if compiled[0] not in ('compare', 'and', 'or', 'not'):
+        raise ScreenerError(f"'{ast.unparse(node)}' must be a condition")
+    return compiled
+
+
+# ==================== التقييم ====================
+
+def rolling_window(values, starts, window):
+    """
+    بداية نافذة آخر window صف لكل صف، و valid = النافذة كاملة داخل نفس الرمز
+
+    Returns:
+        (lo, valid)
+    """
+    lo = np.arange(len(values), dtype=np.int64) - (window - 1)
+    return np.maximum(lo, starts), lo >= starts
+
+
+def rolling_sum(values, starts, window):
+    """مجموع آخر window قيمة لكل صف (NaN إذا لم تكتمل النافذة أو فيها NaN)"""
+    lo, valid = rolling_window(values, starts, window)
+    missing = np.isnan(values)
+    sums = np.r_[0.0, np.cumsum(np.where(missing, 0.0, values))]
+    counts = np.r_[0, np.cumsum(missing)]
+    end = np.arange(1, len(values) + 1)
+    valid &= counts[end] == counts[lo]
+    return np.where(valid, sums[end] - sums[lo], np.nan)
+
+
+def rolling_extreme(values, starts, window, largest):
+    """أعلى (largest) أو أقل قيمة في آخر window صف لكل صف"""
+    lo, valid = rolling_window(values, starts, window)
+    if len(values) == 0:
+        return values.copy()
+    idx = scan_rules.rolling_argmin(-values if largest else values, lo)
+    missing = np.r_[0, np.cumsum(np.isnan(values))]
+    valid &= missing[np.arange(1, len(values) + 1)] == missing[lo]
+    return np.where(valid, values[idx], np.nan)
+
+
+def shift(values, starts, periods):
+    """القيمة قبل periods صف لنفس الرمز"""
+    rows = np.arange(len(values), dtype=np.int64) - periods
+    valid = rows >= starts
+    return np.where(valid, values[np.maximum(rows, 0)], np.nan)
+
+
+class _Frame:
+    """أعمدة إطار زمني (يومي أو شموع مجمعة) مع بداية الرمز لكل صف"""
+
+    def __init__(self, columns, starts):
+        self.columns = columns
+        self.starts = starts
+
+
+def daily_frame(data):
+    columns = {field: getattr(data, field) for field in PRICE_FIELDS}
+    return _Frame(columns, np.repeat(data.offsets[:-1], np.diff(data.offsets)))
+
+
+def period_frame(data, timeframe):
+    """
+    شموع الإطار الزمني (market_bars)، و to_daily: لكل صف يومي رقم آخر شمعة مكتملة قبله (-1 إذا لا يوجد)
+
+    الأسبوع يبدأ الاثنين مثل الفحص الأسبوعي (resample('W')).
+    """
+    bars = bar_store.get(data, timeframe, week_start='monday')
+    count = len(bars['first_row'])
+    starts = np.repeat(bars['offsets'][:-1], np.diff(bars['offsets']))
+    frame = _Frame({field: bars[field] for field in PRICE_FIELDS}, starts)
+
+    # الشموع متصلة في الصفوف: رقم شمعة كل صف يومي، والشمعة السابقة إذا كانت لنفس الرمز
+    bar_of_row = np.repeat(np.arange(count, dtype=np.int64), bars['last_row'] - bars['first_row'] + 1)
+    frame.to_daily = np.where(bar_of_row > starts[bar_of_row], bar_of_row - 1, -1)
+    return frame
+
+
+class SeriesCache:
+    """نتائج الدوال والإطارات الزمنية لكل (سوق، إصدار بيانات) - الأقدم استخداماً يحذف أولاً"""
+
+    def __init__(self, max_entries=MAX_CACHED_SERIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, compute):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+        value = compute()
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return value
+
+
+series_cache = SeriesCache()
+
+
+class Evaluator:
+    """تقييم شجرة الشرط على بيانات سوق واحد (كل عقدة تحسب مرة واحدة)"""
+
+    def __init__(self, data):
+        self.data = data
+        self.memo = {}
+
+    def _cached(self, key, compute):
+        return series_cache.get((self.data.market, self.data.version, self.data.source) + key, compute)
+
+    def frame(self, timeframe):
+        if timeframe == 'daily':
+            return self._cached(('frame', timeframe), lambda: daily_frame(self.data))
+        return self._cached(('frame', timeframe), lambda: period_frame(self.data, timeframe))
+
+    def evaluate(self, node):
+        """
+        قيمة الشرط لكل صف يومي
+
+        Returns:
+            np.ndarray bool بطول صفوف السوق
+        """
+        timeframe, values = self.value(node)
+        values = self.to_daily(timeframe, values)
+        return np.asarray(values, dtype=bool)
+
+    def value(self, node):
+        """(الإطار الزمني، القيم) - الإطار None للثوابت"""
+        if node not in self.memo:
+            self.memo[node] = self._value(node)
+        return self.memo[node]
+
+    def to_daily(self, timeframe, values):
+        """قيم إطار أسبوعي -> قيمة آخر أسبوع مكتمل لكل صف يومي"""
+        if timeframe in (None, 'daily'):
+            return values
+        to_daily = self.frame(timeframe).to_daily
+        if values.dtype == bool:
+            return np.where(to_daily >= 0, values[np.maximum(to_daily, 0)], False)
+        return np.where(to_daily >= 0, values[np.maximum(to_daily, 0)], np.nan)
+
+    def _align(self, operands):
+        """نفس الإطار الزمني لجميع القيم (الأسبوعي مع اليومي -> يومي)"""
+        timeframes = {timeframe for timeframe, _ in operands if timeframe is not None}
+        if len(timeframes) <= 1:
+            return (timeframes.pop() if timeframes else None), [values for _, values in operands]
+        return 'daily', [self.to_daily(timeframe, values) for timeframe, values in operands]
+
+    def _value(self, node):
+        kind = node[0]
+        if kind == 'const':
+            return None, node[1]
+        if kind == 'field':
+            _, timeframe, field = node
+            return timeframe, self.frame(timeframe).columns[field]
+        if kind == 'call':
+            timeframe, _ = self.value(node[2])
+            return timeframe, self._cached(('call', node), lambda: self._call(node))
+
+        if kind in ('binop', 'compare'):
+            timeframe, (left, right) = self._align([self.value(node[2]), self.value(node[3])])
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return timeframe, _NUMPY_OPS[node[1]](left, right)
+        if kind == 'not':
+            timeframe, values = self.value(node[1])
+            return timeframe, np.logical_not(values)
+        # and / or
+        timeframe, values = self._align([self.value(part) for part in node[1]])
+        reduce = np.logical_and if kind == 'and' else np.logical_or
+        result = values[0]
+        for part in values[1:]:
+            result = reduce(result, part)
+        return timeframe, result
+
+    def _call(self, node):
+        _, name, arg, window = node
+        timeframe, values = self.value(arg)
+        starts = self.frame(timeframe).starts
+        values = np.asarray(values, dtype=np.float64)
+        if name == 'sma':
+            return rolling_sum(values, starts, window) / window
+        if name == 'max':
+            return rolling_extreme(values, starts, window, largest=True)
+        if name == 'min':
+            return rolling_extreme(values, starts, window, largest=False)
+        if name == 'prev':
+            return shift(values, starts, window)
+        return np.abs(values)
+
+
+def evaluate_expression(data, node, rows=None):
+    """
+    تقييم شرط محلل على بيانات السوق
+
+    Args:
+        data: MarketData
+        node: ناتج compile_expression
+        rows: صفوف محددة (مثل آخر صف لكل رمز) أو None لجميع الصفوف
+
+    Returns:
+        np.ndarray bool
+    """
+    if len(data.date) == 0:
+        return np.zeros(0 if rows is None else len(rows), dtype=bool)
+    matches = Evaluator(data).evaluate(node)
+    if np.ndim(matches) == 0:
+        matches = np.full(len(data.date), bool(matches))
+    return matches if rows is None else matches[rows]
+
+
+def number_text(value):
+    """نص الثابت بدون فقد دقة (repr يعيد نفس float عند التحليل، والأعداد الصحيحة بدون .0)"""
+    if value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def expression_text(node):
+    """صياغة موحدة للشرط (مفتاح للتخزين ونص للعرض) - شرطان مختلفان لا يعطيان نفس النص"""
+    kind = node[0]
+    if kind == 'const':
+        return number_text(node[1])
+    if kind == 'field':
+        return node[2] if node[1] == 'daily' else f'{node[1]}.{node[2]}'
+    if kind == 'call':
+        return f'{node[1]}({expression_text(node[2])}, {node[3]})' if node[1] != 'abs' \
+            else f'abs({expression_text(node[2])})'
+    if kind == 'not':
+        return f'not ({expression_text(node[1])})'
+    if kind in ('and', 'or'):
+        return f' {kind} '.join(f'({expression_text(part)})' if part[0] in ('and', 'or') else expression_text(part)
+                                for part in node[1])
+    symbols = {'add': '+', 'sub': '-', 'mul': '*', 'div': '/',
+               'gt': '>', 'ge': '>=', 'lt': '<', 'le': '<=', 'eq': '==', 'ne': '!='}
+    text = f'{expression_text(node[2])} {symbols[node[1]]} {expression_text(node[3])}'
+    return text if kind == 'compare' else f'({text})'
+
+
+def self_check():
+    """
+    فحص سريع بدون بيانات السوق: python screener.py
+
+    ثابتان يختلفان في الرقم السابع يعطيان نصاً (مفتاح التخزين) ونتيجة مختلفين.
+    """
+    import pandas as pd
+    from market_store import build_market_data
+
+    closes = np.array([20.8544, 20.85449, 20.8545, 20.85451, 20.8546])
+    frame = pd.DataFrame({
+        'symbol': [f'S{i}' for i in range(len(closes))],
+        'date': pd.Timestamp('2024-01-02'),
+        'open': closes, 'high': closes, 'low': closes, 'close': closes, 'volume': 1000.0,
+    })
+    data = build_market_data('us', frame, 'self-check', 0)
+    first = compile_expression('close >= 20.854485')
+    second = compile_expression('close >= 20.854505')
+    assert expression_text(first) != expression_text(second), 'constants lose precision in expression_text'
+    assert compile_expression(expression_text(first)) == first, 'expression_text does not round-trip'
+    counts = [int(evaluate_expression(data, node).sum()) for node in (first, second)]
+    assert counts == [4, 2], f'unexpected match counts {counts}'
+    print(f"✅ screener self-check passed: {expression_text(first)} -> {counts[0]}, "
+          f"{expression_text(second)} -> {counts[1]}")
+
+
+if __name__ == "__main__":
+    self_check()
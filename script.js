@@ -119,9 +119,8 @@ document.addEventListener('DOMContentLoaded', function() {
     updateTime();
     setInterval(updateTime, 1000);
 
-    // تحديث بيانات السوق
-    updateMarketIndices();
-    setInterval(updateMarketIndices, 300000); // تحديث كل 5 دقائق
+    // تحديث بيانات السوق (بث مباشر مع الرجوع للتحديث كل 5 دقائق)
+    watchMarketSummary();
 });
 
 // ========================================
@@ -393,6 +392,10 @@ const modalDescription = document.querySelector('.modal-description');
 const API_URL = window.location.origin + '/api';
 let currentJobId = null;
 let pollInterval = null;
+let jobEventSource = null;
+
+// حالات انتهاء المهمة
+const JOB_FINISHED_STATUSES = ['completed', 'failed', 'error', 'interrupted'];
 
 // دالة للحصول على التوكن
 function getAuthToken() {
@@ -440,6 +443,7 @@ if (closeModalBtn) {
         if (pollInterval) {
             clearInterval(pollInterval);
         }
+        stopJobStream();
     });
 }
 
@@ -450,6 +454,7 @@ modal?.addEventListener('click', function(e) {
         if (pollInterval) {
             clearInterval(pollInterval);
         }
+        stopJobStream();
     }
 });
 
@@ -502,10 +507,11 @@ async function startDataFetch(market, btnElement) {
         const data = await response.json();
         currentJobId = data.job_id;
         
-        // بدء التحقق من التقدم
-        pollJobStatus(market, btnElement);
+        // بدء متابعة التقدم
+        watchJobStatus(market, btnElement);
         
-        showMessage(`بدأت عملية تحديث الأسهم ${marketName}`, 'info');
+        // started: بدأت فوراً، queued: في الطابور، attached: مرتبطة بمهمة قائمة
+        showMessage(data.status === 'started' ? `بدأت عملية تحديث الأسهم ${marketName}` : data.message, 'info');
         
     } catch (error) {
         console.error('خطأ في بدء التحديث:', error);
@@ -525,6 +531,81 @@ async function startDataFetch(market, btnElement) {
     }
 }
 
+/**
+ * متابعة حالة المهمة عبر البث (SSE)، مع الرجوع للتحقق الدوري عند عدم توفره
+ */
+function watchJobStatus(market, btnElement) {
+    stopJobStream();
+    
+    if (!window.EventSource) {
+        pollJobStatus(market, btnElement);
+        return;
+    }
+    
+    // EventSource لا يدعم headers، لذلك يرسل التوكن في الرابط
+    const source = new EventSource(`${API_URL}/status/${currentJobId}/stream?token=${encodeURIComponent(getAuthToken() || '')}`);
+    jobEventSource = source;
+    let state = {};
+    let finished = false;
+    
+    const applyEvent = (event, replace) => {
+        const data = JSON.parse(event.data);
+        state = replace ? data : { ...state, ...data };
+        updateProgress(state);
+        
+        if (JOB_FINISHED_STATUSES.includes(state.status)) {
+            finished = true;
+            stopJobStream();
+            finishJob(market, btnElement, state);
+        }
+    };
+    
+    // snapshot: الحالة الكاملة، status/progress: التغييرات فقط
+    source.addEventListener('snapshot', (event) => applyEvent(event, true));
+    source.addEventListener('status', (event) => applyEvent(event, false));
+    source.addEventListener('progress', (event) => applyEvent(event, false));
+    
+    source.onerror = () => {
+        if (finished) return;
+        // انقطع البث أو لم يدعمه الخادم: الرجوع للتحقق الدوري
+        console.warn('Job stream unavailable, falling back to polling');
+        stopJobStream();
+        pollJobStatus(market, btnElement);
+    };
+}
+
+/**
+ * إيقاف بث حالة المهمة
+ */
+function stopJobStream() {
+    if (jobEventSource) {
+        jobEventSource.close();
+        jobEventSource = null;
+    }
+}
+
+/**
+ * إنهاء متابعة المهمة وعرض النتيجة
+ */
+function finishJob(market, btnElement, data) {
+    // إيقاف دوران الأيقونة وإعادة تفعيل الزر
+    if (btnElement) {
+        btnElement.classList.remove('loading');
+        btnElement.disabled = false;
+    }
+    
+    if (data.status === 'completed') {
+        const marketName = market === 'saudi' ? 'السعودية' : 'الأمريكية';
+        showMessage(`✓ تم تحديث بيانات الأسهم ${marketName} بنجاح!`, 'success');
+        
+        // عرض الإحصائيات النهائية
+        const stats = data.stats || {};
+        console.log('Update completed:', stats);
+    } else {
+        showMessage(`✗ فشل التحديث. يرجى المحاولة مرة أخرى.`, 'error');
+    }
+}
+
 /**
  * التحقق المستمر من حالة المهمة
  */
@@ -566,26 +647,10 @@ function pollJobStatus(market, btnElement) {
             updateProgress(data);
             
             // إيقاف التحقق إذا اكتملت المهمة
-            if (data.status === 'completed' || data.status === 'failed' || data.status === 'error') {
+            if (JOB_FINISHED_STATUSES.includes(data.status)) {
                 clearInterval(pollInterval);
                 pollInterval = null;
-                
-                // إيقاف دوران الأيقونة وإعادة تفعيل الزر
-                if (btnElement) {
-                    btnElement.classList.remove('loading');
-                    btnElement.disabled = false;
-                }
-                
-                if (data.status === 'completed') {
-                    const marketName = market === 'saudi' ? 'السعودية' : 'الأمريكية';
-                    showMessage(`✓ تم تحديث بيانات الأسهم ${marketName} بنجاح!`, 'success');
-                    
-                    // عرض الإحصائيات النهائية
-                    const stats = data.stats || {};
-                    console.log('Update completed:', stats);
-                } else {
-                    showMessage(`✗ فشل التحديث. يرجى المحاولة مرة أخرى.`, 'error');
-                }
+                finishJob(market, btnElement, data);
             }
             
         } catch (error) {
@@ -712,34 +777,17 @@ setInterval(() => {
 // تحديث بيانات السوق (مباشر)
 // ========================================
 async function updateMarketIndices() {
-    const lastUpdateEl = document.getElementById('last-update-time');
-    
     try {
         console.log('Fetching market data...');
         const response = await fetch(`${API_URL}/market-summary`);
+        // 503: الخادم يجلب أول لقطة، ستصل عبر البث أو التحديث التالي
+        if (response.status === 503) return;
         if (!response.ok) throw new Error('Network response was not ok');
         
         const data = await response.json();
         console.log('Market data received:', data);
         
-        // تحديث البطاقات
-        for (const [key, value] of Object.entries(data)) {
-            updateMarketCard(key, value);
-        }
-        
-        // تحديث وقت آخر تحديث
-        const now = new Date();
-        if (lastUpdateEl) {
-            const options = { 
-                weekday: 'long', 
-                year: 'numeric', 
-                month: 'numeric', 
-                day: 'numeric',
-                hour: '2-digit',
-                minute: '2-digit'
-            };
-            lastUpdateEl.textContent = now.toLocaleDateString('ar-SA', options);
-        }
+        renderMarketSummary(data);
         
     } catch (error) {
         console.error('فشل تحديث بيانات السوق:', error);
@@ -759,6 +807,35 @@ async function updateMarketIndices() {
     }
 }
 
+/**
+ * عرض لقطة ملخص السوق في البطاقات
+ */
+function renderMarketSummary(data) {
+    const lastUpdateEl = document.getElementById('last-update-time');
+    
+    const meta = data._meta || {};
+    
+    // تحديث البطاقات (المفاتيح التي تبدأ بـ _ بيانات وصفية وليست بطاقات)
+    for (const [key, value] of Object.entries(data)) {
+        if (key.startsWith('_')) continue;
+        updateMarketCard(key, value);
+    }
+    
+    // تحديث وقت آخر تحديث (وقت جلب الخادم للبيانات وليس وقت وصولها)
+    const updatedAt = meta.fetched_at ? new Date(meta.fetched_at) : new Date();
+    if (lastUpdateEl) {
+        const options = { 
+            weekday: 'long', 
+            year: 'numeric', 
+            month: 'numeric', 
+            day: 'numeric',
+            hour: '2-digit',
+            minute: '2-digit'
+        };
+        lastUpdateEl.textContent = updatedAt.toLocaleDateString('ar-SA', options) + (meta.stale ? ' (بيانات قديمة)' : '');
+    }
+}
+
 function updateMarketCard(key, data) {
     const card = document.getElementById(`card-${key}`);
     if (!card) {
@@ -798,13 +875,33 @@ function updateMarketCard(key, data) {
     }, 300);
 }
 
-// تشغيل التحديث عند التحميل
-// ملاحظة: نستخدم setTimeout لضمان تحميل DOM بالكامل وعدم التعارض مع المستمعين الآخرين
-setTimeout(() => {
+/**
+ * متابعة ملخص السوق: لقطة فورية ثم بث التحديثات من الخادم (جلب واحد مشترك لجميع المستخدمين)
+ * إذا لم يتوفر البث (أو امتلأ) نرجع للتحديث كل 5 دقائق
+ */
+let marketSummarySource = null;
+let marketSummaryInterval = null;
+
+function watchMarketSummary() {
     updateMarketIndices();
-    // تحديث كل 5 دقائق
-    setInterval(updateMarketIndices, 300000);
-}, 2000);
+    
+    if (!window.EventSource) {
+        marketSummaryInterval = setInterval(updateMarketIndices, 300000);
+        return;
+    }
+    
+    marketSummarySource = new EventSource(`${API_URL}/market-summary/stream`);
+    marketSummarySource.addEventListener('snapshot', (event) => {
+        renderMarketSummary(JSON.parse(event.data));
+    });
+    marketSummarySource.onerror = () => {
+        // المتصفح يعيد الاتصال تلقائياً، إلا إذا رفض الخادم البث
+        if (marketSummarySource.readyState === EventSource.CLOSED && !marketSummaryInterval) {
+            marketSummarySource = null;
+            marketSummaryInterval = setInterval(updateMarketIndices, 300000);
+        }
+    };
+}
 
 
 // ========================================
@@ -1913,17 +2010,17 @@ async function loadWeeklyChart(market, symbol) {
         ctx.textAlign = 'center';
         ctx.fillText('جاري تحميل البيانات الأسبوعية...', canvas.width / 2, canvas.height / 2);
         
-        // جلب البيانات اليومية
-        const response = await fetch(`${API_URL}/history/${market}/${symbol}`);
-        const dailyData = await response.json();
+        // شموع أسبوعية مجمعة على الخادم (آخر 52 أسبوع - سنة كاملة للعرض)
+        const start = new Date();
+        start.setFullYear(start.getFullYear() - 1);
+        const params = new URLSearchParams({ resolution: 'weekly', start: start.toISOString().split('T')[0] });
+        const response = await fetch(`${API_URL}/history/${market}/${symbol}?${params}`);
+        const weeklyData = await response.json();
         
-        if (dailyData.error) throw new Error(dailyData.error);
-        
-        // تحويل لبيانات أسبوعية في الـ frontend
-        const weeklyData = convertToWeekly(dailyData);
+        if (weeklyData.error) throw new Error(weeklyData.error);
         
         // رسم الشارت
-        renderWeeklyChartData(symbol, weeklyData);
+        renderWeeklyChartData(symbol, weeklyData.slice(-52));
         
     } catch (error) {
         console.error('Error loading weekly chart:', error);
@@ -1931,38 +2028,6 @@ async function loadWeeklyChart(market, symbol) {
     }
 }
 
-function convertToWeekly(dailyData) {
-    // تحويل البيانات اليومية إلى أسبوعية
-    const weekly = {};
-    
-    dailyData.forEach(day => {
-        const date = new Date(day.Date);
-        // الحصول على بداية الأسبوع (الأحد)
-        const weekStart = new Date(date);
-        weekStart.setDate(date.getDate() - date.getDay());
-        const weekKey = weekStart.toISOString().split('T')[0];
-        
-        if (!weekly[weekKey]) {
-            weekly[weekKey] = {
-                Date: weekKey,
-                Open: day.Open,
-                High: day.High,
-                Low: day.Low,
-                Close: day.Close,
-                Volume: 0
-            };
-        } else {
-            weekly[weekKey].High = Math.max(weekly[weekKey].High, day.High);
-            weekly[weekKey].Low = Math.min(weekly[weekKey].Low, day.Low);
-            weekly[weekKey].Close = day.Close; // آخر إغلاق
-        }
-        
-        weekly[weekKey].Volume += day.Volume;
-    });
-    
-    return Object.values(weekly).slice(-52); // آخر 52 أسبوع (سنة كاملة للعرض)
-}
-
 function renderWeeklyChartData(symbol, data) {
     const canvas = document.getElementById('weekly-chart');
     if (!canvas) return;
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Summary Poller for MeshalStock
+جلب دوري واحد لملخص السوق (المؤشرات والسلع والعملات الرقمية) وتوزيعه على جميع المتابعين
+
+- طلب واحد إلى Yahoo كل interval ثانية مهما كان عدد المستخدمين
+- مسار الطلب يقرأ آخر لقطة من الذاكرة ولا ينتظر Yahoo أبداً (stale-while-revalidate)
+- عند فشل الجلب (خطأ، أو لقطة كل عناصرها أخطاء) تبقى آخر لقطة صالحة، مع عمرها وعلامة stale بعد stale_after ثانية
+- آخر لقطة تحفظ على القرص لتقدم فوراً بعد إعادة تشغيل الخادم
+- يتوقف الجلب عند عدم وجود متابعين أو طلبات لمدة idle_after ثانية
+"""
+
+import os
+import json
+import time
+import threading
+from datetime import datetime
+
+
+def has_valid_entries(snapshot):
+    """هل في اللقطة عنصر واحد على الأقل ليس خطأ ({'error': ...})"""
+    return any(not (isinstance(entry, dict) and 'error' in entry) for entry in snapshot.values())
+
+
+class SnapshotPoller:
+    """جلب دوري للقطة واحدة ونشرها عبر EventHub"""
+
+    def __init__(self, fetch, hub, topic, interval=120, idle_after=600, stale_after=900, persist_path=None):
+        """
+        Args:
+            fetch: دالة بدون وسائط تعيد اللقطة (dict) أو ترفع خطأ
+                   (لقطة بدون أي عنصر صالح تعامل كفشل - has_valid_entries)
+            hub: EventHub لنشر اللقطات
+            topic: اسم الموضوع في EventHub
+            interval: الثواني بين عمليات الجلب
+            idle_after: إيقاف الجلب بعد هذه المدة بدون متابعين أو طلبات
+            stale_after: عمر اللقطة (بالثواني) الذي تعتبر بعده قديمة
+            persist_path: ملف حفظ آخر لقطة (None لتعطيل الحفظ)
+        """
+        self.fetch = fetch
+        self.hub = hub
+        self.topic = topic
+        self.interval = interval
+        self.idle_after = idle_after
+        self.stale_after = stale_after
+        self.persist_path = persist_path
+
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+        self.snapshot = None
+        self.fetched_at = None
+        self.last_error = None
+        self.refreshing = False
+        self.last_access = time.time()
+
+        self._load()
+
+    def start(self):
+        """بدء thread الجلب (مرة واحدة)"""
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self._loop, name=f'poller-{self.topic}', daemon=True)
+            self.thread.start()
+
+    def touch(self):
+        """تسجيل طلب من مستخدم (يوقظ الجلب إذا كان متوقفاً لعدم النشاط)"""
+        idle = self._idle()
+        self.last_access = time.time()
+        if idle:
+            self.wake.set()
+
+    def latest(self):
+        """
+        آخر لقطة بدون انتظار
+
+        Returns:
+            (snapshot, meta) أو (None, meta) قبل أول جلب ناجح
+        """
+        self.start()
+        self.touch()
+        with self.lock:
+            return self.snapshot, self.meta()
+
+    def meta(self):
+        """عمر اللقطة وحالتها"""
+        age = time.time() - self.fetched_at if self.fetched_at else None
+        return {
+            'fetched_at': datetime.fromtimestamp(self.fetched_at).isoformat() if self.fetched_at else None,
+            'age_seconds': round(age, 1) if age is not None else None,
+            'stale': age is None or age > self.stale_after,
+            'refreshing': self.refreshing,
+            'last_error': self.last_error,
+        }
+
+    def _idle(self):
+        return (self.hub.subscriber_count(self.topic) == 0
+                and time.time() - self.last_access > self.idle_after)
+
+    def _loop(self):
+        while True:
+            if not self._idle():
+                self._poll()
+                self.wake.wait(self.interval)
+            else:
+                # لا يوجد متابعون: انتظار أول طلب
+                self.wake.wait()
+            self.wake.clear()
+
+    def _poll(self):
+        started = time.perf_counter()
+        self.refreshing = True
+        try:
+            snapshot = self.fetch()
+            if not snapshot or not has_valid_entries(snapshot):
+                raise ValueError('No valid entries in snapshot')
+        except Exception as e:
+            # نبقي آخر لقطة صالحة، ويظهر الخطأ في meta
+            self.last_error = str(e)
+            print(f"Snapshot poller ({self.topic}) failed: {e}")
+            return
+        finally:
+            self.refreshing = False
+        with self.lock:
+            self.snapshot = snapshot
+            self.fetched_at = time.time()
+            self.last_error = None
+            meta = self.meta()
+        self.hub.publish(self.topic, 'snapshot', {**snapshot, '_meta': meta})
+        self._save()
+        print(f"Snapshot poller ({self.topic}) refreshed in {time.perf_counter() - started:.2f}s")
+
+    def _load(self):
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            self.snapshot = state['snapshot']
+            self.fetched_at = state['fetched_at']
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠ Could not load {self.topic} snapshot: {e}")
+
+    def _save(self):
+        if not self.persist_path:
+            return
+        tmp_path = f"{self.persist_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'snapshot': self.snapshot, 'fetched_at': self.fetched_at}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.persist_path)
+        except OSError as e:
+            print(f"⚠ Could not persist {self.topic} snapshot: {e}")
@@ -190,6 +190,171 @@ def get_stock_data(symbol, market, start_date=None, end_date=None):
         return []
 
 
+def get_stock_data_batch(symbols, market, start_date=None, end_date=None, page_size=1000):
+    """
+    Get rows for several symbols in one (paginated) query
+    
+    Args:
+        symbols: List of stock symbols
+        market: 'saudi' or 'us'
+        start_date: Start date (YYYY-MM-DD) optional
+        end_date: End date (YYYY-MM-DD) optional
+        page_size: Rows per request (Supabase caps responses at 1000)
+    
+    Returns:
+        List of records ordered by symbol, date
+    """
+    try:
+        client = get_supabase_client()
+        if client is None or not symbols:
+            return []
+        
+        all_data = []
+        offset = 0
+        
+        while True:
+            query = client.table('stock_data')\
+                .select('symbol, date, open, high, low, close, volume')\
+                .eq('market', market)\
+                .in_('symbol', list(symbols))
+            if start_date:
+                query = query.gte('date', start_date)
+            if end_date:
+                query = query.lte('date', end_date)
+            result = query\
+                .order('symbol')\
+                .order('date')\
+                .range(offset, offset + page_size - 1)\
+                .execute()
+            
+            if not result.data:
+                break
+            
+            all_data.extend(result.data)
+            
+            if len(result.data) < page_size:
+                break
+            
+            offset += page_size
+        
+        return all_data
+        
+    except Exception as e:
+        print(f"Error getting batch data for {market}: {e}")
+        return []
+
+
+def get_market_data_since(market, start_date=None, page_size=1000):
+    """
+    Get all rows for a market (optionally from a start date), paginated
+    
+    Args:
+        market: 'saudi' or 'us'
+        start_date: Start date (YYYY-MM-DD) optional
+        page_size: Rows per request (Supabase caps responses at 1000)
+    
+    Returns:
+        List of records ordered by symbol, date
+    """
+    try:
+        client = get_supabase_client()
+        if client is None:
+            return []
+        
+        all_data = []
+        offset = 0
+        
+        while True:
+            query = client.table('stock_data')\
+                .select('symbol, date, open, high, low, close, volume')\
+                .eq('market', market)
+            if start_date:
+                query = query.gte('date', start_date)
+            result = query\
+                .order('symbol')\
+                .order('date')\
+                .range(offset, offset + page_size - 1)\
+                .execute()
+            
+            if not result.data:
+                break
+            
+            all_data.extend(result.data)
+            
+            if len(result.data) < page_size:
+                break
+            
+            offset += page_size
+        
+        return all_data
+        
+    except Exception as e:
+        print(f"Error getting market data for {market}: {e}")
+        return []
+
+
+def upsert_market_snapshots(market, snapshots, page_size=20):
+    """
+    Save daily market snapshots (one row per market and date)
+    
+    Args:
+        market: 'saudi' or 'us'
+        snapshots: Dict of date (YYYY-MM-DD) -> columns dict (symbol, close, prev_close, change_percent, volume)
+        page_size: Rows per request (each row holds a whole market day)
+    
+    Returns:
+        Number of rows saved
+    """
+    try:
+        client = get_supabase_client()
+        if client is None:
+            return 0
+        
+        rows = [{'market': market, 'date': date, 'data': columns} for date, columns in snapshots.items()]
+        saved = 0
+        for i in range(0, len(rows), page_size):
+            result = client.table('market_snapshots')\
+                .upsert(rows[i:i + page_size], on_conflict='market,date')\
+                .execute()
+            saved += len(result.data) if result.data else 0
+        return saved
+        
+    except Exception as e:
+        print(f"Error saving market snapshots for {market}: {e}")
+        return 0
+
+
+def get_market_snapshot(market, target_date):
+    """
+    Get the snapshot of the last trading date on or before target_date (one row)
+    
+    Args:
+        market: 'saudi' or 'us'
+        target_date: Date (YYYY-MM-DD)
+    
+    Returns:
+        Dict with keys date, data (columns) or None
+    """
+    try:
+        client = get_supabase_client()
+        if client is None:
+            return None
+        
+        result = client.table('market_snapshots')\
+            .select('date, data')\
+            .eq('market', market)\
+            .lte('date', target_date)\
+            .order('date', desc=True)\
+            .limit(1)\
+            .execute()
+        
+        return result.data[0] if result.data else None
+        
+    except Exception as e:
+        print(f"Error getting market snapshot for {market}: {e}")
+        return None
+
+
 def get_all_symbols(market):
     """
     Get all unique symbols for a market
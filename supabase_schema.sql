@@ -62,6 +62,30 @@ ORDER BY symbol, market, date DESC;
 -- Create index on the view for even faster queries
 CREATE INDEX IF NOT EXISTS idx_latest_stock ON stock_data(symbol, market, date DESC);
 
+-- Daily market snapshots: one row per market and trading date
+-- data = {"symbol": [...], "close": [...], "prev_close": [...], "change_percent": [...], "volume": [...]}
+CREATE TABLE IF NOT EXISTS market_snapshots (
+    id BIGSERIAL PRIMARY KEY,
+    market TEXT NOT NULL CHECK (market IN ('saudi', 'us')),
+    date DATE NOT NULL,
+    data JSONB NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    
+    UNIQUE(market, date)
+);
+
+CREATE INDEX IF NOT EXISTS idx_snapshot_market_date ON market_snapshots(market, date DESC);
+
+ALTER TABLE market_snapshots ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Allow public read access" ON market_snapshots
+    FOR SELECT
+    USING (true);
+
+CREATE POLICY "Allow service role full access" ON market_snapshots
+    FOR ALL
+    USING (auth.role() = 'service_role');
+
 -- Comments for documentation
 COMMENT ON TABLE stock_data IS 'Historical stock price data for Saudi and US markets';
 COMMENT ON COLUMN stock_data.symbol IS 'Stock ticker symbol (e.g., AAPL, 2222.SR)';
@@ -72,6 +96,7 @@ COMMENT ON COLUMN stock_data.high IS 'Highest price of the day';
 COMMENT ON COLUMN stock_data.low IS 'Lowest price of the day';
 COMMENT ON COLUMN stock_data.close IS 'Closing price';
 COMMENT ON COLUMN stock_data.volume IS 'Trading volume';
+COMMENT ON TABLE market_snapshots IS 'Precomputed daily market snapshot (columnar JSON) per market and trading date';
 
 -- Show table info
 SELECT 
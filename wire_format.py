@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Wire Format for MeshalStock
+صيغ الردود المضغوطة للبيانات الكبيرة (التاريخ والفحوصات وبيانات السوق)
+
+?format=json      الصيغة الحالية (قائمة كائنات - الافتراضي)
+?format=columnar  عمود لكل حقل: {"date": [...], "close": [...]} بدون تكرار المفاتيح
+?format=msgpack   نفس الصيغة العمودية بترميز MessagePack (يتطلب: pip install msgpack)
+?format=arrow     جدول Arrow IPC stream (يتطلب: pip install pyarrow)
+
+والضغط (gzip أو brotli) حسب Accept-Encoding لجميع ردود JSON الكبيرة.
+"""
+
+import io
+import gzip
+import json
+
+import numpy as np
+from flask import Response, jsonify, request
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+FORMATS = ('json', 'columnar', 'msgpack', 'arrow')
+
+# أقل حجم للرد قبل الضغط (الردود الصغيرة لا تستفيد)
+MIN_COMPRESS_BYTES = 1024
+COMPRESSIBLE_TYPES = {
+    'application/json',
+    'application/x-msgpack',
+    'application/vnd.apache.arrow.stream',
+    'text/event-stream',
+}
+
+
+def requested_format():
+    """
+    الصيغة المطلوبة في ?format=
+
+    Returns:
+        (format, error_response) - error_response ليس None إذا كانت الصيغة غير متاحة
+    """
+    fmt = request.args.get('format', 'json')
+    if fmt not in FORMATS:
+        return fmt, (jsonify({'error': f"format must be one of: {', '.join(FORMATS)}"}), 400)
+    if fmt == 'msgpack' and msgpack is None:
+        return fmt, (jsonify({'error': 'msgpack is not installed on the server'}), 406)
+    if fmt == 'arrow' and pa is None:
+        return fmt, (jsonify({'error': 'pyarrow is not installed on the server'}), 406)
+    return fmt, None
+
+
+def date_strings(values):
+    """مصفوفة تواريخ -> قائمة نصوص YYYY-MM-DD"""
+    return np.datetime_as_string(np.asarray(values).astype('datetime64[D]'), unit='D').tolist()
+
+
+def records_to_columns(records, keys=None):
+    """قائمة كائنات -> عمود لكل مفتاح"""
+    if keys is None:
+        keys = list(records[0].keys()) if records else []
+    return {key: [record.get(key) for record in records] for key in keys}
+
+
+def columnar_response(columns, fmt, meta=None):
+    """
+    رد عمودي بالصيغة المطلوبة
+
+    Args:
+        columns: dict اسم العمود -> قائمة (أو مصفوفة numpy) بنفس الطول
+        fmt: 'columnar' أو 'msgpack' أو 'arrow'
+        meta: حقول إضافية غير جدولية (مثل date و total)
+
+    Returns:
+        Flask Response
+    """
+    columns = {key: value.tolist() if isinstance(value, np.ndarray) else value
+               for key, value in columns.items()}
+    meta = meta or {}
+
+    if fmt == 'arrow':
+        table = pa.table(columns)
+        if meta:
+            table = table.replace_schema_metadata({'meta': json.dumps(meta, ensure_ascii=False, default=str)})
+        sink = io.BytesIO()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return Response(sink.getvalue(), mimetype='application/vnd.apache.arrow.stream')
+
+    return payload_response({**meta, 'columns': columns} if meta else columns, fmt)
+
+
+def payload_response(payload, fmt):
+    """رد بأي بنية (dict) بصيغة json/columnar أو msgpack"""
+    if fmt == 'msgpack':
+        return Response(msgpack.packb(payload, use_bin_type=True, default=str), mimetype='application/x-msgpack')
+    return jsonify(payload)
+
+
+def compress_response(response):
+    """
+    ضغط الرد حسب Accept-Encoding (يستخدم كـ after_request)
+
+    لا يضغط: الردود المتدفقة (SSE) والملفات الثابتة والردود الصغيرة أو غير الناجحة
+    """
+    if response.mimetype not in COMPRESSIBLE_TYPES:
+        return response
+    response.vary.add('Accept-Encoding')
+
+    if (response.status_code != 200 or response.is_streamed or response.direct_passthrough
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    data = response.get_data()
+    if len(data) < MIN_COMPRESS_BYTES:
+        return response
+
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        encoding, data = 'br', brotli.compress(data, quality=5)
+    elif accepted['gzip']:
+        encoding, data = 'gzip', gzip.compress(data, compresslevel=5)
+    else:
+        return response
+
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    return response
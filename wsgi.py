@@ -11,16 +11,22 @@ WSGI Entry Point for MeshalStock
 import sys
 from pathlib import Path
 
+from api_server import app, refresh_market, start_refresh_scheduler, summary_poller
+
 # Initialize data on first run (background)
 # Note: This is optional and only runs if data files are missing
 try:
     from initialize_data import initialize_data
     print("🔍 Checking for data files on startup...")
-    initialize_data(background=True)
+    initialize_data(background=True, on_market_done=refresh_market)
 except Exception as e:
     print(f"⚠️  Could not initialize data (this is OK if using Supabase): {e}")
 
-from api_server import app
+# Daily incremental refresh after each market close (one worker only)
+start_refresh_scheduler()
+
+# Market summary poller (one upstream request per interval for all viewers)
+summary_poller.start()
 
 if __name__ == "__main__":
     app.run()